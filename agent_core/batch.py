@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+from agent_core.model_router import is_rate_limited
+from agent_core.rate_limit import rate_limiter
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Batch runner over the compiled graphs: many runs, at most --concurrency at a time.
+The runs are asyncio tasks on one event loop (graph.ainvoke), each on a new LangGraph thread_id.
+Results are written as the runs complete, not in input order, one JSON line each: index, ok,
+answer or error, seconds, tokens, thread_id and, when a run paused (demo03 approval_signoff),
+interrupted. The summary at the end covers throughput and the time
+calls waited for the provider rate limits (agent_core/rate_limit.py).
+The command turns the rate limiter on (it is off by default, see rate_limit.py); the limits apply
+per provider across all runs of the process: OpenAI, Anthropic and local model calls through the
+pooled HTTP clients, Tavily searches and ITSM requests. Library callers of run_batch turn it on
+with rate_limiter.enabled = True. A run that still fails
+with a 429 - also when the router failed over from the rate limited provider and the last one
+failed for another reason - is retried after an exponential backoff, up to BATCH_RETRIES times. With a checkpointer
+(CHECKPOINT_DB) the retry resumes the run from its last step; without one it runs again.
+Input is a file of JSON lines, {"prompt": "...", "config": {...}}, or of plain text prompts, one per
+line ("-" reads stdin). --config is merged into every run's configurable. A line that is not valid
+JSON or has no "prompt" is not run; it is written as a failed result and counted in the summary.
+    python -m agent_core.batch demo03 --input fabrics.jsonl --concurrency 8 --output results.jsonl
+    python -m agent_core.batch demo02 --input trips.txt --config '{"model_name": "anthropic"}'
+BATCH_CONCURRENCY=8
+BATCH_RETRIES=3
+'''
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_RETRIES = int(os.environ.get("BATCH_RETRIES", "3"))
+
+
+def parse_item(line):
+    '''
+    {"prompt", "config"} from an input line: a JSON object or a plain text prompt; None for a blank line.
+    A line that cannot be read gives {"prompt": line, "error": ...}, which run_one reports as a failed run.
+    '''
+    line = line.strip()
+    if not line:
+        return None
+    if not line.startswith("{"):
+        return {"prompt": line, "config": {}}
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"prompt": line, "config": {}, "error": f"invalid JSON: {e}"}
+    if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+        return {"prompt": line, "config": {}, "error": 'no "prompt" string'}
+    if not isinstance(item.get("config") or {}, dict):
+        return {"prompt": line, "config": {}, "error": '"config" is not an object'}
+    return {"prompt": item["prompt"], "config": item.get("config") or {}}
+
+
+def _answer(message):
+    content = getattr(message, "content", "")
+    if isinstance(content, list):
+        # Anthropic content blocks
+        return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+    return content
+
+
+def _tokens(messages):
+    return sum((getattr(message, "usage_metadata", None) or {}).get("total_tokens", 0) for message in messages)
+
+
+async def run_one(graph, index, item, config=None, retries=BATCH_RETRIES):
+    '''One run of item on graph under a new thread_id; returns its result record instead of raising.'''
+    if item.get("error"):
+        logger.error(f"Input {index} skipped: {item['error']}")
+        return {"index": index, "thread_id": None, "prompt": item["prompt"], "ok": False,
+                "error": f"input: {item['error']}", "attempts": 0, "seconds": 0.0}
+    thread_id = str(uuid.uuid4())
+    configurable = {**((config or {}).get("configurable") or {}), **item["config"], "thread_id": thread_id}
+    run_config = {**(config or {}), "configurable": configurable}
+    checkpointer = getattr(getattr(graph, "bound", graph), "checkpointer", None)
+    inputs = {"messages": [HumanMessage(content=item["prompt"])]}
+    started = time.perf_counter()
+    record = {"index": index, "thread_id": thread_id, "prompt": item["prompt"]}
+    for attempt in range(retries + 1):
+        try:
+            result = await graph.ainvoke(inputs, run_config)
+        except Exception as e:
+            # The router fails over on a 429; its ModelCallError keeps the 429 among the providers' errors
+            if attempt < retries and is_rate_limited(e):
+                delay = 2 ** attempt + random.uniform(0, 1)
+                logger.warning(f"Run {index} rate limited; retrying in {delay:.1f}s (attempt {attempt + 1}/{retries}).")
+                await asyncio.sleep(delay)
+                # The checkpointer kept every finished step; None resumes the run instead of starting it again
+                if checkpointer is not None:
+                    inputs = None
+                continue
+            logger.error(f"Run {index} failed: {e!r}")
+            return {**record, "ok": False, "error": repr(e), "attempts": attempt + 1,
+                    "seconds": time.perf_counter() - started}
+        messages = result.get("messages", [])
+        return {**record, "ok": True, "answer": _answer(messages[-1]) if messages else "",
+                "interrupted": "__interrupt__" in result, "tokens": _tokens(messages), "attempts": attempt + 1,
+                "seconds": time.perf_counter() - started}
+
+
+async def run_batch(graph, items, concurrency=BATCH_CONCURRENCY, config=None, retries=BATCH_RETRIES):
+    '''
+    Runs items ({"prompt", "config"}) on graph, at most concurrency at a time, and yields each result
+    as its run completes. items may be a lazy iterator; it is read as workers free up.
+    '''
+    results = asyncio.Queue()
+    pending = iter(enumerate(items))
+    errors = []
+
+    async def worker():
+        try:
+            # One iterator shared by all workers: each takes the next item when its run is done
+            for index, item in pending:
+                try:
+                    result = await run_one(graph, index, item, config, retries)
+                except Exception as e:
+                    # run_one reports failed runs itself; anything else still ends as this item's record
+                    logger.exception(f"Run {index} failed outside the graph.")
+                    result = {"index": index, "ok": False, "error": repr(e), "attempts": 0, "seconds": 0.0}
+                await results.put(result)
+        except Exception as e:
+            # The items iterator raised: it is finished for every worker, so the batch stops here
+            errors.append(e)
+        finally:
+            results.put_nowait(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    finished = 0
+    try:
+        while finished < len(workers):
+            result = await results.get()
+            if result is None:
+                finished += 1
+                continue
+            yield result
+    finally:
+        # Workers still running when the consumer stopped early are cancelled; the others' errors are kept
+        for task in workers:
+            task.cancel()
+        for outcome in await asyncio.gather(*workers, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                errors.append(outcome)
+    if errors:
+        raise RuntimeError(f"Batch stopped after reading its input failed: {errors[0]!r}") from errors[0]
+
+
+def summarize(results, seconds, limits_before, limits_after):
+    '''Throughput, latency and rate limiter waits of a batch; limits_* are rate_limiter.stats() before and after.'''
+    durations = sorted(result["seconds"] for result in results)
+    ok = sum(result["ok"] for result in results)
+    tokens = sum(result.get("tokens", 0) for result in results)
+    limiter = {}
+    for provider, after in limits_after.items():
+        before = limits_before.get(provider, {})
+        calls = after["calls"] - before.get("calls", 0)
+        if calls:
+            limiter[provider] = {"calls": calls,
+                                 "waits": after["waits"] - before.get("waits", 0),
+                                 "wait_seconds": after["wait_seconds"] - before.get("wait_seconds", 0.0),
+                                 "throttled": after["throttled"] - before.get("throttled", 0),
+                                 "ratio": after["ratio"]}
+    return {
+        "runs": len(results), "ok": ok, "failed": len(results) - ok,
+        "interrupted": sum(result.get("interrupted", False) for result in results),
+        "seconds": seconds, "runs_per_second": len(results) / seconds if seconds else 0.0,
+        "tokens": tokens, "tokens_per_second": tokens / seconds if seconds else 0.0,
+        "p50_seconds": durations[len(durations) // 2] if durations else 0.0,
+        "p95_seconds": durations[min(len(durations) - 1, round(0.95 * len(durations)))] if durations else 0.0,
+        "limiter": limiter,
+    }
+
+
+def format_summary(summary):
+    lines = [f"{summary['runs']} runs in {summary['seconds']:.1f}s: {summary['ok']} ok, {summary['failed']} failed, "
+             f"{summary['interrupted']} paused for sign-off",
+             f"throughput {summary['runs_per_second']:.2f} runs/s, {summary['tokens_per_second']:.0f} tokens/s; "
+             f"run p50 {summary['p50_seconds']:.2f}s, p95 {summary['p95_seconds']:.2f}s"]
+    for provider, stats in sorted(summary["limiter"].items()):
+        lines.append(f"{provider:<10} {stats['calls']:>5} calls, {stats['waits']:>5} waited {stats['wait_seconds']:>7.1f}s "
+                     f"in total, {stats['throttled']:>3} answered 429, rate now {stats['ratio']:.0%}")
+    return "\n".join(lines)
+
+
+async def abatch(graph, items, output, concurrency=BATCH_CONCURRENCY, config=None, retries=BATCH_RETRIES):
+    '''Writes each result of run_batch to output as a JSON line as it completes; returns the summary.'''
+    before = rate_limiter.stats()
+    started = time.perf_counter()
+    results = []
+    async for result in run_batch(graph, items, concurrency, config, retries):
+        results.append(result)
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+    return summarize(results, time.perf_counter() - started, before, rate_limiter.stats())
+
+
+def main(argv=None):
+    from agent_core.host import DEMOS, get_graph
+
+    parser = argparse.ArgumentParser(description="Run many prompts through a graph with bounded concurrency")
+    parser.add_argument("graph", choices=sorted(DEMOS))
+    parser.add_argument("--input", default="-", help="JSON lines or plain text prompts, - for stdin")
+    parser.add_argument("--output", help="write the results here instead of stdout")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--retries", type=int, default=BATCH_RETRIES, help="retries of a run that fails with a 429")
+    parser.add_argument("--config", default="{}", help="JSON merged into every run's configurable")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args(argv)
+
+    # Rate limits apply to this process only; the server's interactive requests never wait for them
+    rate_limiter.enabled = True
+    graph = get_graph(args.graph)
+    source = sys.stdin if args.input == "-" else open(args.input)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        items = (item for item in map(parse_item, source) if item is not None)
+        summary = asyncio.run(abatch(graph, items, output, args.concurrency,
+                                     {"configurable": json.loads(args.config)}, args.retries))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(format_summary(summary), file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id,
+                                       get_checkpoint_metadata)
+
+from agent_core.metrics import BYTES_BUCKETS, registry
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Local, file-backed LangGraph checkpointer that stores AgentState as per-step deltas.
+A checkpointer saves every channel a step changed. The messages channel changes on every step and
+holds the whole history, so a saver that writes it in full (InMemorySaver, the SQLite and Postgres
+savers) writes the history again after every step: storage grows with the square of the run length.
+DeltaSqliteSaver keeps the last list it wrote per (thread, namespace, channel). When a step only
+appends to that list, or replaces its last items (the scheduler rewrites the ITSMAudit message),
+the row holds the number of items kept from the previous version and the new items. Items are
+compared by identity, which is cheap: the reducers copy the list but keep the message objects.
+Every CHECKPOINT_SNAPSHOT_EVERY deltas, and whenever the previous list is not in memory (first write
+after a restart), the full value is written, so reading a checkpoint replays at most that many rows.
+Storage is one SQLite file in WAL mode, so a run survives a crash of the process and resumes from
+the last completed step without calling the model again. The graphs are compiled with it when
+CHECKPOINT_DB is set; the LangGraph server brings its own checkpointer.
+CHECKPOINT_DB=/path/checkpoints.sqlite3
+CHECKPOINT_SNAPSHOT_EVERY=25
+CHECKPOINT_CACHE_CHANNELS=1024
+'''
+
+CHECKPOINT_DB = os.environ.get("CHECKPOINT_DB")
+CHECKPOINT_SNAPSHOT_EVERY = int(os.environ.get("CHECKPOINT_SNAPSHOT_EVERY", "25"))
+CHECKPOINT_CACHE_CHANNELS = int(os.environ.get("CHECKPOINT_CACHE_CHANNELS", "1024"))
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    " thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_checkpoint_id TEXT,"
+    " type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))",
+    # kind is full, delta or empty; a delta keeps `keep` items of base_version and appends the items in data
+    "CREATE TABLE IF NOT EXISTS blobs ("
+    " thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT, kind TEXT,"
+    " base_version TEXT, keep INTEGER, depth INTEGER, type TEXT, data BLOB,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, channel, version))",
+    "CREATE TABLE IF NOT EXISTS writes ("
+    " thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,"
+    " channel TEXT, type TEXT, value BLOB, task_path TEXT,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))",
+)
+
+
+def _config(thread_id, checkpoint_ns, checkpoint_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+def _kept(base, value):
+    '''Number of leading items value shares with base, compared by identity.'''
+    kept = 0
+    for old, new in zip(base, value):
+        if old is not new:
+            break
+        kept += 1
+    return kept
+
+
+class DeltaSqliteSaver(BaseCheckpointSaver[str]):
+    def __init__(self, path=CHECKPOINT_DB, snapshot_every=CHECKPOINT_SNAPSHOT_EVERY, cache_channels=CHECKPOINT_CACHE_CHANNELS,
+                 serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        # 0 writes every list in full, like the stock savers (the benchmark's baseline)
+        self.snapshot_every = snapshot_every
+        self.cache_channels = cache_channels
+        self.stats = {"checkpoints": 0, "full": 0, "delta": 0, "checkpoint_bytes": 0, "blob_bytes": 0,
+                      "write_bytes": 0, "put_seconds": 0.0}
+        # (thread_id, checkpoint_ns, channel) -> (version, list, depth) of the last list written or read
+        self._latest = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL: a committed step survives a crash of the process, fsync only at checkpoints
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def size(self):
+        '''Bytes of the database file, after moving the write-ahead log into it.'''
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return os.path.getsize(self.path)
+
+    # Blobs
+
+    def _remember(self, key, version, value, depth):
+        self._latest[key] = (version, list(value), depth)
+        self._latest.move_to_end(key)
+        while len(self._latest) > self.cache_channels:
+            self._latest.popitem(last=False)
+
+    def _blob_row(self, thread_id, checkpoint_ns, channel, version, values):
+        '''(kind, base_version, keep, depth, type, data) of one channel version, remembering lists for the next delta.'''
+        if channel not in values:
+            return "empty", None, None, 0, "empty", b""
+        value = values[channel]
+        key = (thread_id, checkpoint_ns, channel)
+        if not isinstance(value, list):
+            self._latest.pop(key, None)
+            return ("full", None, None, 0, *self.serde.dumps_typed(value))
+
+        latest = self._latest.get(key)
+        if latest is not None and self.snapshot_every and latest[2] < self.snapshot_every:
+            base_version, base, depth = latest
+            kept = _kept(base, value)
+            if kept:
+                self._remember(key, version, value, depth + 1)
+                return ("delta", base_version, kept, depth + 1, *self.serde.dumps_typed(value[kept:]))
+        self._remember(key, version, value, 0)
+        return ("full", None, None, 0, *self.serde.dumps_typed(value))
+
+    def _load_blob(self, thread_id, checkpoint_ns, channel, version):
+        '''(found, value, depth) of one channel version, replaying deltas onto the nearest full row.'''
+        chain = []
+        while True:
+            row = self._db.execute(
+                "SELECT kind, base_version, keep, depth, type, data FROM blobs"
+                " WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, version),
+            ).fetchone()
+            if row is None:
+                if chain:
+                    logger.error(f"Checkpoint delta chain of {channel} in thread {thread_id} is missing version {version}.")
+                return False, None, 0
+            kind, base_version, keep, depth, type_, data = row
+            if kind != "delta":
+                break
+            chain.append((keep, depth, type_, data))
+            version = base_version
+        if kind == "empty":
+            return False, None, 0
+        value = self.serde.loads_typed((type_, data))
+        for keep, depth, type_, data in reversed(chain):
+            value = value[:keep] + self.serde.loads_typed((type_, data))
+        return True, value, depth
+
+    def _load_blobs(self, thread_id, checkpoint_ns, versions):
+        values = {}
+        for channel, version in versions.items():
+            found, value, depth = self._load_blob(thread_id, checkpoint_ns, channel, version)
+            if found:
+                values[channel] = value
+                if isinstance(value, list):
+                    # A resumed run writes its next step as a delta of the list it was restored from
+                    self._remember((thread_id, checkpoint_ns, channel), version, value, depth)
+        return values
+
+    # Checkpoints
+
+    def _tuple(self, row):
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint))
+        writes = self._db.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={**checkpoint,
+                        "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"])},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=_config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((type_, value)))
+                            for task_id, channel, type_, value in writes],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type,"
+                 " metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        with self._lock:
+            row = self._db.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", params).fetchone()
+            return None if row is None else self._tuple(row)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type,"
+                 " metadata FROM checkpoints")
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY checkpoint_id DESC", params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            # Metadata filters are matched after decoding, as InMemorySaver does
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                yield self._tuple(row)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        started = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        type_, data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            rows = [(thread_id, checkpoint_ns, channel, version,
+                     *self._blob_row(thread_id, checkpoint_ns, channel, version, values))
+                    for channel, version in new_versions.items()]
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     type_, data, metadata_type, metadata_data),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                # The remembered lists may now point at versions that were never written
+                for row in rows:
+                    self._latest.pop((thread_id, checkpoint_ns, row[2]), None)
+                raise
+            for row in rows:
+                if row[4] in ("full", "delta"):
+                    self.stats[row[4]] += 1
+                    BLOB_BYTES.inc(len(row[9]), kind=row[4])
+            blob_bytes = sum(len(row[9]) for row in rows)
+            self.stats["checkpoints"] += 1
+            self.stats["checkpoint_bytes"] += len(data) + len(metadata_data)
+            self.stats["blob_bytes"] += blob_bytes
+            elapsed = time.perf_counter() - started
+            self.stats["put_seconds"] += elapsed
+        PUT_SECONDS.observe(elapsed)
+        PUT_BYTES.observe(len(data) + len(metadata_data) + blob_bytes)
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            # Special channels (errors, interrupts) have fixed negative indexes and are replaced, task writes are kept
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append((idx >= 0, (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel,
+                                    *self.serde.dumps_typed(value), task_path)))
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [row for keep, row in rows if keep])
+                self._db.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [row for keep, row in rows if not keep])
+                self._db.execute("COMMIT")
+            except BaseException:
+                # Left open, the transaction would fail every later BEGIN on the shared connection
+                self._db.execute("ROLLBACK")
+                raise
+            self.stats["write_bytes"] += sum(len(row[7]) for _, row in rows)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for table in ("checkpoints", "blobs", "writes"):
+                    self._db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            for key in [key for key in self._latest if key[0] == thread_id]:
+                del self._latest[key]
+
+    # Async - SQLite calls are short and local, they run on a worker thread to keep the event loop free
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current, channel):
+        # Same scheme as InMemorySaver: a counter with a random suffix, so versions of forked runs never collide
+        current = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current + 1:032}.{random.random():016}"
+
+
+PUT_SECONDS = registry.histogram("agent_checkpoint_put_seconds", "Time to write one checkpoint")
+PUT_BYTES = registry.histogram("agent_checkpoint_put_bytes", "Bytes written per checkpoint", (), BYTES_BUCKETS)
+BLOB_BYTES = registry.counter("agent_checkpoint_blob_bytes_total", "Channel bytes written, as full values or deltas",
+                              ("kind",))
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def local_checkpointer():
+    '''The process-wide saver for CHECKPOINT_DB, or None when it is not set (no checkpointer, as before).'''
+    global _local
+    if not CHECKPOINT_DB:
+        return None
+    with _local_lock:
+        if _local is None:
+            _local = DeltaSqliteSaver(CHECKPOINT_DB)
+            logger.info(f"Checkpoints stored as deltas in {CHECKPOINT_DB}.")
+        return _local
+
+
+if __name__ == "__main__":
+    # Round trip through a throwaway file: deltas, a replaced last message, snapshots and a reopened file
+    # python -m agent_core.checkpoint
+    import tempfile
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langgraph.graph import END, START, MessagesState, StateGraph
+
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite3")
+    saver = DeltaSqliteSaver(path, snapshot_every=4)
+
+    def reply(state):
+        last = state["messages"][-1]
+        if last.content == "fix":
+            # Same id as the previous answer: add_messages replaces it, the delta keeps everything before it
+            return {"messages": [AIMessage(content="fixed", id=state["messages"][-2].id)]}
+        return {"messages": [AIMessage(content=f"echo {last.content}")]}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("reply", reply)
+    workflow.add_edge(START, "reply")
+    workflow.add_edge("reply", END)
+    graph = workflow.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": "check"}}
+    for n in range(10):
+        graph.invoke({"messages": [HumanMessage(content=str(n))]}, config)
+    graph.invoke({"messages": [HumanMessage(content="fix")]}, config)
+    expected = [message.content for message in graph.get_state(config).values["messages"]]
+    assert len(expected) == 21 and expected[-2:] == ["fixed", "fix"], expected
+    kinds = dict(saver._db.execute("SELECT kind, COUNT(*) FROM blobs WHERE channel = 'messages' GROUP BY kind").fetchall())
+    assert kinds["delta"] > kinds["full"] > 1, kinds
+    assert len(list(saver.list(config))) == saver.stats["checkpoints"]
+
+    reopened = DeltaSqliteSaver(path)
+    state = workflow.compile(checkpointer=reopened).get_state(config)
+    assert [message.content for message in state.values["messages"]] == expected
+    assert len(list(reopened.list(config, limit=3))) == 3
+    history = [len(snapshot.values.get("messages", [])) for snapshot in graph.get_state_history(config)]
+    assert history[0] == 21 and history[-1] == 0, history
+    reopened.delete_thread("check")
+    assert reopened.get_tuple(config) is None
+    print(f"checkpoint checks passed: {saver.stats}, {saver.size()} bytes on disk")
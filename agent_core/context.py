@@ -0,0 +1,202 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent_core.wire import decode, estimate_tokens
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Token budgeted context for call_model.
+The graph state keeps the full message history; only the prompt sent to the model is reduced.
+1. Tool results of completed turns (before the latest user message) are always replaced by a short
+   digest: the model has answered them, and resending them in full on every later call makes the
+   tokens per turn grow with the length of the conversation.
+2. Over budget, tool results of the current turn that the model has already responded to are
+   digested too, oldest first.
+3. Still over budget, the oldest complete turns are dropped and listed in a short note that is
+   appended to the system prompt.
+Tool results that a later result points at with a {"$ref": ...} are never digested.
+The budgets are the providers' context windows less room for the response, a hard cap rather than
+a target. A failover can send a turn to a provider with a smaller window, so callers fit the prompt
+again for that provider (token_budget(configurable, provider)).
+'''
+
+# Prompt budget in tokens per provider (system prompt included): the context window of the pool's
+# model (model_pool.MODELS) less room for the response
+TOKEN_BUDGETS = {
+    "openai": 1_000_000,  # gpt-4.1, 1,047,576 token window
+    "anthropic": 180_000,  # Claude 3.7 Sonnet, 200k window
+    "local": 120_000,  # Llama 3.1 8B, 128k window
+}
+DEFAULT_TOKEN_BUDGET = 120_000
+COUNT_CACHE_SIZE = 4096
+
+# Per message overhead of the chat formats (role, separators)
+MESSAGE_OVERHEAD = 4
+DIGEST_PREVIEW_CHARS = 160
+
+_REFERENCE = re.compile(r'"\$ref":\s*"[^":]*:([^/"]+)/')
+
+
+def token_budget(configurable, provider=None):
+    '''context_token_budget from the graph config, else the budget of provider (default: the configured model).'''
+    budget = configurable.get("context_token_budget")
+    if budget:
+        return int(budget)
+    return TOKEN_BUDGETS.get(provider or configurable.get("model_name", "openai"), DEFAULT_TOKEN_BUDGET)
+
+
+# Token counts by a digest of the text, so the cache does not keep every message's content alive
+_counts = OrderedDict()
+_counts_lock = threading.Lock()
+
+
+def _count(text):
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    with _counts_lock:
+        if key in _counts:
+            _counts.move_to_end(key)
+            return _counts[key]
+    count = estimate_tokens(text)
+    with _counts_lock:
+        _counts[key] = count
+        if len(_counts) > COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return count
+
+
+def message_tokens(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    return _count(content) + (_count(json.dumps(tool_calls)) if tool_calls else 0) + MESSAGE_OVERHEAD
+
+
+def _preview(value):
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), default=str)
+    text = " ".join(text.split())
+    return text if len(text) <= DIGEST_PREVIEW_CHARS else text[:DIGEST_PREVIEW_CHARS] + "..."
+
+
+def _summarize(payload):
+    if isinstance(payload, list):
+        records = [r for r in payload if isinstance(r, dict)]
+        first = [_preview(r.get("url") or r.get("hostname") or next(iter(r.values()), "")) for r in records[:3]]
+        return f"{len(payload)} records" + (f", e.g. {'; '.join(first)}" if first else "")
+    if isinstance(payload, dict):
+        parts = []
+        for key, value in payload.items():
+            if isinstance(value, (list, dict)):
+                parts.append(f"{key}: {len(value)} {'records' if isinstance(value, list) else 'entries'}")
+            else:
+                parts.append(f"{key}: {_preview(value)}")
+        return "; ".join(parts)
+    return _preview(payload)
+
+
+def digest(message):
+    '''Copy of a tool message with its content replaced by a short summary.'''
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    try:
+        summary = _summarize(decode(content))
+    except (TypeError, ValueError):
+        summary = _preview(content)
+    text = f"[Digest of an earlier {message.name or 'tool'} result, already used: {summary}]"
+    return message.model_copy(update={"content": text})
+
+
+def _turn_starts(messages):
+    return [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+
+
+def build_context(messages, budget, reserved_tokens=0):
+    '''
+    Reduce messages to fit budget - reserved_tokens (the system prompt).
+    Returns (prompt_messages, note, usage); note lists dropped turns and is empty when none were dropped.
+    '''
+    messages = list(messages)
+    tokens = [message_tokens(m) for m in messages]
+    history_tokens = reserved_tokens + sum(tokens)
+    starts = _turn_starts(messages)
+    current = starts[-1] if starts else 0
+    limit = budget - reserved_tokens
+
+    # Results the current turn still points at must stay readable
+    referenced = {
+        call_id
+        for m in messages[current:] if isinstance(m, ToolMessage) and isinstance(m.content, str)
+        for call_id in _REFERENCE.findall(m.content)
+    }
+
+    def digestible(i):
+        m = messages[i]
+        return isinstance(m, ToolMessage) and m.tool_call_id not in referenced
+
+    digested = 0
+
+    def shrink(i):
+        nonlocal digested
+        messages[i] = digest(messages[i])
+        tokens[i] = message_tokens(messages[i])
+        digested += 1
+
+    # 1. Tool results of completed turns, whatever the budget
+    for i in range(current):
+        if digestible(i):
+            shrink(i)
+
+    # 2. Tool results of the current turn the model has already answered, oldest first
+    answered = [i for i in range(current, len(messages))
+                if digestible(i) and any(isinstance(m, AIMessage) for m in messages[i + 1:])]
+    for i in answered:
+        if sum(tokens) <= limit:
+            break
+        shrink(i)
+
+    # 3. Whole turns, oldest first - the current turn is always kept
+    dropped = []
+    boundaries = sorted({0, *starts})
+    first = 0
+    for start, end in zip(boundaries, boundaries[1:]):
+        if sum(tokens[first:]) <= limit:
+            break
+        dropped.append(messages[start].content if isinstance(messages[start].content, str) else "")
+        first = end
+
+    prompt = messages[first:]
+    note = ""
+    if dropped:
+        asked = "; ".join(f'"{_preview(text)}"' for text in dropped)
+        note = f"Earlier in this conversation ({len(dropped)} turns omitted to save context) the user asked: {asked}"
+
+    prompt_tokens = reserved_tokens + sum(tokens[first:]) + (_count(note) if note else 0)
+    if prompt_tokens > budget:
+        logger.warning(f"Current turn alone needs {prompt_tokens} tokens, over the {budget} token budget.")
+    usage = {
+        "history_tokens": history_tokens,
+        "prompt_tokens": prompt_tokens,
+        "saved_tokens": history_tokens - prompt_tokens,
+        "digested": digested,
+        "trimmed_turns": len(dropped),
+        "budget": budget,
+    }
+    return prompt, note, usage
+
+
+def add_context_usage(existing, new):
+    '''Reducer for the per thread token accounting of call_model prompts.'''
+    if new is None:
+        return existing
+    totals = dict(existing or {})
+    totals["calls"] = totals.get("calls", 0) + 1
+    for key in ("history_tokens", "prompt_tokens", "saved_tokens",
+                "input_tokens", "cache_read_tokens", "cache_creation_tokens"):
+        totals[key] = totals.get(key, 0) + new.get(key, 0)
+    totals["last"] = new
+    return totals
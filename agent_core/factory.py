@@ -0,0 +1,181 @@
+import threading
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph
+from langgraph.prebuilt import ToolNode
+
+from agent_core.logs import log_event
+from agent_core.metrics import start_exporters
+from agent_core.model_pool import graph_scope
+from agent_core.model_router import model_router
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Graph factory shared by the demo graphs.
+Both demos run the same agent loop around different tools. A model node asks for a tool and
+should_continue routes to that tool's node, which reports back to the model (or to the next step
+of the workflow). Everything a graph brings is its tool registry, its prompt and what it does
+with the model's answer:
+- ToolRegistry: the tools of a graph, the node each one runs in and the node that comes next (and,
+  optionally, a node the model's call passes through first).
+- make_should_continue / make_call_model: the routing and the model node of a graph. Model calls go
+  through model_router to the process-wide model pool (model_pool.py), counted toward the graph.
+- agent_workflow: the StateGraph with the agent node, the tool nodes and their edges; the demos add
+  their own nodes (run cache, trip parsing, scheduling, shard planning) on top.
+- graph_factory: every graph of the process by name, compiled once on first use; the metrics
+  exporters start with the first graph and serve all of them.
+'''
+
+
+class ToolRegistry:
+    '''Tool name -> (node, tool, next node) of one graph.'''
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, node, tool, then="agent", via=None):
+        '''
+        Runs tool in its own ToolNode named node, followed by then (None: the graph adds that edge).
+        With via, the model's calls of tool are routed to that node first, e.g. a sign-off gate the graph adds.
+        '''
+        self._entries[tool.name] = (node, tool, then, via)
+        return tool
+
+    @property
+    def tools(self):
+        return [tool for _, tool, _, _ in self._entries.values()]
+
+    def routes(self):
+        '''should_continue result -> node, for add_conditional_edges.'''
+        return {name: via or node for name, (node, _, _, via) in self._entries.items()}
+
+    def items(self):
+        return self._entries.items()
+
+    def __contains__(self, name):
+        return name in self._entries
+
+
+def _tool_name(tool_call):
+    # If it's a dict, extract the name safely
+    return tool_call.get("name") if isinstance(tool_call, dict) else tool_call.name
+
+
+def make_should_continue(graph, registry, parallel_node=None):
+    '''Routes on the last message: "end" without tool calls, else the called tool (parallel_node for several).'''
+
+    def should_continue(state):
+        last_message = state["messages"][-1]
+        if not last_message.tool_calls:
+            log_event(logger, "route", level=logging.DEBUG, graph=graph, next="end")
+            return "end"
+
+        # Several tool calls in one message all go to the combined ToolNode, which runs them concurrently
+        if parallel_node is not None and len(last_message.tool_calls) > 1:
+            log_event(logger, "route", level=logging.DEBUG, graph=graph, next=parallel_node,
+                      tools=lambda: [_tool_name(tool_call) for tool_call in last_message.tool_calls])
+            return parallel_node
+
+        tool_name = _tool_name(last_message.tool_calls[0])
+        log_event(logger, "route", level=logging.DEBUG, graph=graph, next=tool_name)
+        if tool_name in registry:
+            return tool_name
+        logger.warning(f"Unexpected tool call in {graph}: {tool_name}. Ending execution.")
+        return "end"
+
+    return should_continue
+
+
+def make_call_model(graph, prepare, update, get_model, router=model_router):
+    '''
+    call_model and acall_model of a graph.
+    prepare(state, config) returns (model_name, router options, messages_for, usage); the model call
+    goes to get_model(provider) through router, and update(response, usage) makes the state update.
+    '''
+
+    # Define the function that calls the model
+    def call_model(state, config):
+        model_name, options, messages_for, usage = prepare(state, config)
+        try:
+            # Selected model first, failing over (and optionally hedging) to the other providers
+            with graph_scope(graph):
+                response = router.invoke(model_name, get_model, messages_for, **options)
+            return update(response, usage)
+        except Exception as e:
+            logger.error(f"Error in call_model of {graph}: {str(e)}")
+            raise
+
+    # Async call_model - used when the graph runs on an event loop (ainvoke/astream, the LangGraph server)
+    async def acall_model(state, config):
+        model_name, options, messages_for, usage = prepare(state, config)
+        try:
+            with graph_scope(graph):
+                response = await router.ainvoke(model_name, get_model, messages_for, **options)
+            return update(response, usage)
+        except Exception as e:
+            logger.error(f"Error in acall_model of {graph}: {str(e)}")
+            raise
+
+    return call_model, acall_model
+
+
+def agent_workflow(state_schema, config_schema, registry, call_model, acall_model, should_continue, end_node,
+                   parallel_node=None):
+    '''
+    The agent loop of a graph: the agent node, one ToolNode per registered tool (plus parallel_node with
+    all of them) and the conditional edges from agent; "end" goes to end_node.
+    '''
+    # Define a new graph
+    workflow = StateGraph(state_schema, config_schema=config_schema)
+
+    # Define the agent node - invoke/stream run call_model, ainvoke/astream await acall_model on the event loop
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model, name="call_model"))
+
+    # Define individual nodes for each tool - the tools carry coroutines, so async runs await them on the event loop
+    routes = registry.routes()
+    for node, tool, then, _ in (entry for _, entry in registry.items()):
+        workflow.add_node(node, ToolNode([tool]))
+        if then is not None:
+            workflow.add_edge(node, then)
+    if parallel_node is not None:
+        # Combined node for messages with several tool calls - ToolNode runs them concurrently
+        workflow.add_node(parallel_node, ToolNode(registry.tools))
+        workflow.add_edge(parallel_node, "agent")
+        routes[parallel_node] = parallel_node
+
+    # After the agent node, should_continue picks the node of the called tool; otherwise the run ends at end_node
+    workflow.add_conditional_edges("agent", should_continue, {**routes, "end": end_node})
+    logger.info(f"Agent loop with tools {list(routes)}, ending at {end_node}.")
+    return workflow
+
+
+class GraphFactory:
+    '''The graphs of the process by name, each built by its registered build() on first use.'''
+
+    def __init__(self):
+        self._builders = {}
+        self._graphs = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, build):
+        self._builders[name] = build
+
+    def get(self, name):
+        '''The compiled graph name, built on first use.'''
+        graph = self._graphs.get(name)
+        if graph is None:
+            with self._lock:
+                graph = self._graphs.get(name)
+                if graph is None:
+                    graph = self._graphs[name] = self._builders[name]()
+                    start_exporters()
+        return graph
+
+    def names(self):
+        return list(self._builders)
+
+
+graph_factory = GraphFactory()
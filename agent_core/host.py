@@ -0,0 +1,112 @@
+import importlib
+import os
+import sys
+import threading
+
+from agent_core.factory import graph_factory
+from agent_core.model_pool import model_pool
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Serves demo02 and demo03 from one process.
+Both demos ship their graph as a package named my_agent, so they cannot be imported side by side.
+The host imports each demo in turn with its own directory first on sys.path, builds its graph and
+then moves its modules in sys.modules from my_agent.* to <demo>_agent.*. That frees the my_agent
+name for the next demo. The modules keep working under the new names, because they reference each
+other through the objects they imported, not by name.
+What the graphs share in one process:
+- agent_core: graph_factory, the model pool (one chat model and HTTP connection pool per provider),
+  model_router health and the metrics registry, with one /metrics endpoint for both graphs.
+The root langgraph.json serves both graphs from this module:
+    langgraph dev   (from the repository root)
+Dev entry points that import my_agent modules at run time (benchmarks, the ITSM simulator) run per
+demo, from the demo's folder, as before.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMOS = {"demo02": os.path.join(ROOT, "demo02"), "demo03": os.path.join(ROOT, "demo03")}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _my_agent_modules():
+    return [name for name in sys.modules if name == "my_agent" or name.startswith("my_agent.")]
+
+
+def load_demo(name):
+    '''Imports demo name under <name>_agent and builds its graph; returns its agent module.'''
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+        path = DEMOS[name]
+        # A my_agent imported before (a single demo run in this process) is set aside and restored afterwards
+        saved = {module: sys.modules.pop(module) for module in _my_agent_modules()}
+        sys.path.insert(0, path)
+        try:
+            agent = importlib.import_module("my_agent.agent")
+            # Built while the demo's modules still carry their own names
+            graph_factory.get(name)
+        finally:
+            sys.path.remove(path)
+            for module in _my_agent_modules():
+                sys.modules[f"{name}_agent{module[len('my_agent'):]}"] = sys.modules.pop(module)
+            sys.modules.update(saved)
+        _loaded[name] = agent
+        logger.info(f"Loaded {name} from {path} as {name}_agent.")
+        return agent
+
+
+def get_graph(name):
+    '''The compiled graph of demo name.'''
+    load_demo(name)
+    return graph_factory.get(name)
+
+
+def __getattr__(name):
+    # langgraph.json loads this file once per graph, under a generated module name. The demos are loaded
+    # once, by the package module agent_core.host, and each graph is looked up by its name
+    if name in DEMOS:
+        return importlib.import_module("agent_core.host").get_graph(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    # Both graphs in one process on scripted models, sharing one pooled chat model - no keys or network needed
+    # python -m agent_core.host
+    import asyncio
+
+    from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    from agent_core.metrics import registry
+
+    os.environ.setdefault("OPENAI_API_KEY", "offline-check")
+    os.environ.setdefault("TAVILY_API_KEY", "offline-check")
+    demo02, demo03 = load_demo("demo02"), load_demo("demo03")
+    logging.getLogger().setLevel(logging.WARNING)
+    assert "my_agent" not in sys.modules and demo02.GraphConfig is not demo03.GraphConfig
+    assert sys.modules["demo02_agent.utils.nodes"].GRAPH == "demo02"
+    shared = model_pool.chat_model("openai")
+    assert sys.modules["demo02_agent.utils.nodes"]._get_model("openai").bound is shared
+    assert sys.modules["demo03_agent.utils.nodes"]._get_model("openai").bound is shared
+
+    answer = AIMessage(content="Nothing to do.", usage_metadata={"input_tokens": 10, "output_tokens": 3, "total_tokens": 13})
+    for name in DEMOS:
+        # Scripted model in place of the pooled one; intent parsing off so demo02 starts with the model too
+        sys.modules[f"{name}_agent.utils.nodes"]._get_model = lambda provider: FakeMessagesListChatModel(responses=[answer])
+    config = {"configurable": {"model_name": "openai", "intent_extraction": False, "run_cache": False}}
+    inputs = {"messages": [HumanMessage(content="hello")]}
+
+    async def both():
+        return await asyncio.gather(get_graph("demo02").ainvoke(inputs, config), get_graph("demo03").ainvoke(inputs, config))
+
+    for result in asyncio.run(both()):
+        assert result["messages"][-1].content == "Nothing to do."
+    runs = [line for line in registry.render().splitlines() if line.startswith("agent_run_duration_seconds_count")]
+    assert len(runs) == 2, runs
+    print(f"host checks passed: {graph_factory.names()} in one process, pool {model_pool.stats()}")
+    print("\n".join(runs))
@@ -0,0 +1,92 @@
+import json
+import os
+import random
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Hot path logging.
+Records written on every turn (model responses, routing, cache hits) go through log_event instead of
+f-strings, so a record that is not emitted costs one level check:
+- Lazy: nothing is formatted below the logger's level, and field values may be callables that are
+  only evaluated for records that are emitted.
+- Sampled: INFO and DEBUG records are kept at LOG_SAMPLE_RATE (warnings and errors always are).
+- Size capped: every field is cut to LOG_FIELD_MAX characters, so a fleet inventory or a long
+  itinerary never ends up in the log.
+- Structured: one "event key=value ..." line, or a JSON object with LOG_FORMAT=json; the fields are
+  also attached to the record as record.fields for log handlers.
+LOG_LEVEL=INFO
+LOG_SAMPLE_RATE=1.0
+LOG_FIELD_MAX=200
+LOG_FORMAT=kv
+'''
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_FIELD_MAX = int(os.environ.get("LOG_FIELD_MAX", "200"))
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "kv").lower()
+
+
+def configure_logging(level=LOG_LEVEL):
+    '''Root logging for local runs; a no-op when the host (e.g. the LangGraph server) already configured it.'''
+    logging.basicConfig(level=level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def _cap(value, limit):
+    if callable(value):
+        value = value()
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > limit:
+        return f"{text[:limit]}...(+{len(text) - limit} chars)"
+    return text
+
+
+def _format(event, fields):
+    if LOG_FORMAT == "json":
+        return json.dumps({"event": event, **fields}, default=str)
+    parts = [event]
+    for key, value in fields.items():
+        if isinstance(value, str) and (not value or any(c in value for c in ' "=')):
+            value = json.dumps(value)
+        parts.append(f"{key}={value}")
+    return " ".join(parts)
+
+
+def log_event(log, event, level=logging.INFO, sample=None, limit=None, **fields):
+    '''Emits one structured record for event if log is enabled for level and the record is sampled.'''
+    if not log.isEnabledFor(level):
+        return
+    rate = LOG_SAMPLE_RATE if sample is None else sample
+    if level < logging.WARNING and rate < 1.0 and random.random() >= rate:
+        return
+    limit = LOG_FIELD_MAX if limit is None else limit
+    values = {key: _cap(value, limit) for key, value in fields.items()}
+    log.log(level, _format(event, values), extra={"event": event, "fields": values}, stacklevel=2)
+
+
+if __name__ == "__main__":
+    # python -m agent_core.logs
+    import time
+
+    configure_logging("INFO")
+    demo = logging.getLogger("demo")
+    log_event(demo, "model_response", model="openai", tool_calls=lambda: ["WeatherSearch"], text="x" * 500, limit=40)
+
+    evaluated = []
+    log_event(demo, "skipped", level=logging.DEBUG, payload=lambda: evaluated.append(1))
+    assert not evaluated, "fields of records below the level are never evaluated"
+
+    fleet = [{"hostname": f"leaf-sw{n}", "current_firmware": "9.2(1)"} for n in range(1000)]
+    demo.setLevel(logging.WARNING)
+    started = time.perf_counter()
+    for _ in range(1000):
+        demo.info(f"Received devices_json: {repr(fleet)}")
+    eager = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(1000):
+        log_event(demo, "itsm_audit", devices=lambda: repr(fleet))
+    print(f"1000 suppressed records of a 1000 device fleet: f-string {eager * 1000:.0f} ms, log_event {(time.perf_counter() - started) * 1000:.1f} ms")
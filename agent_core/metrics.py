@@ -0,0 +1,422 @@
+import atexit
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.errors import GraphBubbleUp
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Graph run metrics in the Prometheus text format.
+MetricsHandler is attached to the compiled graph as a callback handler, so every run - invoke or
+ainvoke, Studio or the LangGraph server - records:
+- agent_node_duration_seconds      wall time per graph node
+- agent_node_output_bytes          message payload a node adds to the state, per graph step
+- agent_llm_duration_seconds       model call latency per provider and model
+- agent_llm_tokens_total           input / output / cache_read / cache_creation tokens
+- agent_tool_duration_seconds      tool latency
+- agent_tool_payload_bytes         size of each tool result
+- agent_run_duration_seconds, agent_run_steps, agent_errors_total
+- agent_checkpoint_*                checkpoint write time and bytes (checkpoint.py, when CHECKPOINT_DB is set)
+- agent_ratelimit_*                 rate limiter waits, 429 backoffs and current rate per provider (rate_limit.py)
+The registry is process wide: every graph served by the process (agent_core/host.py serves demo02
+and demo03 together) records into it under its own graph label, next to the model pool metrics
+(model_pool.py). Metrics are kept in process. METRICS_PORT serves them on
+http://METRICS_HOST:METRICS_PORT/metrics, METRICS_FILE rewrites a file every METRICS_FILE_INTERVAL
+seconds (and at exit), e.g. for the node_exporter textfile collector.
+METRICS_PORT=9464
+METRICS_HOST=127.0.0.1
+METRICS_FILE=...
+METRICS_FILE_INTERVAL=15
+'''
+
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+METRICS_FILE_INTERVAL = float(os.environ.get("METRICS_FILE_INTERVAL", "15"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+STEP_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def count(self, **labels):
+        counts = self._values.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == "+Inf" else f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(counts[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    '''Current values, read from collect() - {label values: value} - every time the metrics are rendered.'''
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect() if self.collect else {}
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, labelnames=(), collect=None):
+        return self._add(Gauge(name, help, labelnames, collect))
+
+    def render(self):
+        '''All metrics in the Prometheus text exposition format.'''
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+NODE_SECONDS = registry.histogram("agent_node_duration_seconds", "Wall time of a graph node", ("graph", "node"))
+NODE_BYTES = registry.histogram("agent_node_output_bytes", "Message payload bytes a node adds to the state",
+                                ("graph", "node"), BYTES_BUCKETS)
+LLM_SECONDS = registry.histogram("agent_llm_duration_seconds", "Latency of a model call", ("graph", "provider", "model"))
+LLM_TOKENS = registry.counter("agent_llm_tokens_total", "Model tokens by type (input, output, cache_read, cache_creation)",
+                              ("graph", "provider", "model", "type"))
+TOOL_SECONDS = registry.histogram("agent_tool_duration_seconds", "Latency of a tool call", ("graph", "tool"))
+TOOL_BYTES = registry.histogram("agent_tool_payload_bytes", "Size of a tool result", ("graph", "tool"), BYTES_BUCKETS)
+RUN_SECONDS = registry.histogram("agent_run_duration_seconds", "Wall time of a graph run", ("graph",))
+RUN_STEPS = registry.histogram("agent_run_steps", "LangGraph steps of a graph run", ("graph",), STEP_BUCKETS)
+ERRORS = registry.counter("agent_errors_total", "Failed nodes, model calls and tool calls", ("graph", "kind", "name"))
+
+
+def _text_bytes(content):
+    if isinstance(content, str):
+        return len(content.encode())
+    if isinstance(content, list):
+        return sum(_text_bytes(block.get("text", "") if isinstance(block, dict) else block) for block in content)
+    return 0
+
+
+def payload_bytes(output):
+    '''Bytes of message content (and tool call arguments) in a node or tool output.'''
+    if output is None:
+        return 0
+    if isinstance(output, (list, tuple)):
+        return sum(payload_bytes(item) for item in output)
+    if isinstance(output, dict):
+        return payload_bytes(output.get("messages"))
+    update = getattr(output, "update", None)
+    if update is not None and not hasattr(output, "content"):
+        # langgraph Command
+        return payload_bytes(update)
+    if hasattr(output, "content"):
+        size = _text_bytes(output.content)
+        for call in getattr(output, "tool_calls", None) or []:
+            size += len(str(call.get("args", "")))
+        return size
+    return _text_bytes(output)
+
+
+class MetricsHandler(BaseCallbackHandler):
+    '''Records node, model and tool metrics of every run of a graph into registry.'''
+
+    # Cheap and lock protected; inline so async runs don't hand every callback to a worker thread
+    run_inline = True
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._started = {}
+        # run_id -> id of the graph run it belongs to, and the highest step seen per graph run
+        self._roots = {}
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, parent_run_id, entry):
+        with self._lock:
+            if entry[0] == "node" and self._started.get(parent_run_id, (None, None))[:2] == entry:
+                # A runnable named like its node (RunnableLambda(..., name=node)) is not a second node run
+                entry = ("chain", None)
+            root = self._roots.get(parent_run_id, parent_run_id) if parent_run_id else run_id
+            self._roots[run_id] = root
+            self._started[run_id] = entry + (time.perf_counter(),)
+            return root
+
+    def _finish(self, run_id):
+        with self._lock:
+            self._roots.pop(run_id, None)
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return None, None
+        return started[:-1], time.perf_counter() - started[-1]
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if parent_run_id is None:
+            self._start(run_id, None, ("run", None))
+            return
+        root = self._start(run_id, parent_run_id, ("node", node) if node and kwargs.get("name") == node else ("chain", None))
+        step = metadata.get("langgraph_step")
+        if step is not None and "|" not in metadata.get("langgraph_checkpoint_ns", ""):
+            with self._lock:
+                self._steps[root] = max(self._steps.get(root, 0), step)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        entry, elapsed = self._finish(run_id)
+        if entry is None:
+            return
+        kind, node = entry
+        if kind == "node":
+            NODE_SECONDS.observe(elapsed, graph=self.graph, node=node)
+            NODE_BYTES.observe(payload_bytes(outputs), graph=self.graph, node=node)
+        elif kind == "run":
+            RUN_SECONDS.observe(elapsed, graph=self.graph)
+            with self._lock:
+                steps = self._steps.pop(run_id, 0)
+            RUN_STEPS.observe(steps, graph=self.graph)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        entry, _ = self._finish(run_id)
+        if entry is None:
+            return
+        # An interrupt (a run paused for sign-off) bubbles up through its node as an exception, but is no failure
+        if entry[0] == "node" and not isinstance(error, GraphBubbleUp):
+            ERRORS.inc(graph=self.graph, kind="node", name=entry[1])
+        elif entry[0] == "run":
+            with self._lock:
+                self._steps.pop(run_id, None)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        self._start(run_id, parent_run_id, ("llm", (metadata.get("ls_provider", "unknown"),
+                                                    metadata.get("ls_model_name", "unknown"))))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        entry, elapsed = self._finish(run_id)
+        if entry is None:
+            return
+        provider, model = entry[1]
+        LLM_SECONDS.observe(elapsed, graph=self.graph, provider=provider, model=model)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                details = usage.get("input_token_details") or {}
+                counts = {
+                    "input": usage.get("input_tokens", 0),
+                    "output": usage.get("output_tokens", 0),
+                    "cache_read": details.get("cache_read", 0),
+                    "cache_creation": details.get("cache_creation", 0),
+                }
+                for kind, count in counts.items():
+                    if count:
+                        LLM_TOKENS.inc(count, graph=self.graph, provider=provider, model=model, type=kind)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        entry, _ = self._finish(run_id)
+        if entry is not None:
+            ERRORS.inc(graph=self.graph, kind="llm", name=entry[1][0])
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, ("tool", name))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        entry, elapsed = self._finish(run_id)
+        if entry is None:
+            return
+        TOOL_SECONDS.observe(elapsed, graph=self.graph, tool=entry[1])
+        TOOL_BYTES.observe(payload_bytes(output), graph=self.graph, tool=entry[1])
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        entry, _ = self._finish(run_id)
+        if entry is not None:
+            ERRORS.inc(graph=self.graph, kind="tool", name=entry[1])
+
+
+def write_metrics_file(path):
+    '''Writes the metrics to path atomically, so a collector never reads half a file.'''
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters(port=METRICS_PORT, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL):
+    '''Starts the /metrics endpoint and the metrics file writer that are configured; safe to call twice.'''
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if port:
+        server = ThreadingHTTPServer((METRICS_HOST, int(port)), _MetricsRequestHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Serving metrics on http://{METRICS_HOST}:{server.server_address[1]}/metrics")
+    if path:
+        def write_forever():
+            while True:
+                time.sleep(interval)
+                try:
+                    write_metrics_file(path)
+                except OSError as e:
+                    logger.warning(f"Writing metrics to {path} failed: {e}")
+
+        threading.Thread(target=write_forever, name="metrics-file", daemon=True).start()
+        atexit.register(write_metrics_file, path)
+        logger.info(f"Writing metrics to {path} every {interval:g}s")
+
+
+if __name__ == "__main__":
+    # Records one small graph run and prints the exposition
+    # python -m agent_core.metrics
+    from typing import Annotated, TypedDict
+
+    from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.tools import tool
+    from langgraph.graph import END, StateGraph, add_messages
+    from langgraph.prebuilt import ToolNode
+
+    class State(TypedDict):
+        messages: Annotated[list, add_messages]
+
+    @tool
+    def lookup(query: str) -> str:
+        """Returns 2000 bytes."""
+        return "x" * 2000
+
+    model = FakeMessagesListChatModel(responses=[
+        AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"query": "q"}, "id": "call_1"}],
+                  usage_metadata={"input_tokens": 120, "output_tokens": 8, "total_tokens": 128,
+                                  "input_token_details": {"cache_read": 100}}),
+    ])
+
+    workflow = StateGraph(State)
+    workflow.add_node("agent", lambda state: {"messages": [model.invoke(state["messages"])]})
+    workflow.add_node("tools", ToolNode([lookup]))
+    workflow.set_entry_point("agent")
+    workflow.add_edge("agent", "tools")
+    workflow.add_edge("tools", END)
+    graph = workflow.compile().with_config(callbacks=[MetricsHandler("check")])
+    graph.invoke({"messages": [HumanMessage(content="hi")]})
+
+    labels = {"graph": "check", "provider": "fakemessageslistchatmodel", "model": "unknown"}
+    assert NODE_SECONDS.count(graph="check", node="agent") == 1 and NODE_SECONDS.count(graph="check", node="tools") == 1
+    assert LLM_TOKENS.value(type="input", **labels) == 120 and LLM_TOKENS.value(type="cache_read", **labels) == 100
+    assert TOOL_SECONDS.count(graph="check", tool="lookup") == 1
+    assert TOOL_BYTES._values[("check", "lookup")][-1] == 2000
+    assert RUN_STEPS._values[("check",)][-1] == 2
+    print(registry.render())
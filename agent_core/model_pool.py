@@ -0,0 +1,251 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+from agent_core.metrics import registry
+from agent_core.model_router import LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL
+from agent_core import rate_limit
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Process-wide pool of model clients.
+Before the pool each graph kept its own chat models, and every chat model its own SDK clients and
+connection pools. When one worker serves both demos (agent_core/host.py), the graphs share:
+- One chat model per (provider, model, base_url). A graph gets it with its tools and prompt cache
+  settings bound on top (model_pool.model), which costs nothing and is cached per graph.
+- One httpx client pair (sync and async) per provider, with keep-alive and a connection cap: at most
+  MODEL_POOL_MAX_CONNECTIONS connections per provider, of which MODEL_POOL_MAX_KEEPALIVE stay open
+  while idle, for MODEL_POOL_KEEPALIVE_EXPIRY seconds. When the cap is reached, a call waits for a
+  free connection instead of opening another one.
+- Per graph metrics. Model calls run inside graph_scope(graph), so each HTTP request the shared
+  clients send counts toward its graph:
+  - agent_pool_http_requests_total (graph, provider, status)
+  - agent_pool_models_total (graph, provider, created or reused)
+  - agent_pool_connections (open connections per provider, active or idle)
+- The provider's rate limit (agent_core/rate_limit.py), when it is on (RATE_LIMITER=on or the batch
+  runner). The clients' request hook waits for the provider's request and token buckets, and the
+  response hook backs the provider off on a 429.
+The SDKs are still imported the first time a provider is needed.
+MODEL_POOL_MAX_CONNECTIONS=20
+MODEL_POOL_MAX_KEEPALIVE=10
+MODEL_POOL_KEEPALIVE_EXPIRY=60
+'''
+
+MAX_CONNECTIONS = int(os.environ.get("MODEL_POOL_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.environ.get("MODEL_POOL_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("MODEL_POOL_KEEPALIVE_EXPIRY", "60"))
+
+# provider -> (SDK, model); "local" is an OpenAI compatible endpoint such as vLLM
+MODELS = {
+    "openai": ("openai", "gpt-4.1"),
+    "anthropic": ("anthropic", "claude-3-7-sonnet-latest"),
+    "local": ("openai", LOCAL_LLM_MODEL),
+}
+
+_graph = contextvars.ContextVar("model_pool_graph", default="none")
+
+
+@contextmanager
+def graph_scope(graph):
+    '''Counts the HTTP requests of the model calls made inside toward graph.'''
+    token = _graph.set(graph)
+    try:
+        yield
+    finally:
+        _graph.reset(token)
+
+
+def _event_hooks(provider, asynchronous):
+    hooks = rate_limit.event_hooks(provider, asynchronous)
+
+    def on_response(response):
+        HTTP_REQUESTS.inc(graph=_graph.get(), provider=provider, status=str(response.status_code))
+
+    if not asynchronous:
+        hooks["response"].append(on_response)
+        return hooks
+
+    async def aon_response(response):
+        on_response(response)
+
+    hooks["response"].append(aon_response)
+    return hooks
+
+
+def _connection_counts(client):
+    '''(active, idle) connections of an httpx client, read from its httpcore pool.'''
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None) or []
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return len(connections) - idle, idle
+
+
+def _use_anthropic_http_clients(model, http_client, http_async_client):
+    '''ChatAnthropic takes no http_client; its SDK clients are cached properties, set here before first use.'''
+    import anthropic
+
+    params = model._client_params
+    model.__dict__["_client"] = anthropic.Client(**params, http_client=http_client)
+    model.__dict__["_async_client"] = anthropic.AsyncClient(**params, http_client=http_async_client)
+
+
+class ModelPool:
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE, keepalive_expiry=KEEPALIVE_EXPIRY,
+                 local_base_url=None):
+        self.local_base_url = local_base_url or LOCAL_LLM_BASE_URL
+        self.limits = {"max_connections": max_connections, "max_keepalive_connections": max_keepalive,
+                       "keepalive_expiry": keepalive_expiry}
+        # provider -> (httpx.Client, httpx.AsyncClient)
+        self._http = {}
+        # (provider, model, base_url) -> chat model, and (graph, provider, variant) -> chat model with the graph's bindings
+        self._models = {}
+        self._bound = {}
+        self._lock = threading.RLock()
+
+    def http_clients(self, provider):
+        '''The sync and async httpx clients every chat model of provider sends its requests through.'''
+        with self._lock:
+            if provider not in self._http:
+                import httpx
+
+                # The SDK's own client classes keep its default timeouts and redirect handling
+                if MODELS[provider][0] == "anthropic":
+                    from anthropic import DefaultAsyncHttpxClient, DefaultHttpxClient
+                else:
+                    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+                limits = httpx.Limits(**self.limits)
+                self._http[provider] = (
+                    DefaultHttpxClient(limits=limits, event_hooks=_event_hooks(provider, False)),
+                    DefaultAsyncHttpxClient(limits=limits, event_hooks=_event_hooks(provider, True)),
+                )
+                logger.info(f"Pooled HTTP clients for {provider}: {self.limits}")
+            return self._http[provider]
+
+    def _create(self, provider, model_id, base_url):
+        http_client, http_async_client = self.http_clients(provider)
+        if provider == "anthropic":
+            from langchain_anthropic import ChatAnthropic
+
+            model = ChatAnthropic(temperature=0, model=model_id)
+            _use_anthropic_http_clients(model, http_client, http_async_client)
+            return model
+        from langchain_openai import ChatOpenAI
+
+        if provider == "local":
+            # stream_usage keeps token usage on streamed responses
+            return ChatOpenAI(temperature=0, model=model_id, base_url=base_url,
+                              api_key=os.environ.get("LOCAL_LLM_API_KEY", "EMPTY"), stream_usage=True,
+                              http_client=http_client, http_async_client=http_async_client)
+        return ChatOpenAI(temperature=0, model=model_id, http_client=http_client, http_async_client=http_async_client)
+
+    def chat_model(self, provider, graph=None):
+        '''The shared chat model of provider; an unknown provider gets the OpenAI model, like the Studio default.'''
+        if provider not in MODELS:
+            provider = "openai"
+        base_url = self.local_base_url if provider == "local" else None
+        if provider == "local" and not base_url:
+            raise ValueError("LOCAL_LLM_BASE_URL is not set")
+        key = (provider, MODELS[provider][1], base_url)
+        with self._lock:
+            model = self._models.get(key)
+            created = model is None
+            if created:
+                model = self._models[key] = self._create(*key)
+        MODELS_HANDED_OUT.inc(graph=graph or _graph.get(), provider=provider, outcome="created" if created else "reused")
+        return model
+
+    def model(self, provider, graph, bind=None, variant="default"):
+        '''The shared chat model of provider with bind(model) applied (tools, prompt caching), cached per graph and variant.'''
+        key = (graph, provider, variant)
+        model = self._bound.get(key)
+        if model is None:
+            model = self.chat_model(provider, graph)
+            if bind is not None:
+                model = bind(model)
+            with self._lock:
+                model = self._bound.setdefault(key, model)
+        return model
+
+    def connections(self):
+        '''{(provider, client, state): count} of the pooled clients' open connections.'''
+        with self._lock:
+            clients = list(self._http.items())
+        counts = {}
+        for provider, pair in clients:
+            for kind, client in zip(("sync", "async"), pair):
+                active, idle = _connection_counts(client)
+                counts[(provider, kind, "active")] = active
+                counts[(provider, kind, "idle")] = idle
+        return counts
+
+    def stats(self):
+        with self._lock:
+            return {"chat_models": len(self._models), "graph_models": len(self._bound), "http_clients": len(self._http),
+                    "providers": sorted(self._http)}
+
+
+model_pool = ModelPool()
+
+MODELS_HANDED_OUT = registry.counter("agent_pool_models_total", "Chat model lookups in the pool, created or reused",
+                                     ("graph", "provider", "outcome"))
+HTTP_REQUESTS = registry.counter("agent_pool_http_requests_total", "HTTP requests sent through the pooled clients",
+                                 ("graph", "provider", "status"))
+CONNECTIONS = registry.gauge("agent_pool_connections", "Open connections of the pooled clients",
+                             ("provider", "client", "state"), collect=model_pool.connections)
+
+
+if __name__ == "__main__":
+    # Two graphs sharing one client and one connection, against a local HTTP server - no keys or network needed
+    # python -m agent_core.model_pool
+    import asyncio
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from langchain_core.messages import HumanMessage
+
+    class FakeOpenAI(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({
+                "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "fake",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pool = ModelPool(max_connections=2, max_keepalive=2, local_base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+    planner = pool.model("local", "demo02", bind=lambda model: model.bind(temperature=0))
+    auditor = pool.model("local", "demo03")
+    assert planner.bound is auditor, "both graphs share one chat model"
+    assert pool.model("local", "demo02", bind=lambda model: model.bind(temperature=0)) is planner
+
+    for graph, model in (("demo02", planner), ("demo03", auditor), ("demo03", auditor)):
+        with graph_scope(graph):
+            assert model.invoke([HumanMessage(content="hi")]).content == "ok"
+
+    async def acall():
+        with graph_scope("demo02"):
+            return await planner.ainvoke([HumanMessage(content="hi")])
+
+    asyncio.run(acall())
+    assert HTTP_REQUESTS.value(graph="demo02", provider="local", status="200") == 2
+    assert HTTP_REQUESTS.value(graph="demo03", provider="local", status="200") == 2
+    counts = pool.connections()
+    assert counts[("local", "sync", "idle")] == 1, f"three sync calls over one kept-alive connection: {counts}"
+    print(f"model pool checks passed: {pool.stats()}, connections {counts}")
+    print("\n".join(line for line in registry.render().splitlines() if line.startswith("agent_pool_")))
@@ -0,0 +1,406 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_core.streaming import astream_response, stream_response
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Latency aware model router.
+Every provider keeps a rolling window of call latencies and outcomes and its own circuit breaker.
+A call goes to the selected provider first and fails over to the next healthy provider in
+MODEL_FAILOVER order when it raises; a provider whose breaker is open is skipped until the breaker
+lets a trial call through again. With hedging on, a call that is still running after the provider's
+p95 latency gets a second, hedged request to the next healthy provider.
+invoke runs the call on the caller's thread and only the hedged request on the router's pool, so
+the p95 wait starts with the call and never includes queueing. A blocking call cannot be abandoned:
+the caller gets the primary's answer, and the hedged one when the primary then fails, without a
+fresh failover call.
+ainvoke is the same on the event loop: the calls are awaited, hedging races two asyncio tasks, the
+first answer wins and no worker thread is held while a provider answers. With stream=True the response is streamed
+(streaming.py) and assembled into the same message; a failover after a broken stream starts
+a fresh stream on the next provider, after a stream_reset event for what the broken one sent.
+Streamed calls are not hedged: both streams would write tokens and tool_call events into the same
+node run.
+When every provider fails, ModelCallError carries each provider's error, so a caller can tell a
+run that was only rate limited (is_rate_limited) from one that is broken.
+MODEL_FAILOVER=openai,anthropic,local   (providers without keys or endpoint just fail over)
+LOCAL_LLM_BASE_URL=...   (OpenAI compatible endpoint, e.g. vLLM at http://localhost:8000/v1)
+LOCAL_LLM_MODEL=...
+'''
+
+FAILOVER_ORDER = [p.strip() for p in os.environ.get("MODEL_FAILOVER", "openai,anthropic,local").split(",") if p.strip()]
+LOCAL_LLM_BASE_URL = os.environ.get("LOCAL_LLM_BASE_URL")
+LOCAL_LLM_MODEL = os.environ.get("LOCAL_LLM_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+
+WINDOW = 100
+HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class ModelCallError(Exception):
+    '''Every provider tried failed; errors maps each of them to its exception, in the order tried.'''
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{provider}: {error!r}" for provider, error in errors.items()))
+
+
+def is_rate_limited(error):
+    '''True for an HTTP 429 (openai, anthropic and httpx errors), or a ModelCallError with one behind it.'''
+    if isinstance(error, ModelCallError):
+        return any(is_rate_limited(e) for e in error.errors.values())
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def _invoke(model, messages, **kwargs):
+    return model.invoke(messages, **kwargs)
+
+
+async def _ainvoke(model, messages, **kwargs):
+    return await model.ainvoke(messages, **kwargs)
+
+
+class ProviderHealth:
+    '''Rolling latency/error window and circuit breaker of one provider.'''
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=3, error_rate_threshold=0.5, reset_timeout=30.0, window=WINDOW):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.reset_timeout = reset_timeout
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        '''True when a call may go to this provider; an open breaker lets one trial call through after reset_timeout.'''
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self._trial_running = False
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed again.")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self._trial_running = False
+            error_rate = self.outcomes.count(False) / len(self.outcomes)
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold or (
+                len(self.outcomes) >= 10 and error_rate >= self.error_rate_threshold
+            ):
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened ({self.consecutive_failures} consecutive failures, "
+                                   f"error rate {error_rate:.0%}).")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def percentile(self, p):
+        with self._lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def stats(self):
+        with self._lock:
+            calls = len(self.outcomes)
+            errors = self.outcomes.count(False)
+            state = self.state
+        return {
+            "state": state,
+            "calls": calls,
+            "error_rate": round(errors / calls, 3) if calls else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+class ModelRouter:
+    def __init__(self, order=None, hedge_min_samples=HEDGE_MIN_SAMPLES, max_hedge_workers=16, **health_options):
+        self.order = list(order or FAILOVER_ORDER)
+        self.hedge_min_samples = hedge_min_samples
+        self.health_options = health_options
+        self._health = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_hedge_workers, thread_name_prefix="model-hedge")
+
+    def health(self, provider):
+        with self._lock:
+            if provider not in self._health:
+                self._health[provider] = ProviderHealth(provider, **self.health_options)
+            return self._health[provider]
+
+    def stats(self):
+        with self._lock:
+            providers = list(self._health)
+        return {provider: self.health(provider).stats() for provider in providers}
+
+    def candidates(self, primary):
+        '''The selected provider first, then the failover order.'''
+        return [primary] + [provider for provider in self.order if provider != primary]
+
+    def _call(self, provider, call, factory, messages_for, kwargs):
+        health = self.health(provider)
+        started = time.perf_counter()
+        try:
+            response = call(factory(provider), messages_for(provider), **kwargs)
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.perf_counter() - started)
+        return response
+
+    def _hedged_call(self, provider, backup, call, factory, messages_for, kwargs):
+        '''Call provider here; once it runs past its p95, also call backup on the pool, in case provider fails.'''
+        # The caller's context keeps the hedged request attached to the graph run (callbacks, tracing, stream writer)
+        context = contextvars.copy_context()
+        lock = threading.Lock()
+        hedged = []
+
+        def send_hedge():
+            with lock:
+                if hedged or not backup.allow():
+                    return
+                logger.info(f"{provider} slower than its p95, sending a hedged request to {backup.name}.")
+                hedged.append(self._pool.submit(context.run, self._call, backup.name, call, factory, messages_for, kwargs))
+
+        timer = threading.Timer(self.health(provider).percentile(95), send_hedge)
+        timer.daemon = True
+        timer.start()
+        try:
+            return self._call(provider, call, factory, messages_for, kwargs)
+        except Exception as e:
+            with lock:
+                future = hedged[0] if hedged else None
+                # Blocks a late send_hedge: the failover in invoke calls backup itself
+                hedged.append(None)
+            if future is None:
+                raise
+            logger.warning(f"Model call to {provider} failed: {e}. Using the hedged request to {backup.name}.")
+            try:
+                return future.result()
+            except Exception:
+                raise e
+        finally:
+            timer.cancel()
+            with lock:
+                if not hedged:
+                    hedged.append(None)
+                elif hedged[0] is not None:
+                    # Still queued behind other hedges: not needed any more
+                    hedged[0].cancel()
+
+    def invoke(self, primary, factory, messages_for, hedge=False, stream=False, **kwargs):
+        '''
+        Invoke factory(provider) with messages_for(provider), starting with primary and failing over.
+        messages_for lets each provider get its own message layout (e.g. prompt caching blocks).
+        '''
+        call = stream_response if stream else _invoke
+        errors = {}
+        candidates = self.candidates(primary)
+        for index, provider in enumerate(candidates):
+            health = self.health(provider)
+            if not health.allow():
+                logger.info(f"Circuit for {provider} is open, skipping it.")
+                continue
+            backup = next((self.health(p) for p in candidates[index + 1:] if self.health(p).state != ProviderHealth.OPEN), None)
+            try:
+                if hedge and not stream and backup is not None and len(health.latencies) >= self.hedge_min_samples:
+                    return self._hedged_call(provider, backup, call, factory, messages_for, kwargs)
+                return self._call(provider, call, factory, messages_for, kwargs)
+            except Exception as e:
+                logger.warning(f"Model call to {provider} failed: {e}. Failing over.")
+                errors[provider] = e
+        if errors:
+            raise ModelCallError(errors) from list(errors.values())[-1]
+        raise CircuitOpenError(f"No model provider available, circuits open for {candidates}")
+
+    async def _acall(self, provider, call, factory, messages_for, kwargs):
+        health = self.health(provider)
+        started = time.perf_counter()
+        try:
+            response = await call(factory(provider), messages_for(provider), **kwargs)
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.perf_counter() - started)
+        return response
+
+    async def _ahedged_call(self, provider, backup, call, factory, messages_for, kwargs):
+        '''Async _hedged_call: the losing request is cancelled instead of left running.'''
+        first = asyncio.ensure_future(self._acall(provider, call, factory, messages_for, kwargs))
+        done, _ = await asyncio.wait([first], timeout=self.health(provider).percentile(95))
+        if done or not backup.allow():
+            return await first
+
+        logger.info(f"{provider} slower than its p95, sending a hedged request to {backup.name}.")
+        pending = {first, asyncio.ensure_future(self._acall(backup.name, call, factory, messages_for, kwargs))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, primary, factory, messages_for, hedge=False, stream=False, **kwargs):
+        '''Async invoke: awaits factory(provider).ainvoke with the same failover, breaker and hedging rules.'''
+        call = astream_response if stream else _ainvoke
+        errors = {}
+        candidates = self.candidates(primary)
+        for index, provider in enumerate(candidates):
+            health = self.health(provider)
+            if not health.allow():
+                logger.info(f"Circuit for {provider} is open, skipping it.")
+                continue
+            backup = next((self.health(p) for p in candidates[index + 1:] if self.health(p).state != ProviderHealth.OPEN), None)
+            try:
+                if hedge and not stream and backup is not None and len(health.latencies) >= self.hedge_min_samples:
+                    return await self._ahedged_call(provider, backup, call, factory, messages_for, kwargs)
+                return await self._acall(provider, call, factory, messages_for, kwargs)
+            except Exception as e:
+                logger.warning(f"Model call to {provider} failed: {e}. Failing over.")
+                errors[provider] = e
+        if errors:
+            raise ModelCallError(errors) from list(errors.values())[-1]
+        raise CircuitOpenError(f"No model provider available, circuits open for {candidates}")
+
+
+model_router = ModelRouter()
+
+
+if __name__ == "__main__":
+    # Failover, circuit breaker and hedging check with fake models - no keys or network needed
+    # python -m agent_core.model_router
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class FlakyModel(FakeListChatModel):
+        latency: float = 0.0
+        fail: bool = False
+
+        def _call(self, *args, **kwargs):
+            time.sleep(self.latency)
+            if self.fail:
+                raise ConnectionError("provider down")
+            return super()._call(*args, **kwargs)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.latency)
+            if self.fail:
+                raise ConnectionError("provider down")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.responses[0]))])
+
+    models = {
+        "openai": FlakyModel(responses=["openai"], latency=0.01),
+        "anthropic": FlakyModel(responses=["anthropic"], latency=0.01),
+        "local": FlakyModel(responses=["local"], latency=0.01),
+    }
+    router = ModelRouter(order=["openai", "anthropic", "local"], hedge_min_samples=5, reset_timeout=0.5)
+
+    def call(hedge=False):
+        return router.invoke("openai", models.get, lambda provider: "hello", hedge=hedge).content
+
+    assert [call() for _ in range(10)] == ["openai"] * 10
+    # Streamed calls assemble the same message
+    assert router.invoke("openai", models.get, lambda provider: "hello", stream=True).content == "openai"
+
+    # Hedging: the primary turns slow and then fails; the hedged request to anthropic went out at
+    # openai's p95 and is already answered, so there is no second 0.3s for a failover call
+    models["openai"].latency, models["openai"].fail, models["anthropic"].latency = 0.5, True, 0.3
+    started = time.perf_counter()
+    assert call(hedge=True) == "anthropic"
+    seconds = time.perf_counter() - started
+    assert seconds < 0.7, seconds
+    print(f"hedged call answered in {seconds:.2f}s (primary fails after 0.5s, anthropic takes 0.3s)")
+    # A slow primary that succeeds still answers the call
+    models["openai"].fail = False
+    assert call(hedge=True) == "openai"
+    models["openai"].latency = models["anthropic"].latency = 0.01
+
+    # Failover and circuit breaker: openai is down, calls move to anthropic and the breaker opens
+    models["openai"].fail = True
+    assert [call() for _ in range(5)] == ["anthropic"] * 5
+    assert router.health("openai").state == ProviderHealth.OPEN
+    models["anthropic"].fail = True
+    assert call() == "local"
+    print(f"failover with openai and anthropic down: {router.stats()}")
+
+    # Recovery: after reset_timeout a trial call closes the breaker again
+    models["openai"].fail = models["anthropic"].fail = False
+    time.sleep(0.6)
+    assert call() == "openai" and router.health("openai").state == ProviderHealth.CLOSED
+    print("circuit closed again after a successful trial call")
+
+    # The async path: the same failover and hedging on the event loop
+    arouter = ModelRouter(order=["openai", "anthropic", "local"], hedge_min_samples=5, reset_timeout=0.5)
+
+    async def acall(hedge=False):
+        return (await arouter.ainvoke("openai", models.get, lambda provider: "hello", hedge=hedge)).content
+
+    async def check_async():
+        assert await asyncio.gather(*(acall() for _ in range(10))) == ["openai"] * 10
+        models["openai"].latency = 0.5
+        started = time.perf_counter()
+        assert await acall(hedge=True) == "anthropic"
+        print(f"async hedged call answered in {time.perf_counter() - started:.2f}s (primary takes 0.5s)")
+        models["openai"].fail = True
+        assert await acall() == "anthropic"
+
+    asyncio.run(check_async())
+    print(f"async failover: {arouter.stats()}")
+
+    # Every provider failing: the 429 of the first one is still visible behind the last one's error
+    class RateLimited(Exception):
+        status_code = 429
+
+    def rate_limited(provider):
+        if provider == "openai":
+            raise RateLimited("429 Too Many Requests")
+        raise ValueError("LOCAL_LLM_BASE_URL is not set")
+
+    try:
+        ModelRouter(order=["openai", "local"]).invoke("openai", rate_limited, lambda provider: "hello")
+    except ModelCallError as e:
+        assert list(e.errors) == ["openai", "local"] and is_rate_limited(e) and isinstance(e.__cause__, ValueError)
+    assert not is_rate_limited(ModelCallError({"local": ValueError("down")}))
+    print("rate limited failover reported as ModelCallError")
@@ -0,0 +1,72 @@
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Provider prompt caching.
+Both providers cache a prompt prefix - tool definitions, then the system prompt, then the history -
+as long as it is byte-identical to an earlier request. The static system prompt therefore always
+comes first and never changes; per call text (like the context note) follows it.
+- Anthropic caches only up to explicit cache_control breakpoints: one on the last tool definition,
+  one after the static system prompt and one on the newest message, so the next call of the run
+  reads the whole conversation so far from the cache.
+- OpenAI caches prefixes of 1024+ tokens automatically; prompt_cache_key routes requests that share
+  the prefix to the same cache.
+Cached token counts come back in usage_metadata["input_token_details"] and are recorded by call_model.
+'''
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def is_anthropic(model_name):
+    return model_name == "anthropic"
+
+
+def cache_kwargs(model_name, cache_key):
+    '''Invocation kwargs that help the provider find the cached prefix (OpenAI only, not local endpoints).'''
+    return {} if model_name in ("anthropic", "local") else {"prompt_cache_key": cache_key}
+
+
+def bind_cached_tools(model, model_name, tools, cache_key):
+    '''bind_tools with a cache breakpoint on the tool definitions (Anthropic) or a prompt cache key (OpenAI).'''
+    if is_anthropic(model_name):
+        from langchain_anthropic.chat_models import convert_to_anthropic_tool
+
+        definitions = [dict(convert_to_anthropic_tool(tool)) for tool in tools]
+        definitions[-1]["cache_control"] = CACHE_CONTROL
+        return model.bind_tools(definitions)
+    return model.bind_tools(tools).bind(**cache_kwargs(model_name, cache_key))
+
+
+def cached_system_message(model_name, prompt, note=""):
+    '''System message with the static prompt first and the per call note after it.'''
+    if not is_anthropic(model_name):
+        return SystemMessage(content=f"{prompt}\n{note}" if note else prompt)
+    blocks = [{"type": "text", "text": prompt, "cache_control": CACHE_CONTROL}]
+    if note:
+        blocks.append({"type": "text", "text": note})
+    return SystemMessage(content=blocks)
+
+
+def with_history_breakpoint(model_name, messages):
+    '''Anthropic: cache breakpoint on the newest user or tool message.'''
+    if not is_anthropic(model_name) or not messages:
+        return messages
+    last = messages[-1]
+    if not isinstance(last, (HumanMessage, ToolMessage)) or not isinstance(last.content, str) or not last.content:
+        return messages
+    block = {"type": "text", "text": last.content, "cache_control": CACHE_CONTROL}
+    return list(messages[:-1]) + [last.model_copy(update={"content": [block]})]
+
+
+def cache_usage(response):
+    '''Input and cached input token counts of a model response (0 when the provider reports none).'''
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0) or 0,
+        "cache_read_tokens": details.get("cache_read", 0) or 0,
+        "cache_creation_tokens": details.get("cache_creation", 0) or 0,
+    }
@@ -0,0 +1,376 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+from agent_core.metrics import registry
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Provider-aware rate limiter: requests and tokens per minute per provider, with adaptive 429 backoff.
+Each provider has a token bucket for requests and, where it has a token limit, one for tokens
+(prompt tokens, estimated from the request size). A call reserves its share from both buckets
+and waits until they cover it. Reservations may run a bucket into debt, so calls queue in
+arrival order and a prompt larger than the bucket waits for its share instead of forever.
+A 429 halves the provider's rate, drops its burst and pauses it for Retry-After seconds (or 1, 2,
+4 ... up to 60 seconds on consecutive 429s); the other calls already in flight answer 429 too and
+count once. The rate then comes back by 5% of the limit for every 2 seconds of successful calls,
+until it is at the full rate again.
+The limiter is off unless RATE_LIMITER=on, or a process turns it on (the batch runner, batch.py,
+does): interactive requests of the LangGraph server are never held back by it. Off, every call
+goes straight out and 429s are left to the SDKs' own retries.
+Where the limiter sits:
+- OpenAI, Anthropic and local models: the request and response hooks of the pooled HTTP clients
+  (model_pool.py), so every call is limited, including the SDKs' own retries.
+- Tavily (demo02 searches): the same hooks on the search's HTTP clients.
+- ITSM (demo03 client): around each request.
+RATE_LIMITS sets provider=requests per minute[/tokens per minute], comma separated; a provider left
+out keeps its defaults, provider=off turns both limits off and 0 or off turns one off. Providers
+without a limit still pause on 429.
+RATE_LIMITER=off
+RATE_LIMITS=openai=500/200000,anthropic=50/40000,tavily=100,itsm=off
+Metrics: agent_ratelimit_wait_seconds_total and agent_ratelimit_throttled_total per provider, and
+agent_ratelimit_rate_ratio (current rate / configured rate).
+'''
+
+# provider -> (requests per minute, tokens per minute); None is unlimited
+DEFAULT_LIMITS = {
+    "openai": (500, 200000),
+    "anthropic": (50, 40000),
+    "local": (None, None),
+    "tavily": (100, None),
+    "itsm": (None, None),
+}
+
+MIN_RATIO = 0.05
+RECOVERY_STEP = 0.05
+RECOVERY_SECONDS = 2.0
+MAX_PAUSE = 60.0
+
+
+def parse_limits(spec):
+    '''DEFAULT_LIMITS updated from a RATE_LIMITS string.'''
+    limits = dict(DEFAULT_LIMITS)
+    for entry in (part.strip() for part in (spec or "").split(",")):
+        if not entry:
+            continue
+        provider, _, value = entry.partition("=")
+        provider = provider.strip().lower()
+        if value.strip().lower() == "off":
+            limits[provider] = (None, None)
+            continue
+        requests, _, tokens = value.partition("/")
+        numbers = [None if not part.strip() or part.strip().lower() == "off" or float(part) <= 0 else float(part)
+                   for part in (requests, tokens)]
+        # Without a token limit in the entry, the provider keeps its default one
+        limits[provider] = (numbers[0], numbers[1] if tokens else limits.get(provider, (None, None))[1])
+    return limits
+
+
+RATE_LIMITER = os.environ.get("RATE_LIMITER", "off").lower() in ("1", "on", "true", "yes")
+RATE_LIMITS = parse_limits(os.environ.get("RATE_LIMITS"))
+
+
+class TokenBucket:
+    '''per_minute units a minute, with a burst of up to a minute's worth.'''
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.per_minute = per_minute
+        self.ratio = 1.0
+        self.clock = clock
+        self._available = float(per_minute)
+        self._updated = clock()
+
+    @property
+    def rate(self):
+        '''Units per second at the current ratio.'''
+        return self.per_minute * self.ratio / 60.0
+
+    def _refill(self, now):
+        # _updated is ahead of now while a pause lasts; nothing refills before it ends
+        if now > self._updated:
+            self._available = min(self.per_minute * self.ratio, self._available + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self, amount, now):
+        '''Takes amount now (possibly into debt); returns the seconds until the debt is paid.'''
+        self._refill(now)
+        self._available -= amount
+        return 0.0 if self._available >= 0 else self._updated - now - self._available / self.rate
+
+    def set_ratio(self, ratio, now):
+        self._refill(now)
+        self.ratio = ratio
+
+    def drain(self, now, until):
+        '''Drops the burst and refills from until on: after a pause, calls go out at the steady rate.'''
+        self._refill(now)
+        self._available = min(self._available, 0.0)
+        self._updated = max(now, until)
+
+
+class ProviderLimiter:
+    '''Request and token buckets of one provider, with its 429 backoff state.'''
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None, clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+        self.ratio = 1.0
+        self._paused_until = 0.0
+        self._recovered_at = 0.0
+        self._consecutive_429 = 0
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "tokens": 0, "waits": 0, "wait_seconds": 0.0, "throttled": 0}
+
+    def reserve(self, tokens=0):
+        '''Seconds the caller has to wait before sending a call of tokens tokens.'''
+        with self._lock:
+            now = self.clock()
+            wait = max(0.0, self._paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            self.stats["calls"] += 1
+            self.stats["tokens"] += tokens
+            if wait > 0:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] += wait
+        if wait > 0:
+            WAIT_SECONDS.inc(wait, provider=self.name)
+        return wait
+
+    def _set_ratio(self, ratio, now):
+        self.ratio = ratio
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.set_ratio(ratio, now)
+
+    def throttled(self, retry_after=None):
+        '''A 429: halve the rate and pause until retry_after, or an exponential backoff with jitter.'''
+        with self._lock:
+            now = self.clock()
+            self.stats["throttled"] += 1
+            # Calls sent before the pause answer 429 as well; only the first of them backs off
+            backing_off = now >= self._paused_until
+            if backing_off:
+                self._consecutive_429 += 1
+                pause = retry_after if retry_after is not None else min(MAX_PAUSE, 2.0 ** (self._consecutive_429 - 1))
+                self._paused_until = now + pause + random.uniform(0, 0.1 * pause)
+                self._recovered_at = self._paused_until
+                self._set_ratio(max(MIN_RATIO, self.ratio / 2), now)
+                for bucket in (self.requests, self.tokens):
+                    if bucket is not None:
+                        bucket.drain(now, self._paused_until)
+            ratio = self.ratio
+        THROTTLED.inc(provider=self.name)
+        if backing_off:
+            logger.warning(f"{self.name} rate limited (429); pausing {pause:.1f}s, rate now {ratio:.0%} of its limit.")
+
+    def succeeded(self):
+        with self._lock:
+            self._consecutive_429 = 0
+            now = self.clock()
+            # Additive increase by time, not by call: a busy provider would otherwise climb back within a second
+            if self.ratio < 1.0 and now - self._recovered_at >= RECOVERY_SECONDS:
+                self._recovered_at = now
+                self._set_ratio(min(1.0, self.ratio + RECOVERY_STEP), now)
+
+
+def retry_after_seconds(headers):
+    '''Seconds from Retry-After / retry-after-ms (OpenAI, Anthropic and most APIs), or None.'''
+    if headers is None:
+        return None
+    milliseconds = headers.get("retry-after-ms")
+    seconds = headers.get("retry-after")
+    try:
+        if milliseconds is not None:
+            return float(milliseconds) / 1000
+        if seconds is not None:
+            return float(seconds)
+    except ValueError:
+        # An HTTP date; the exponential backoff applies instead
+        pass
+    return None
+
+
+class RateLimiter:
+    '''The provider limiters of the process, created on first use from limits.'''
+
+    def __init__(self, limits=None, clock=time.monotonic, enabled=RATE_LIMITER):
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.enabled = enabled
+        self.clock = clock
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def provider(self, name):
+        limiter = self._providers.get(name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._providers.get(name)
+                if limiter is None:
+                    limiter = self._providers[name] = ProviderLimiter(name, *self.limits.get(name, (None, None)),
+                                                                      clock=self.clock)
+        return limiter
+
+    def acquire(self, name, tokens=0):
+        '''Blocks until provider name may send a call; returns the seconds waited.'''
+        if not self.enabled:
+            return 0.0
+        wait = self.provider(name).reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, name, tokens=0):
+        if not self.enabled:
+            return 0.0
+        wait = self.provider(name).reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def observe(self, name, status, headers=None):
+        '''Feeds a response status back: 429 backs the provider off, a success lets it recover.'''
+        if not self.enabled:
+            return
+        if status == 429:
+            self.provider(name).throttled(retry_after_seconds(headers))
+        elif status < 400:
+            self.provider(name).succeeded()
+
+    def stats(self):
+        '''{provider: stats} of the providers used so far.'''
+        with self._lock:
+            providers = list(self._providers.values())
+        return {limiter.name: {**limiter.stats, "ratio": limiter.ratio} for limiter in providers}
+
+    def ratios(self):
+        with self._lock:
+            return {(name,): limiter.ratio for name, limiter in self._providers.items()}
+
+
+def request_tokens(request):
+    '''Prompt tokens of an HTTP request, estimated at 4 bytes of JSON body per token.'''
+    try:
+        return len(request.content) // 4
+    except Exception:
+        # Streamed request bodies are not read here
+        return 0
+
+
+rate_limiter = RateLimiter()
+
+
+def event_hooks(provider, asynchronous):
+    '''httpx event hooks that send every request of provider through rate_limiter.'''
+    def on_request(request):
+        rate_limiter.acquire(provider, tokens=request_tokens(request))
+
+    def on_response(response):
+        rate_limiter.observe(provider, response.status_code, response.headers)
+
+    if not asynchronous:
+        return {"request": [on_request], "response": [on_response]}
+
+    async def aon_request(request):
+        await rate_limiter.aacquire(provider, tokens=request_tokens(request))
+
+    async def aon_response(response):
+        on_response(response)
+
+    return {"request": [aon_request], "response": [aon_response]}
+
+WAIT_SECONDS = registry.counter("agent_ratelimit_wait_seconds_total", "Time calls waited for the rate limiter",
+                                ("provider",))
+THROTTLED = registry.counter("agent_ratelimit_throttled_total", "429 responses that backed a provider off",
+                             ("provider",))
+RATIO = registry.gauge("agent_ratelimit_rate_ratio", "Current rate of a provider over its configured rate",
+                       ("provider",), collect=rate_limiter.ratios)
+
+
+if __name__ == "__main__":
+    # Buckets on a simulated clock, then adaptive backoff against a local endpoint that answers 429 over 20 requests/s
+    # python -m agent_core.rate_limit
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import httpx
+
+    now = [0.0]
+    clock = lambda: now[0]
+    limits = parse_limits("openai=60/6000,anthropic=off,itsm=120")
+    assert limits["openai"] == (60, 6000) and limits["anthropic"] == (None, None) and limits["itsm"] == (120, None)
+    assert parse_limits("anthropic=100")["anthropic"] == (100, 40000)
+    limiter = RateLimiter(limits, clock=clock, enabled=True)
+    # A minute's worth of requests goes out at once, the next waits a second
+    assert [limiter.provider("openai").reserve() for _ in range(60)] == [0.0] * 60
+    assert limiter.provider("openai").reserve() == 1.0
+    # A prompt bigger than the whole token bucket waits for its share instead of forever
+    now[0] = 120.0
+    assert limiter.provider("openai").reserve(tokens=9000) == 30.0
+    # 429: paused for Retry-After, then one request a second (half of 120 a minute) with no burst
+    limiter.observe("itsm", 429, {"retry-after": "2"})
+    assert limiter.provider("itsm").ratio == 0.5 and 3.0 <= limiter.provider("itsm").reserve() <= 3.3
+    now[0] += 3.0
+    for _ in range(10):
+        now[0] += RECOVERY_SECONDS
+        limiter.observe("itsm", 200)
+    assert limiter.provider("itsm").ratio == 1.0
+
+    class Limited(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        window = []
+        lock = threading.Lock()
+
+        def do_GET(self):
+            with self.lock:
+                moment = time.monotonic()
+                self.window[:] = [t for t in self.window if moment - t < 1.0] + [moment]
+                over = len(self.window) > 20
+            body = json.dumps({"ok": not over}).encode()
+            self.send_response(429 if over else 200)
+            if over:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Limited)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    limiter = RateLimiter({"itsm": (3000, None)}, enabled=True)
+
+    async def flood(requests=200, concurrency=20):
+        statuses = []
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.server_address[1]}") as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    while True:
+                        await limiter.aacquire("itsm")
+                        response = await client.get("/")
+                        limiter.observe("itsm", response.status_code, response.headers)
+                        statuses.append(response.status_code)
+                        if response.status_code != 429:
+                            return
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(requests)))
+            return statuses, time.perf_counter() - started
+
+    statuses, elapsed = asyncio.run(flood())
+    stats = limiter.stats()["itsm"]
+    assert statuses.count(200) == 200 and stats["throttled"] == statuses.count(429)
+    print(f"rate limit checks passed: 200 requests in {elapsed:.1f}s, {statuses.count(429)} answered 429, "
+          f"waited {stats['wait_seconds']:.1f}s in total, rate now {stats['ratio']:.0%}")
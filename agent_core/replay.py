@@ -0,0 +1,350 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, convert_to_messages
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent_core.wire import estimate_tokens
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Offline replay harness for benchmarking the compiled graph.
+Chat models are replaced by ScriptedChatModel, which answers from a script or a recorded thread
+after a configurable latency, so the graph runs end-to-end with no provider keys and no network.
+run_benchmark drives the graph at several concurrency levels and reports throughput, run latency,
+time to first token (per run and per model call), per-node and per-tool latency, LangGraph step
+counts, the size of the message history and the prompt tokens call_model sent over each run. arun_benchmark does the same with ainvoke, all runs of a
+level as tasks on one event loop, to compare the async path with the thread per run sync path.
+'''
+
+
+class ScriptedChatModel(BaseChatModel):
+    '''
+    Chat model that answers from respond(messages) -> AIMessage | str after latency seconds.
+    Streamed, the answer arrives in word and tool argument chunks token_latency seconds apart;
+    invoke waits for all of them, so both paths take the same total time.
+    The answer depends only on the conversation so far, so one instance can serve any number
+    of concurrent graph runs.
+    '''
+    respond: Callable[[list], Any]
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _answer(self, messages):
+        message = self.respond(messages)
+        return AIMessage(content=message) if isinstance(message, str) else message
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        delay = self.latency + self.token_latency * len(_chunks(message))
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        delay = self.latency + self.token_latency * len(_chunks(message))
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = _chunks(self._answer(messages))
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in chunks:
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = _chunks(self._answer(messages))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in chunks:
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+
+def _chunks(message, args_chunk_chars=16):
+    '''The message as a provider would stream it: a chunk per word, tool call arguments in pieces.'''
+    if isinstance(message.content, str):
+        chunks = [AIMessageChunk(content=word) for word in re.findall(r"\S+\s*", message.content)]
+    else:
+        chunks = [AIMessageChunk(content=message.content)]
+    for index, call in enumerate(message.tool_calls):
+        args = json.dumps(call["args"])
+        pieces = [args[i:i + args_chunk_chars] for i in range(0, len(args), args_chunk_chars)] or [""]
+        for n, piece in enumerate(pieces):
+            chunks.append(AIMessageChunk(content="", tool_call_chunks=[tool_call_chunk(
+                name=call["name"] if n == 0 else None,
+                args=piece,
+                id=call["id"] if n == 0 else None,
+                index=index,
+            )]))
+    return chunks or [AIMessageChunk(content="")]
+
+
+def replay(path):
+    '''
+    respond function that replays the AI messages of a recorded thread, exported from LangGraph
+    as a JSON list of message dicts. The n-th model call of a run gets the n-th recorded AI message.
+    '''
+    with open(path) as f:
+        recorded = [m for m in convert_to_messages(json.load(f)) if isinstance(m, AIMessage)]
+    if not recorded:
+        raise ValueError(f"No AI messages recorded in {path}")
+
+    def respond(messages):
+        turn = sum(isinstance(m, AIMessage) for m in messages)
+        message = recorded[min(turn, len(recorded) - 1)]
+        return AIMessage(content=message.content, tool_calls=message.tool_calls)
+
+    return respond
+
+
+class NodeTimer(BaseCallbackHandler):
+    '''Collects node, router and tool latencies and the highest LangGraph step of one graph run.'''
+
+    # Cheap and lock protected; inline so async runs don't hand every callback to a worker thread
+    run_inline = True
+
+    def __init__(self):
+        self.timings = []
+        self.steps = 0
+        # When the run first showed output: the first streamed token, or the first finished model response
+        self.first_output = None
+        self._started = {}
+        self._first_tokens = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if node is None:
+            return
+        name = kwargs.get("name") or node
+        with self._lock:
+            # Nested subgraph nodes have a checkpoint namespace like "plan_shard:<id>|plan:<id>"
+            if "|" not in metadata.get("langgraph_checkpoint_ns", ""):
+                self.steps = max(self.steps, metadata.get("langgraph_step", 0))
+            self._started[run_id] = (name if name == node else f"{node}.{name}", time.perf_counter())
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        with self._lock:
+            self._started[run_id] = (f"tool:{name}", time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        with self._lock:
+            self._started[run_id] = ("model", time.perf_counter())
+
+    def on_llm_new_token(self, token, *, chunk=None, run_id, **kwargs):
+        # Role-only and closing chunks carry nothing a user would see
+        if not token and not getattr(getattr(chunk, "message", None), "tool_call_chunks", None):
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if run_id in self._started and run_id not in self._first_tokens:
+                self._first_tokens[run_id] = now
+                self.first_output = min(self.first_output or now, now)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        now = time.perf_counter()
+        with self._lock:
+            started = self._started.get(run_id)
+            first_token = self._first_tokens.pop(run_id, now)
+            if started is not None:
+                self.timings.append(("model:first_token", first_token - started[1]))
+                self.first_output = min(self.first_output or now, now)
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._first_tokens.pop(run_id, None)
+        self._finish(run_id)
+
+    def _finish(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                self.timings.append((started[0], time.perf_counter() - started[1]))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def _message_text(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    return content + (json.dumps(tool_calls) if tool_calls else "")
+
+
+def _timed_config(config):
+    timer = NodeTimer()
+    config = dict(config or {})
+    config["callbacks"] = list(config.get("callbacks") or []) + [timer]
+    return timer, config
+
+
+def run_once(graph, inputs, config=None):
+    '''Invoke the graph once and return its timings, step count and final message history size.'''
+    timer, config = _timed_config(config)
+    started = time.perf_counter()
+    state = graph.invoke(inputs, config)
+    return _run_result(timer, state, started)
+
+
+async def arun_once(graph, inputs, config=None):
+    '''run_once with ainvoke.'''
+    timer, config = _timed_config(config)
+    started = time.perf_counter()
+    state = await graph.ainvoke(inputs, config)
+    return _run_result(timer, state, started)
+
+
+def _run_result(timer, state, started):
+    elapsed = time.perf_counter() - started
+    texts = [_message_text(m) for m in state.get("messages", [])]
+    return {
+        "seconds": elapsed,
+        # Time to first token of the run (the whole run when no model was called)
+        "first_token": timer.first_output - started if timer.first_output else elapsed,
+        "steps": timer.steps,
+        "timings": timer.timings,
+        "messages": len(texts),
+        "history_bytes": sum(len(t.encode("utf-8")) for t in texts),
+        "history_tokens": sum(estimate_tokens(t) for t in texts),
+        # Tokens call_model sent over the whole run, when the graph keeps context accounting
+        "prompt_tokens": (state.get("context_usage") or {}).get("prompt_tokens", 0),
+    }
+
+
+def percentile(values, p):
+    '''Nearest-rank percentile; 0.0 for an empty list.'''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(runs, elapsed, concurrency, mode="sync"):
+    nodes = {}
+    for run in runs:
+        for name, seconds in run["timings"]:
+            nodes.setdefault(name, []).append(seconds)
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "runs": len(runs),
+        "elapsed": elapsed,
+        "throughput": len(runs) / elapsed if elapsed else 0.0,
+        "p50": percentile(seconds, 50),
+        "p95": percentile(seconds, 95),
+        "ttft_p50": percentile([run["first_token"] for run in runs], 50),
+        "ttft_p95": percentile([run["first_token"] for run in runs], 95),
+        "steps": sum(run["steps"] for run in runs) / len(runs),
+        "messages": sum(run["messages"] for run in runs) / len(runs),
+        "history_bytes": sum(run["history_bytes"] for run in runs) / len(runs),
+        "history_tokens": sum(run["history_tokens"] for run in runs) / len(runs),
+        "prompt_tokens": sum(run["prompt_tokens"] for run in runs) / len(runs),
+        "nodes": {
+            name: {
+                "calls": len(values) / len(runs),
+                "mean": sum(values) / len(values),
+                "p95": percentile(values, 95),
+            }
+            for name, values in sorted(nodes.items())
+        },
+    }
+
+
+def run_benchmark(graph, make_inputs, config=None, concurrency_levels=(1, 4, 16), runs=16, warmup=1, workers=None):
+    '''
+    Run the graph `runs` times at each concurrency level. make_inputs(n) builds the input of run n.
+    workers caps the threads serving the runs (like a server's worker pool); defaults to the concurrency.
+    Returns one summary per level.
+    '''
+    for n in range(warmup):
+        run_once(graph, make_inputs(n), config)
+
+    results = []
+    for concurrency in concurrency_levels:
+        with ThreadPoolExecutor(min(concurrency, workers or concurrency)) as pool:
+            started = time.perf_counter()
+            level_runs = list(pool.map(lambda n: run_once(graph, make_inputs(n), config), range(runs)))
+            elapsed = time.perf_counter() - started
+        results.append(summarize(level_runs, elapsed, concurrency))
+        logger.info(f"Concurrency {concurrency}: {results[-1]['throughput']:.2f} runs/s")
+    return results
+
+
+def arun_benchmark(graph, make_inputs, config=None, concurrency_levels=(1, 4, 16), runs=16, warmup=1):
+    '''
+    run_benchmark on the async path: each level runs its graph runs as asyncio tasks on one event loop,
+    at most `concurrency` at a time.
+    '''
+    async def level(concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(n):
+            async with semaphore:
+                return await arun_once(graph, make_inputs(n), config)
+
+        for n in range(warmup):
+            await arun_once(graph, make_inputs(n), config)
+        started = time.perf_counter()
+        level_runs = await asyncio.gather(*(one(n) for n in range(runs)))
+        return summarize(level_runs, time.perf_counter() - started, concurrency, mode="async")
+
+    results = []
+    for concurrency in concurrency_levels:
+        results.append(asyncio.run(level(concurrency)))
+        warmup = 0
+        logger.info(f"Concurrency {concurrency} (async): {results[-1]['throughput']:.2f} runs/s")
+    return results
+
+
+def format_report(results):
+    lines = [f"{'mode':>5} {'concurrency':>11} {'runs':>5} {'runs/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+             f"{'ttft p50':>8} {'ttft p95':>8} "
+             f"{'steps':>6} {'messages':>8} {'bytes':>8} {'tokens':>7} {'sent':>7}"]
+    for r in results:
+        lines.append(f"{r['mode']:>5} {r['concurrency']:>11} {r['runs']:>5} {r['throughput']:>8.2f} "
+                     f"{r['p50'] * 1000:>8.0f} {r['p95'] * 1000:>8.0f} {r['ttft_p50'] * 1000:>8.0f} "
+                     f"{r['ttft_p95'] * 1000:>8.0f} {r['steps']:>6.1f} {r['messages']:>8.1f} "
+                     f"{r['history_bytes']:>8.0f} {r['history_tokens']:>7.0f} {r['prompt_tokens']:>7.0f}")
+    for r in results:
+        lines += ["", f"{r['mode']} concurrency {r['concurrency']}", f"{'node':<32} {'calls/run':>9} {'mean ms':>8} {'p95 ms':>8}"]
+        for name, node in r["nodes"].items():
+            lines.append(f"{name:<32} {node['calls']:>9.1f} {node['mean'] * 1000:>8.1f} {node['p95'] * 1000:>8.1f}")
+    return "\n".join(lines)
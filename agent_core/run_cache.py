@@ -0,0 +1,254 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from agent_core.logs import log_event
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Whole-run response cache.
+Most lab threads start from the same canned prompts. The graph looks the first user message of a
+thread up here before doing any work and, on a hit, replays the messages an earlier run produced
+instead of running the workflow again; completed first turns are stored on the way out.
+- Key: the normalized prompt, model_name and a tool data fingerprint. The fingerprint changes when
+  the data the tools read changes, which makes every entry stored under the old fingerprint
+  unreachable; those entries are purged on the next store.
+- Exact matches are a dict lookup. Near duplicates ("Please plan a trip to Paris..." vs "plan a trip to
+  paris ..., we are leaving") are found locally: word bigram shingles without filler words, a MinHash
+  signature per prompt and an LSH band index pick a few candidates, which must reach
+  RUN_CACHE_SIMILARITY exact Jaccard similarity and carry the same salient terms (numbers,
+  hostnames, or whatever the caller passes, such as the parsed trip) - "Paris" and "Rome" never
+  share an answer however similar the sentences are.
+- Bounded: at most RUN_CACHE_MAX_ENTRIES entries, least recently used evicted first, and entries
+  expire after RUN_CACHE_TTL seconds.
+Each graph keeps its own RunCache: entries of one graph never answer the other's prompts, and a
+fingerprint change in one does not drop the other's entries.
+RUN_CACHE=off   (disables the cache; run_cache: false in the graph config skips it for one run)
+RUN_CACHE_MAX_ENTRIES=256
+RUN_CACHE_TTL=86400
+RUN_CACHE_SIMILARITY=0.85
+'''
+
+RUN_CACHE_ENABLED = os.environ.get("RUN_CACHE", "on").lower() not in ("0", "off", "false", "no")
+RUN_CACHE_MAX_ENTRIES = int(os.environ.get("RUN_CACHE_MAX_ENTRIES", "256"))
+RUN_CACHE_TTL = float(os.environ.get("RUN_CACHE_TTL", str(24 * 60 * 60)))
+RUN_CACHE_SIMILARITY = float(os.environ.get("RUN_CACHE_SIMILARITY", "0.85"))
+
+NUM_PERM = 64
+BANDS = 16
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# Words that change how a request is phrased, not what it asks for
+FILLER_WORDS = frozenset(
+    "a an and are be can could for from hello hi i im in is it kindly me my of on our please the thanks "
+    "thank to us we were will with would you".split()
+)
+
+_SALIENT = re.compile(r"\b[\w.-]*\d[\w.-]*\b")
+
+
+def normalize_prompt(text):
+    '''Lower case, punctuation stripped, whitespace collapsed.'''
+    return " ".join(re.sub(r"[^\w]+", " ", str(text).lower()).split())
+
+
+def shingles(normalized):
+    '''Word bigrams of a normalized prompt without filler words (the words themselves for one word prompts).'''
+    words = [word for word in normalized.split() if word not in FILLER_WORDS] or normalized.split()
+    if len(words) < 2:
+        return frozenset(words)
+    return frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+
+def salient_terms(text):
+    '''Tokens with digits - dates, durations, device names - which near duplicates must share exactly.'''
+    return tuple(sorted(set(_SALIENT.findall(str(text).lower()))))
+
+
+def minhash(shingle_set):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingle_set]
+    if not hashes:
+        return (0,) * NUM_PERM
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature):
+    rows = NUM_PERM // BANDS
+    return [(band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class RunCache:
+    def __init__(self, max_entries=RUN_CACHE_MAX_ENTRIES, ttl=RUN_CACHE_TTL, similarity=RUN_CACHE_SIMILARITY,
+                 enabled=RUN_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._index = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _key(normalized, model_name, fingerprint):
+        return (normalized, model_name, fingerprint)
+
+    def get(self, prompt, model_name, fingerprint, terms=None):
+        '''The cached value of prompt (exact, else near duplicate) for model_name and fingerprint, or None.'''
+        if not self.enabled:
+            return None
+        normalized = normalize_prompt(prompt)
+        terms = salient_terms(prompt) if terms is None else terms
+        now = time.monotonic()
+        with self._lock:
+            key = self._key(normalized, model_name, fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["value"]
+
+            shingle_set = shingles(normalized)
+            best, best_similarity = None, self.similarity
+            for candidate in self._candidates(minhash(shingle_set)):
+                entry = self._entries.get(candidate)
+                if (entry is None or entry["expires"] <= now or candidate[1:] != key[1:]
+                        or entry["terms"] != terms):
+                    continue
+                similarity = jaccard(shingle_set, entry["shingles"])
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best)
+            self.stats["near_hits"] += 1
+            log_event(logger, "run_cache_near_hit", similarity=round(best_similarity, 2), prompt=best[0])
+            return self._entries[best]["value"]
+
+    def _candidates(self, signature):
+        found = set()
+        for band in _bands(signature):
+            found.update(self._index.get(band, ()))
+        return found
+
+    def set(self, prompt, model_name, fingerprint, value, terms=None):
+        if not self.enabled:
+            return
+        normalized = normalize_prompt(prompt)
+        shingle_set = shingles(normalized)
+        signature = minhash(shingle_set)
+        key = self._key(normalized, model_name, fingerprint)
+        with self._lock:
+            # Entries of the same model under another fingerprint were computed from data that has changed
+            stale = [k for k in self._entries if k[1] == model_name and k[2] != fingerprint]
+            for k in stale:
+                self._remove(k)
+            if stale:
+                self.stats["invalidations"] += len(stale)
+                logger.info(f"Tool data changed, dropped {len(stale)} cached runs.")
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "value": value,
+                "terms": salient_terms(prompt) if terms is None else terms,
+                "shingles": shingle_set,
+                "signature": signature,
+                "expires": time.monotonic() + self.ttl,
+            }
+            for band in _bands(signature):
+                self._index.setdefault(band, set()).add(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for band in _bands(entry["signature"]):
+            keys = self._index.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[band]
+
+    def invalidate(self, model_name=None):
+        '''Drop every cached run (of model_name) - for data changes the fingerprint cannot see.'''
+        with self._lock:
+            keys = [k for k in self._entries if model_name is None or k[1] == model_name]
+            for k in keys:
+                self._remove(k)
+            self.stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def first_turn_prompt(messages):
+    '''The prompt of a thread's first turn - a single user message with text content - else None.'''
+    humans = [message for message in messages if isinstance(message, HumanMessage)]
+    if len(humans) != 1 or not isinstance(humans[0].content, str):
+        return None
+    return humans[0].content
+
+
+def is_final_answer(message):
+    return isinstance(message, AIMessage) and not message.tool_calls
+
+
+def replay_messages(messages):
+    '''Copies of cached messages without ids, so add_messages appends them to the new thread.'''
+    return [message.model_copy(update={"id": None}) for message in messages]
+
+
+if __name__ == "__main__":
+    # Matching, guard, eviction and invalidation check
+    # python -m agent_core.run_cache
+    cache = RunCache(max_entries=3, enabled=True)
+    paris = "Please plan a trip to Paris, France for 5 days with my family in August. We will be leaving from San Jose, CA"
+    cache.set(paris, "openai", "v1", "paris plan")
+
+    assert cache.get(paris, "openai", "v1") == "paris plan"
+    assert cache.get("please plan a trip to paris france for 5 days with my family in august we will be leaving from san jose ca!!",
+                     "openai", "v1") == "paris plan"
+    near = "Plan a trip to Paris, France for 5 days with my family in August. We are leaving from San Jose, CA"
+    assert cache.get(near, "openai", "v1") == "paris plan", "near duplicate"
+    assert cache.get(paris.replace("Paris, France", "Rome, Italy"), "openai", "v1", terms=("rome",)) is None
+    assert cache.get(paris.replace("5 days", "7 days"), "openai", "v1") is None, "different numbers never match"
+    assert cache.get(paris, "anthropic", "v1") is None
+    assert cache.get(paris, "openai", "v2") is None
+
+    # A store under a new fingerprint drops the runs computed from the old data
+    cache.set(paris, "openai", "v2", "paris plan v2")
+    assert len(cache) == 1 and cache.get(paris, "openai", "v2") == "paris plan v2"
+
+    for n in range(4):
+        cache.set(f"audit pod {n} firmware", "openai", "v2", n)
+    assert len(cache) == 3 and cache.get(paris, "openai", "v2") is None, "least recently used evicted"
+    assert cache.invalidate() == 3 and len(cache) == 0
+    print(f"run cache checks passed: {cache.stats}")
+
+    # Lookup cost with a full cache
+    cache = RunCache(max_entries=10000, enabled=True)
+    for n in range(10000):
+        cache.set(f"please plan a trip to destination {n} for {n % 14} days leaving from city {n * 7}", "openai", "v1", n)
+    started = time.perf_counter()
+    for n in range(1000):
+        cache.get(f"plan a trip to destination {n} for {n % 14} days leaving from city {n * 7} please", "openai", "v1")
+    print(f"near-duplicate lookup with 10000 entries: {(time.perf_counter() - started) * 1000 / 1000:.3f} ms, {cache.stats}")
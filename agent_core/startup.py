@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Cold start budget of a demo's graph modules.
+Every run starts a fresh interpreter in the demo's folder with -X importtime, imports my_agent.agent,
+then builds the graph (get_graph), the way a new server worker does. It reports the median import and graph build times
+and the slowest imports. The exit status is 1 when either median is over its budget, or when a
+module that must only load on first use was imported: a provider SDK, langchain_community or Tavily.
+    python -m agent_core.startup demo02|demo03 [--runs 5] [--import-budget-ms 2000] [--graph-budget-ms 250] [--top 10]
+'''
+
+# Imported by _get_model or the first search, never at startup
+LAZY_MODULES = ("langchain_openai", "langchain_anthropic", "langchain_community", "openai", "anthropic", "tavily")
+
+_PROBE = f'''
+import json, sys, time
+started = time.perf_counter()
+import my_agent.agent as agent
+imported = time.perf_counter()
+agent.get_graph()
+built = time.perf_counter()
+lazy = {LAZY_MODULES!r}
+print(json.dumps({{"import": imported - started, "graph": built - imported,
+                  "eager": sorted({{m.split(".")[0] for m in sys.modules}} & set(lazy))}}))
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMOS = ("demo02", "demo03")
+
+
+def probe(demo):
+    '''One cold start: (timings, -X importtime records as (module, self_us, cumulative_us, depth)).'''
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", LOG_LEVEL="WARNING", METRICS_PORT="", METRICS_FILE="")
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE], cwd=os.path.join(ROOT, demo), env=env,
+                          capture_output=True, text=True)
+    if done.returncode:
+        errors = [line for line in done.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("Importing the graph failed:\n" + "\n".join(errors[-20:]))
+    records = []
+    for line in done.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            # Nesting depth: importtime indents a module two spaces per level below its importer
+            depth = (len(fields[2]) - len(fields[2].lstrip()) - 1) // 2
+            records.append((fields[2].strip(), int(fields[0]), int(fields[1]), depth))
+    return json.loads(done.stdout.strip().splitlines()[-1]), records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start budget of the graph modules")
+    parser.add_argument("demo", choices=DEMOS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=2000)
+    parser.add_argument("--graph-budget-ms", type=float, default=250)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args(argv)
+
+    probes = [probe(args.demo) for _ in range(args.runs)]
+    import_ms = median(timings["import"] for timings, _ in probes) * 1000
+    graph_ms = median(timings["graph"] for timings, _ in probes) * 1000
+    eager = sorted({module for timings, _ in probes for module in timings["eager"]})
+
+    print(f"{args.demo} cold start over {args.runs} runs: import my_agent.agent {import_ms:.0f} ms "
+          f"(budget {args.import_budget_ms:.0f}), get_graph {graph_ms:.0f} ms (budget {args.graph_budget_ms:.0f})")
+    # Slowest imports of the last run made by my_agent.agent and the modules it imports directly
+    records = [r for r in probes[-1][1] if r[3] <= 2 and r[0] != "my_agent.agent"]
+    print(f"\n{'module':<44}{'cumulative ms':>14}{'self ms':>10}")
+    for module, self_us, cumulative_us, _ in sorted(records, key=lambda r: -r[2])[:args.top]:
+        print(f"{module:<44}{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}")
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import took {import_ms:.0f} ms, budget {args.import_budget_ms:.0f} ms")
+    if graph_ms > args.graph_budget_ms:
+        failures.append(f"graph build took {graph_ms:.0f} ms, budget {args.graph_budget_ms:.0f} ms")
+    if eager:
+        failures.append(f"imported at startup instead of on first use: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
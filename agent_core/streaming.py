@@ -0,0 +1,105 @@
+import json
+
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Streamed model calls.
+With stream_tokens on, call_model streams the model response instead of waiting for the whole message.
+- Tokens reach stream_mode="messages" consumers as they arrive; LangGraph picks them up from the
+  model's callbacks.
+- Tool call deltas (tool_call_chunks) are merged by index as they arrive. A tool call is complete
+  when a chunk for a later index arrives or the stream ends; it is then written to the
+  stream_mode="custom" channel as {"event": "tool_call", "name": ..., "args": ..., "id": ...},
+  so a client sees which tool runs next before the response has finished.
+- The chunks add up to the message invoke would return (usage metadata included), and should_continue
+  routes on it unchanged. Routing itself does not start earlier: a conditional edge runs after the
+  agent node returns, the tool nodes need the whole AIMessage, and a speculative tool run before the
+  stream ends could not be taken back (ITSMApproval submits a change request). What streaming moves
+  earlier is the tool_call event, which tells the client what runs next.
+- A stream that breaks after some of its chunks went out writes {"event": "stream_reset", ...} to
+  the custom channel before the error propagates: the client drops the tokens and tool_call events
+  of that model call (its message id), and the router's failover streams the answer again from the
+  next provider. Streamed calls are never hedged - two streams would interleave in the same node.
+'''
+
+
+def _stream_writer():
+    '''LangGraph's custom stream writer, or a no-op outside a graph run.'''
+    try:
+        from langgraph.config import get_stream_writer
+
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda event: None
+
+
+class ToolCallAssembler:
+    '''Merges AIMessageChunks and emits every tool call once its arguments are complete.'''
+
+    def __init__(self, writer=None):
+        self.writer = writer or _stream_writer()
+        self.message = None
+        self._emitted = set()
+
+    def add(self, chunk):
+        self.message = chunk if self.message is None else self.message + chunk
+        indexes = [c.get("index") for c in getattr(chunk, "tool_call_chunks", None) or [] if c.get("index") is not None]
+        if indexes:
+            # Deltas for a later index mean the earlier tool calls are finished
+            self._emit_complete(before=max(indexes))
+
+    def _emit_complete(self, before=None):
+        for call in getattr(self.message, "tool_call_chunks", None) or []:
+            index = call.get("index")
+            if index in self._emitted or (before is not None and (index is None or index >= before)):
+                continue
+            try:
+                args = json.loads(call.get("args") or "{}")
+            except json.JSONDecodeError:
+                # Left to the final message, where it becomes an invalid tool call
+                continue
+            self._emitted.add(index)
+            logger.info(f"Tool call {call.get('name')} complete while the response is still streaming.")
+            self.writer({"event": "tool_call", "name": call.get("name"), "args": args, "id": call.get("id")})
+
+    def result(self):
+        '''The assembled AIMessage; emits the tool calls that were still open when the stream ended.'''
+        if self.message is None:
+            raise ValueError("Model stream ended without any chunks")
+        self._emit_complete()
+        return message_chunk_to_message(self.message) if isinstance(self.message, AIMessageChunk) else self.message
+
+    def reset(self, error):
+        '''Tells the client to drop what this stream sent so far, when it already sent anything.'''
+        if self.message is None:
+            return
+        logger.warning(f"Model stream broke after its first chunks ({error!r}); resetting it.")
+        self.writer({"event": "stream_reset", "id": getattr(self.message, "id", None), "error": repr(error)})
+
+
+def stream_response(model, messages, **kwargs):
+    '''model.invoke, streamed: same resulting message, tokens and tool calls surfaced on the way.'''
+    assembler = ToolCallAssembler()
+    try:
+        for chunk in model.stream(messages, **kwargs):
+            assembler.add(chunk)
+    except Exception as e:
+        assembler.reset(e)
+        raise
+    return assembler.result()
+
+
+async def astream_response(model, messages, **kwargs):
+    '''Async stream_response.'''
+    assembler = ToolCallAssembler()
+    try:
+        async for chunk in model.astream(messages, **kwargs):
+            assembler.add(chunk)
+    except Exception as e:
+        assembler.reset(e)
+        raise
+    return assembler.result()
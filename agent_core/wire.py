@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Compact wire format for tool results.
+Every tool result is re-sent to the model on each later call_model turn, so its size is paid again
+and again. The compact format:
+1. Minified JSON - no indentation or spaces after separators.
+2. Columnar tables - a list of records becomes {"$columns": [...], "$rows": [[...], ...]} so the
+   field names are written once instead of once per record. A field a record does not have is a
+   null cell listed in "$absent" (row index -> column indexes), so it stays apart from a field
+   that is explicitly null.
+3. References - a top level value already present in an earlier tool result is replaced with
+   {"$ref": "<tool name>:<tool_call_id>/<key>"} instead of being embedded again.
+Set TOOL_RESULT_FORMAT=pretty to get the original indented JSON back.
+'''
+
+COMPACT = os.environ.get("TOOL_RESULT_FORMAT", "compact").lower() != "pretty"
+
+# Columnar layout only pays for itself once field names would repeat
+_MIN_TABLE_ROWS = 2
+
+
+def _is_table(value):
+    return isinstance(value, list) and len(value) >= _MIN_TABLE_ROWS and all(isinstance(v, dict) for v in value)
+
+
+def to_columnar(value):
+    '''Recursively turn lists of records into {"$columns", "$rows"} tables. Missing fields are listed in "$absent".'''
+    if _is_table(value):
+        columns = list(dict.fromkeys(key for record in value for key in record))
+        table = {
+            "$columns": columns,
+            "$rows": [[to_columnar(record.get(column)) for column in columns] for record in value],
+        }
+        absent = {}
+        for index, record in enumerate(value):
+            missing = [position for position, column in enumerate(columns) if column not in record]
+            if missing:
+                absent[str(index)] = missing
+        if absent:
+            table["$absent"] = absent
+        return table
+    if isinstance(value, dict):
+        return {key: to_columnar(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_columnar(item) for item in value]
+    return value
+
+
+def from_columnar(value):
+    '''Inverse of to_columnar; the "$absent" cells are left out of the rebuilt records, other nulls are kept.'''
+    if isinstance(value, dict):
+        if "$columns" in value and "$rows" in value:
+            columns = value["$columns"]
+            absent = value.get("$absent") or {}
+            records = []
+            for index, row in enumerate(value["$rows"]):
+                missing = set(absent.get(str(index), ()))
+                records.append({column: from_columnar(cell) for position, (column, cell) in enumerate(zip(columns, row))
+                                if position not in missing})
+            return records
+        return {key: from_columnar(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [from_columnar(item) for item in value]
+    return value
+
+
+def _fingerprint(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _tool_payloads(messages):
+    '''Yield (reference prefix, decoded payload) for earlier JSON object tool results.'''
+    for message in messages or []:
+        if getattr(message, "type", None) != "tool" or not isinstance(message.content, str):
+            continue
+        try:
+            payload = json.loads(message.content)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(payload, dict):
+            yield f"{message.name}:{message.tool_call_id}", from_columnar(payload)
+
+
+def with_references(payload, messages):
+    '''Replace top level values that already appeared under the same key in an earlier tool result.'''
+    if not isinstance(payload, dict) or not messages:
+        return payload
+    seen = {}
+    for prefix, previous in _tool_payloads(messages):
+        for key, value in previous.items():
+            if isinstance(value, (dict, list)) and value:
+                seen[(key, _fingerprint(value))] = f"{prefix}/{key}"
+    if not seen:
+        return payload
+    result = {}
+    for key, value in payload.items():
+        reference = seen.get((key, _fingerprint(value))) if isinstance(value, (dict, list)) and value else None
+        result[key] = {"$ref": reference} if reference else value
+    return result
+
+
+def resolve_references(payload, messages):
+    '''Replace {"$ref": ...} values with the data they point to in earlier tool results.'''
+    if not isinstance(payload, dict):
+        return payload
+    targets = dict(_tool_payloads(messages))
+    result = {}
+    for key, value in payload.items():
+        if isinstance(value, dict) and set(value) == {"$ref"}:
+            prefix, _, ref_key = value["$ref"].rpartition("/")
+            value = targets.get(prefix, {}).get(ref_key, value)
+        result[key] = value
+    return result
+
+
+def encode(payload, messages=None, compact=None):
+    '''Serialise a tool result. messages is the conversation so far, used for references.'''
+    if isinstance(payload, str):
+        # Plain text results (e.g. search errors) are passed through untouched
+        return payload
+    compact = COMPACT if compact is None else compact
+    if not compact:
+        return json.dumps(payload, indent=2)
+    payload = with_references(payload, messages)
+    return json.dumps(to_columnar(payload), separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(content):
+    '''Parse a tool result written by encode back into plain records.'''
+    return from_columnar(json.loads(content))
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken (or its encoding files) not available - fall back to the ~4 characters per token rule
+        return None
+
+
+def estimate_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def measure_tool_messages(messages):
+    '''Bytes and estimated tokens for every tool message in a conversation.'''
+    rows = []
+    for message in messages or []:
+        if getattr(message, "type", None) != "tool":
+            continue
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        rows.append({
+            "tool": message.name,
+            "tool_call_id": message.tool_call_id,
+            "bytes": len(content.encode("utf-8")),
+            "tokens": estimate_tokens(content),
+        })
+    return rows
+
+
+def format_report(rows):
+    lines = [f"{'tool':<20} {'bytes':>10} {'tokens':>10}"]
+    for row in rows:
+        lines.append(f"{row['tool']:<20} {row['bytes']:>10} {row['tokens']:>10}")
+    lines.append(f"{'total':<20} {sum(r['bytes'] for r in rows):>10} {sum(r['tokens'] for r in rows):>10}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python -m agent_core.wire thread_messages.json
+    # Report on a thread's messages exported from LangGraph (a JSON list of message dicts).
+    import sys
+    from langchain_core.messages import convert_to_messages
+
+    if len(sys.argv) != 2:
+        print("usage: python -m agent_core.wire thread_messages.json", file=sys.stderr)
+        sys.exit(2)
+    with open(sys.argv[1]) as f:
+        print(format_report(measure_tool_messages(convert_to_messages(json.load(f)))))
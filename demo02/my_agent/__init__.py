@@ -0,0 +1,8 @@
+import os
+import sys
+from importlib.util import find_spec
+
+# The shared agent core (agent_core/ next to the demos) is installed by langgraph.json ("../agent_core");
+# runs from a checkout - python -m my_agent..., langgraph dev - find it in the repository root
+if find_spec("agent_core") is None:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -19,75 +19,92 @@ if platform.system() == "Windows":
 
 
 # Application Imports
-from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
-from my_agent.utils.nodes import call_model, should_continue
+from langgraph.graph import END
+from my_agent.utils.nodes import (GRAPH, call_model, acall_model, should_continue, extract_intent, route_intent,
+                                  lookup_run_cache, route_run_cache, store_run_cache)
+from agent_core.checkpoint import local_checkpointer
+from agent_core.factory import agent_workflow, graph_factory
+from agent_core.logs import configure_logging
+from agent_core.metrics import MetricsHandler
 from my_agent.utils.state import AgentState
-from my_agent.utils.tools import weather_tool, activity_tool, flight_tool
-from typing import TypedDict, Literal
+from my_agent.utils.tools import registry
+from typing import TypedDict, Literal, Optional
 import logging
 
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging - LOG_LEVEL (default INFO); per turn records are structured, sampled and size capped (agent_core/logs.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Define the config
 class GraphConfig(TypedDict):
-    model_name: Literal["anthropic", "openai"]
-
-# Define a new graph
-workflow = StateGraph(AgentState, config_schema=GraphConfig)
-logger.info("Initialized StateGraph with AgentState and GraphConfig.")
-
-# Define the agent node
-workflow.add_node("agent", call_model)
-logger.info("Added node: agent")
-
-# Define individual nodes for each tool
-weather_action_node = ToolNode([weather_tool])
-activity_action_node = ToolNode([activity_tool])
-flight_action_node = ToolNode([flight_tool])
-workflow.add_node("weather_action", weather_action_node)
-workflow.add_node("activity_action", activity_action_node)
-workflow.add_node("flight_action", flight_action_node)
-
-# Set the entrypoint as `agent`
-# This means that this node is the first one called
-workflow.set_entry_point("agent")
-logger.info("Set entry point to: agent")
-
-# We now add a conditional edge
-workflow.add_conditional_edges(
-    # First, we define the start node. We use `agent`.
-    # This means these are the edges taken after the `agent` node is called.
-    "agent",
-    # Next, we pass in the function that will determine which node is called next.
-    should_continue,
-    # Finally we pass in a mapping.
-    # The keys are the names of the tools (or 'end'), and the values are the names of the nodes to route to.
-    # END is a special node marking that the graph should finish.
-    # What will happen is we will call `should_continue`, and then the output of that
-    # will be matched against the keys in this mapping.
-    # Based on which one it matches, that node will then be called.
-    {
-        "WeatherSearch": "weather_action",
-        "ActivitySearch": "activity_action",
-        "FlightSearch": "flight_action",
-        # Otherwise we finish.
-        "end": END,
-    },
-)
-logger.info("Added conditional edges from 'agent' based on 'should_continue'.")
-# We now add a normal edge from `tools` to `agent`.
-# This means that after `tools` is called, `agent` node is called next.
-workflow.add_edge("weather_action", "agent")
-workflow.add_edge("activity_action", "agent")
-workflow.add_edge("flight_action", "agent")
-
-
-# Finally, we compile it!
-# This compiles it into a LangChain Runnable,
-# meaning you can use it as you would any other runnable
-graph = workflow.compile()
-logger.info("Workflow compiled successfully.")
+    # Preferred provider; the others are failovers ("local" is an OpenAI compatible endpoint such as vLLM)
+    model_name: Literal["anthropic", "openai", "local"]
+    # Send a hedged request to the next provider when a model call runs past the provider's p95 latency
+    hedge_requests: Optional[bool]
+    # Stream the model response: tokens go out as they arrive, completed tool calls as custom stream events
+    stream_tokens: Optional[bool]
+    # "parallel" asks the model for all three searches at once and runs them concurrently in one tool step
+    tool_mode: Optional[Literal["sequential", "parallel"]]
+    # Rule based trip parsing before the first model call (default on); false always starts with the model
+    intent_extraction: Optional[bool]
+    # Prompt token budget for call_model, defaults to the budget of the selected model
+    context_token_budget: Optional[int]
+    # Replay cached runs of the same (or a near duplicate) first prompt; default on, RUN_CACHE=off disables it
+    run_cache: Optional[bool]
+
+
+def build_graph(checkpointer=None):
+    '''Builds and compiles the workflow; checkpointer defaults to the CHECKPOINT_DB saver, if set.'''
+    # Define a new graph from the tool registry (agent_core/factory.py): the agent node, one ToolNode per
+    # search, the combined parallel_tools node - ToolNode runs several tool calls concurrently - and the
+    # conditional edges after `agent`. should_continue returns the name of the called tool, "parallel_tools"
+    # for several calls or "end"; every tool node hands back to `agent`, "end" stores the run and finishes.
+    workflow = agent_workflow(AgentState, GraphConfig, registry, call_model, acall_model, should_continue,
+                              end_node="store_run_cache", parallel_node="parallel_tools")
+    logger.info("Initialized StateGraph with AgentState and GraphConfig, agent and tool nodes.")
+
+    # Whole-run cache - replays the answer of an earlier run of the same request, stores completed first turns
+    workflow.add_node("run_cache", lookup_run_cache)
+    workflow.add_node("store_run_cache", store_run_cache)
+    logger.info("Added nodes: run_cache, store_run_cache")
+
+    # Rule based trip parsing - issues the searches directly when the request can be parsed
+    workflow.add_node("extract_intent", extract_intent)
+    logger.info("Added node: extract_intent")
+
+    # Set the entrypoint as `run_cache`
+    # This means that this node is the first one called; a cache miss continues with `extract_intent`,
+    # which hands over to `agent` when it cannot parse the request
+    workflow.set_entry_point("run_cache")
+    workflow.add_conditional_edges("run_cache", route_run_cache, ["extract_intent", END])
+    workflow.add_conditional_edges("extract_intent", route_intent, ["agent", "parallel_tools"])
+    workflow.add_edge("store_run_cache", END)
+    logger.info("Set entry point to: run_cache")
+
+    # Finally, we compile it!
+    # This compiles it into a LangChain Runnable,
+    # meaning you can use it as you would any other runnable.
+    # MetricsHandler records node, model and tool latency, tokens and payload sizes of every run (agent_core/metrics.py).
+    # With CHECKPOINT_DB set, every step is saved as a delta to a local SQLite file (agent_core/checkpoint.py)
+    compiled = workflow.compile(checkpointer=checkpointer or local_checkpointer()).with_config(
+        callbacks=[MetricsHandler(GRAPH)])
+    logger.info("Workflow compiled successfully.")
+    return compiled
+
+
+# One graph factory per process - a worker serving several graphs builds each once and shares the model pool
+graph_factory.register(GRAPH, build_graph)
+
+
+def get_graph():
+    '''The compiled graph, built on first use.'''
+    return graph_factory.get(GRAPH)
+
+
+def __getattr__(name):
+    # `graph` (langgraph.json, `from my_agent.agent import graph`) is compiled when it is first looked up,
+    # not when the module is imported
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
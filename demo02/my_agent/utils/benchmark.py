@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Offline benchmark of the vacation planner graph.
+The chat model is a ScriptedChatModel that plans a trip the way the prompts ask for it (one search
+at a time, or all three at once in parallel mode) and Tavily is replaced by FakeSearch, so the graph
+runs end-to-end with no API keys and no network. Each concurrency level starts with an empty
+in-memory search cache (and, with --run-cache, an empty run cache; prompts are phrased three ways
+so repeats of a trip hit it exactly or as near duplicates). --mode sync async runs every level on both execution paths: invoke with a
+thread per run (capped by --workers, like a server's worker pool) and ainvoke with all runs on one event loop.
+    python -m my_agent.utils.benchmark [--mode sync async] [--workers 8] [--tool-mode parallel] [--concurrency 1 4 16] [--runs 16]
+                                       [--model-latency 0.1] [--token-latency 0.005] [--stream]
+                                       [--search-latency 0.2] [--no-cache] [--no-intent] [--run-cache]
+                                       [--replay thread_messages.json] [--json results.json] [--metrics metrics.prom]
+'''
+
+DESTINATIONS = ["Paris, France", "Rome, Italy", "Tokyo, Japan", "Lisbon, Portugal"]
+SEARCH_ORDER = ["WeatherSearch", "ActivitySearch", "FlightSearch"]
+# The same request as different users type it
+PHRASINGS = [
+    "Please plan a trip to {destination} for 5 days with my family in August. We will be leaving from San Jose, CA",
+    "Plan a trip to {destination} for 5 days with my family in August. We are leaving from San Jose, CA",
+    "please plan a trip to {destination} for 5 days with my family in August, we will be leaving from San Jose, CA",
+]
+
+
+class FakeSearch:
+    '''Stand-in for TavilySearchResults: canned results after a fixed latency.'''
+
+    def __init__(self, latency=0.2, max_results=2):
+        self.latency = latency
+        self.max_results = max_results
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, query, config=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._results(query)
+
+    async def ainvoke(self, query, config=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._results(query)
+
+    def _results(self, query):
+        slug = re.sub(r"\W+", "-", query.lower()).strip("-")
+        return [
+            {"url": f"https://example.com/{slug}/{n}", "content": f"Result {n} for {query}. " * 8}
+            for n in range(self.max_results)
+        ]
+
+
+def trip_prompt(n):
+    phrasing = PHRASINGS[(n // len(DESTINATIONS)) % len(PHRASINGS)]
+    return phrasing.format(destination=DESTINATIONS[n % len(DESTINATIONS)])
+
+
+def scripted_planner(tool_mode):
+    '''respond function for the planner: the searches the system prompt asks for, then a plan.'''
+    def respond(messages):
+        # Only the current turn counts - everything after the latest user message
+        turn = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        request = messages[turn].content
+        match = re.search(r"trip to (.+?) for", request)
+        query = f"{match.group(1) if match else request} in August"
+        done = {m.name for m in messages[turn:] if isinstance(m, ToolMessage)}
+        pending = [name for name in SEARCH_ORDER if name not in done]
+        if not pending:
+            return f"Here is your 5 day plan for {query}: pack light clothes, book the morning flight."
+        if tool_mode != "parallel":
+            pending = pending[:1]
+        return AIMessage(content="", tool_calls=[
+            {"name": name, "args": {"__arg1": query}, "id": f"call_{name}"} for name in pending
+        ])
+    return respond
+
+
+def main(argv=None):
+    from agent_core.replay import ScriptedChatModel, arun_benchmark, format_report, replay, run_benchmark
+
+    parser = argparse.ArgumentParser(description="Offline benchmark of the vacation planner graph")
+    parser.add_argument("--mode", choices=["sync", "async"], nargs="+", default=["sync"],
+                        help="execution paths to benchmark: invoke on threads, ainvoke on an event loop")
+    parser.add_argument("--workers", type=int, help="cap on the threads serving sync runs (default: the concurrency)")
+    parser.add_argument("--tool-mode", choices=["sequential", "parallel"], default="sequential")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--runs", type=int, default=16, help="graph runs per concurrency level")
+    parser.add_argument("--model-latency", type=float, default=0.1, help="seconds until a model call's first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--stream", action="store_true", help="stream model responses (stream_tokens)")
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--no-cache", action="store_true", help="disable the search cache")
+    parser.add_argument("--run-cache", action="store_true", help="enable the whole-run cache (off by default)")
+    parser.add_argument("--no-intent", action="store_true", help="always start with the model instead of the trip parser")
+    parser.add_argument("--replay", help="replay the AI messages of a recorded thread instead of the script")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--metrics", help="write the Prometheus metrics the graph recorded to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    # Nothing reaches a provider; the placeholder keys only satisfy client construction
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("TAVILY_API_KEY", "offline-benchmark")
+    from my_agent.agent import graph
+    from my_agent.utils import nodes, tools
+    from agent_core.run_cache import RunCache
+    from my_agent.utils.search_cache import SearchCache
+    logging.getLogger().setLevel(args.log_level)
+
+    respond = replay(args.replay) if args.replay else scripted_planner(args.tool_mode)
+    model = ScriptedChatModel(respond=respond, latency=args.model_latency, token_latency=args.token_latency)
+    nodes._get_model = lambda model_name: model
+    search = FakeSearch(latency=args.search_latency)
+    tools._tavily_search = search
+    config = {"configurable": {"model_name": "openai", "tool_mode": args.tool_mode,
+                               "intent_extraction": not args.no_intent, "stream_tokens": args.stream,
+                               "run_cache": args.run_cache}}
+
+    def make_inputs(n):
+        return {"messages": [HumanMessage(content=trip_prompt(n))]}
+
+    results = []
+    for mode in args.mode:
+        for concurrency in args.concurrency:
+            tools.search_cache = SearchCache(":memory:", max_entries=0 if args.no_cache else 10000)
+            nodes.run_cache = RunCache(enabled=True)
+            calls = search.calls
+            if mode == "async":
+                results += arun_benchmark(graph, make_inputs, config, [concurrency], args.runs, warmup=0)
+            else:
+                results += run_benchmark(graph, make_inputs, config, [concurrency], args.runs, warmup=0,
+                                         workers=args.workers)
+            results[-1]["search_calls"] = search.calls - calls
+            results[-1]["run_cache"] = {key: nodes.run_cache.stats[key] for key in ("hits", "near_hits", "misses")}
+
+    print(f"demo02 tool_mode={args.tool_mode} intent_extraction={not args.no_intent} stream={args.stream} "
+          f"model latency {args.model_latency}s + {args.token_latency}s per chunk, "
+          f"search latency {args.search_latency}s, cache {'off' if args.no_cache else 'on'}, "
+          f"run cache {'on' if args.run_cache else 'off'}")
+    print(format_report(results))
+    print("\nsearch calls per level: " + ", ".join(f"{r['mode']} {r['concurrency']}: {r['search_calls']}" for r in results))
+    if args.run_cache:
+        print("run cache hits / near duplicate hits / misses per level: " + ", ".join(
+            f"{r['mode']} {r['concurrency']}: {r['run_cache']['hits']}/{r['run_cache']['near_hits']}/{r['run_cache']['misses']}"
+            for r in results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"demo": "demo02", "args": vars(args), "results": results}, f, indent=2)
+    if args.metrics:
+        from agent_core.metrics import write_metrics_file
+
+        write_metrics_file(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
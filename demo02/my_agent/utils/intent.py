@@ -0,0 +1,222 @@
+import calendar
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Rule based trip intent extraction.
+Most requests look like "Plan a trip to Paris, France for 5 days in August, leaving from San Jose, CA".
+parse_trip_request pulls the destination, origin, absolute start date and duration out of such a
+request without a model call, so the three searches can be issued straight away with canonical
+queries (which also makes their search cache keys identical across phrasings). Anything it cannot
+parse with confidence returns None and the request goes to the model as before.
+'''
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+WEEKDAYS = {name.lower(): number for number, name in enumerate(calendar.day_name)}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fourteen": 14,
+    "couple of": 2, "a couple of": 2, "few": 3, "a few": 3,
+}
+_NUMBER = r"(\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+_UNIT_DAYS = {"day": 1, "night": 1, "week": 7, "fortnight": 14}
+
+# A place is a run of capitalized words, optionally separated by commas ("Paris, France", "San Jose, CA")
+_PLACE = r"([A-Z][\w'.-]*(?:(?:,\s*|\s+)(?:[A-Z][\w'.-]*|de|del|la|le))*)"
+_DESTINATION = re.compile(r"\b(?i:to|visit|visiting|explore|exploring)\s+" + _PLACE)
+_ORIGIN = re.compile(r"\b(?i:from|out of)\s+" + _PLACE)
+
+_RELATIVE_START = re.compile(r"\bin\s+" + _NUMBER + r"\s+(day|week|month)s?\b", re.I)
+_DURATION = re.compile(r"\b(?:for\s+)?" + _NUMBER + r"[\s-]*(day|night|week|fortnight)s?\b", re.I)
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_MONTH_DAY = re.compile(r"\b([A-Za-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?\b")
+_DAY_MONTH = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([A-Za-z]+)(?:,?\s+(\d{4}))?\b")
+_MONTH_ONLY = re.compile(r"\b(?:in|during|for|this|next)\s+([A-Za-z]+)(?:\s+(\d{4}))?\b", re.I)
+_NEXT_WEEKDAY = re.compile(r"\bnext\s+(" + "|".join(WEEKDAYS) + r")\b", re.I)
+
+
+@dataclass(frozen=True)
+class TripIntent:
+    destination: str
+    start_date: date
+    duration_days: int
+    origin: Optional[str] = None
+
+    @property
+    def end_date(self):
+        return self.start_date + timedelta(days=self.duration_days - 1)
+
+    def search_queries(self):
+        '''Canonical query per search tool.'''
+        dates = f"{self.start_date.isoformat()} to {self.end_date.isoformat()}"
+        flight = f"{self.origin} to {self.destination}" if self.origin else self.destination
+        return {
+            "WeatherSearch": f"{self.destination}, {dates}",
+            "ActivitySearch": f"{self.destination}, {self.duration_days} days",
+            "FlightSearch": f"{flight}, departing {self.start_date.isoformat()}, returning {self.end_date.isoformat()}",
+        }
+
+    def describe(self):
+        origin = f" from {self.origin}" if self.origin else ""
+        return (f"Trip to {self.destination}{origin}, {self.start_date.isoformat()} to {self.end_date.isoformat()} "
+                f"({self.duration_days} days).")
+
+
+def _number(text):
+    text = text.lower()
+    return int(text) if text.isdigit() else NUMBER_WORDS[text]
+
+
+def _month(word):
+    '''Month number for a month name or abbreviation; "may" only counts when capitalized.'''
+    if word.lower() == "may" and word != "May":
+        return None
+    return MONTHS.get(word.lower().rstrip("."))
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _next_occurrence(month, day, today, year=None):
+    '''The given month/day on or after today, unless the year is spelled out.'''
+    try:
+        if year:
+            return date(int(year), month, day)
+        candidate = date(today.year, month, day)
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def _clean_place(place):
+    '''Trim trailing words that are dates rather than places ("Paris August" -> "Paris").'''
+    # A sentence boundary ends the place ("Paris. We leave..."), abbreviations like "St. Louis" do not
+    place = re.split(r"(?<!\bSt)(?<!\bMt)(?<!\bFt)\.\s", place)[0]
+    words = re.split(r"(,\s*|\s+)", place.strip(" ,."))
+    while words and (words[-1].lower().rstrip(".") in MONTHS or words[-1].lower() in WEEKDAYS or not words[-1].strip(", ")):
+        words.pop()
+    place = "".join(words).strip(" ,.")
+    if not place or place.split()[0].lower().rstrip(",.") in MONTHS:
+        return None
+    return place
+
+
+def _find_place(pattern, text):
+    for match in pattern.finditer(text):
+        place = _clean_place(match.group(1))
+        if place:
+            return place, match.span()
+    return None, None
+
+
+def _start_date(text, today):
+    '''Absolute start date and the span it was read from, or (None, None).'''
+    match = _ISO_DATE.search(text)
+    if match:
+        try:
+            return date(*map(int, match.groups())), match.span()
+        except ValueError:
+            pass
+
+    match = _RELATIVE_START.search(text)
+    if match:
+        amount, unit = _number(match.group(1)), match.group(2).lower()
+        if unit == "month":
+            return _add_months(today, amount), match.span()
+        return today + timedelta(days=amount * (7 if unit == "week" else 1)), match.span()
+
+    for pattern, month_group, day_group in ((_MONTH_DAY, 1, 2), (_DAY_MONTH, 2, 1)):
+        for match in pattern.finditer(text):
+            month = _month(match.group(month_group))
+            if month:
+                start = _next_occurrence(month, int(match.group(day_group)), today, match.group(3))
+                if start:
+                    return start, match.span()
+
+    lowered = text.lower()
+    if re.search(r"\btomorrow\b", lowered):
+        return today + timedelta(days=1), None
+    match = _NEXT_WEEKDAY.search(text)
+    if match:
+        days = (WEEKDAYS[match.group(1).lower()] - today.weekday()) % 7 or 7
+        return today + timedelta(days=days), match.span()
+    if re.search(r"\bnext weekend\b", lowered):
+        return today + timedelta(days=(5 - today.weekday()) % 7 + 7), None
+    if re.search(r"\bthis weekend\b", lowered):
+        return today + timedelta(days=(5 - today.weekday()) % 7), None
+    if re.search(r"\bnext week\b", lowered):
+        return today + timedelta(days=7 - today.weekday()), None
+    if re.search(r"\bnext month\b", lowered):
+        return _add_months(today.replace(day=1), 1), None
+
+    for match in _MONTH_ONLY.finditer(text):
+        month = _month(match.group(1))
+        if month:
+            if match.group(2):
+                return date(int(match.group(2)), month, 1), match.span()
+            if month == today.month:
+                return today, match.span()
+            return _next_occurrence(month, 1, today), match.span()
+    return None, None
+
+
+def _duration_days(text):
+    match = _DURATION.search(text)
+    if match:
+        amount, unit = _number(match.group(1)), match.group(2).lower()
+        days = amount * _UNIT_DAYS[unit] + (1 if unit == "night" else 0)
+        return days if 0 < days <= 90 else None
+    if re.search(r"\bweekend\b", text, re.I):
+        return 3
+    return None
+
+
+def parse_trip_request(text, today=None):
+    '''TripIntent for a trip request, or None when any of destination, start date or duration is unclear.'''
+    today = today or date.today()
+    if not text:
+        return None
+
+    destination, _ = _find_place(_DESTINATION, text)
+    if not destination:
+        return None
+    origin, _ = _find_place(_ORIGIN, text)
+    if origin == destination:
+        origin = None
+
+    start, span = _start_date(text, today)
+    if start is None or start < today:
+        return None
+    # A relative start ("in 10 days") must not be read again as the duration
+    remaining = text[:span[0]] + " " + text[span[1]:] if span else text
+    duration = _duration_days(remaining)
+    if duration is None:
+        return None
+
+    intent = TripIntent(destination=destination, start_date=start, duration_days=duration, origin=origin)
+    logger.info(f"Parsed trip intent: {intent.describe()}")
+    return intent
+
+
+if __name__ == "__main__":
+    # python -m my_agent.utils.intent "Please plan a trip to Paris, France for 5 days in August"
+    import sys
+
+    intent = parse_trip_request(" ".join(sys.argv[1:]))
+    print(intent.describe() if intent else "Not parsed - the request would go to the model.")
+    if intent:
+        for tool, query in intent.search_queries().items():
+            print(f"{tool}: {query}")
@@ -1,10 +1,17 @@
-from functools import lru_cache
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
-from my_agent.utils.tools import tools
+from my_agent.utils.tools import registry, tool_data_fingerprint, tools
 from langgraph.prebuilt import ToolNode
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from my_agent.utils.intent import parse_trip_request
+from agent_core.context import build_context, message_tokens, token_budget
+from agent_core.prompt_cache import bind_cached_tools, cache_usage, cached_system_message, with_history_breakpoint
+from agent_core.run_cache import (RunCache, first_turn_prompt, is_final_answer, normalize_prompt, replay_messages,
+                                  salient_terms)
+from agent_core.factory import make_call_model, make_should_continue
+from agent_core.model_pool import model_pool
+from langgraph.graph import END
+from agent_core.logs import log_event
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -15,46 +22,109 @@ TAVILY_API_KEY = {"key is a variable in the deployment"}
 You don't need to have all 2 AI as a service vendors to run this lab, but I wanted to give the option.
 '''
 
-@lru_cache(maxsize=4)
+# Graph name for metrics and the shared model pool
+GRAPH = "demo02"
+
+# Routes requests sharing the static prompt prefix to the same OpenAI prompt cache
+PROMPT_CACHE_KEY = "demo02-vacation-planner"
+
+# This graph's whole-run cache (agent_core/run_cache.py)
+run_cache = RunCache()
+
 def _get_model(model_name: str):
     '''Primary Open AI model with a Anthropic Failover - This could be a local vLLM installation.
        This function allows for the Langraph Studio Assistant to select used model.
+       Failover between the providers is done by model_router in call_model.
     '''
-    if model_name == "openai":
-        model = ChatOpenAI(temperature=0, model="gpt-4.1")
-    elif model_name == "anthropic":
-        model =  ChatAnthropic(temperature=0, model="claude-3-7-sonnet-latest")
-    else:
-        # Failover incase a model wasn't selected in the Studio Assistant and try to use this as a default.
-        model = ChatOpenAI(temperature=0, model="gpt-4.1")
-    model = model.bind_tools(tools)
-    return model
-
-
-def should_continue(state):
-    logger.info("Entering should_continue function.")
-    messages = state["messages"]
-    last_message = messages[-1]
-    
-    if not last_message.tool_calls:
-        logger.info("No tool calls found in the last message. Returning 'end'.")
-        return "end"
-
-    tool_call = last_message.tool_calls[0]
-
-    # If it's a dict, extract the name safely
-    if isinstance(tool_call, dict):
-        tool_name = tool_call.get("name")
-    else:
-        tool_name = tool_call.name
-
-    logger.info(f"Tool name extracted: {tool_name}")
-
-    if tool_name in ["WeatherSearch", "ActivitySearch", "FlightSearch"]:
-        return tool_name
-    else:
-        logger.warning(f"Unexpected tool call: {tool_name}. Ending execution.")
-        return "end"
+    # The chat model (and its HTTP connections) comes from the process-wide pool, shared with every graph
+    # the process serves; the tools are bound with a cache breakpoint (Anthropic) or prompt cache key (OpenAI)
+    return model_pool.model(model_name, GRAPH,
+                            bind=lambda model: bind_cached_tools(model, model_name, tools, PROMPT_CACHE_KEY))
+
+
+# Routes on the tool call of the model: the tool's node, parallel_tools for several calls, else "end"
+should_continue = make_should_continue(GRAPH, registry, parallel_node="parallel_tools")
+
+
+def _run_cache_terms(prompt):
+    '''Terms a near duplicate must share: the parsed trip; a prompt the rules cannot parse only matches itself.'''
+    intent = parse_trip_request(prompt)
+    if intent is None:
+        return (normalize_prompt(prompt),)
+    places = tuple(normalize_prompt(place) for place in (intent.destination, intent.origin) if place)
+    return salient_terms(prompt) + places + (intent.start_date.isoformat(), str(intent.duration_days))
+
+
+def _run_cache_enabled(config):
+    configurable = config.get('configurable', {}) if config else {}
+    return configurable.get("run_cache", True), configurable.get("model_name", "openai")
+
+
+# Whole-run cache - a first turn answered before (same or near duplicate prompt) is replayed without any work
+def lookup_run_cache(state, config):
+    enabled, model_name = _run_cache_enabled(config)
+    messages = state.get("messages", [])
+    prompt = first_turn_prompt(messages)
+    if not enabled or prompt is None or not isinstance(messages[-1], HumanMessage):
+        return {}
+
+    fingerprint = tool_data_fingerprint()
+    cached = run_cache.get(prompt, model_name, fingerprint, terms=_run_cache_terms(prompt))
+    if cached is None:
+        return {"run_fingerprint": fingerprint}
+    log_event(logger, "run_cache_hit", messages=len(cached["messages"]))
+    return {"messages": replay_messages(cached["messages"])}
+
+
+def route_run_cache(state):
+    if is_final_answer(state["messages"][-1]):
+        return END
+    return "extract_intent"
+
+
+def store_run_cache(state, config):
+    '''Stores a completed first turn under the fingerprint of the data it was computed from.'''
+    enabled, model_name = _run_cache_enabled(config)
+    messages = state.get("messages", [])
+    prompt = first_turn_prompt(messages)
+    fingerprint = state.get("run_fingerprint")
+    if not enabled or prompt is None or fingerprint is None or not is_final_answer(messages[-1]):
+        return {}
+
+    start = next(i for i, message in enumerate(messages) if isinstance(message, HumanMessage)) + 1
+    run_cache.set(prompt, model_name, fingerprint, {"messages": list(messages[start:])}, terms=_run_cache_terms(prompt))
+    log_event(logger, "run_cache_store", entries=len(run_cache))
+    return {"run_fingerprint": None}
+
+
+# Deterministic first turn - a trip request the rules can parse goes straight to the three searches
+def extract_intent(state, config):
+    configurable = config.get('configurable', {}) if config else {}
+    if not configurable.get("intent_extraction", True):
+        return {}
+
+    messages = state.get("messages", [])
+    if not messages or not isinstance(messages[-1], HumanMessage) or not isinstance(messages[-1].content, str):
+        return {}
+
+    intent = parse_trip_request(messages[-1].content)
+    if intent is None:
+        log_event(logger, "intent", parsed=False)
+        return {}
+
+    tool_calls = [
+        {"name": tool_name, "args": {"__arg1": query}, "id": f"call_{uuid.uuid4().hex[:24]}"}
+        for tool_name, query in intent.search_queries().items()
+    ]
+    log_event(logger, "intent", parsed=True, searches=len(tool_calls))
+    return {"messages": [AIMessage(content=intent.describe(), tool_calls=tool_calls)]}
+
+
+def route_intent(state):
+    last_message = state["messages"][-1]
+    if isinstance(last_message, AIMessage) and last_message.tool_calls:
+        return "parallel_tools"
+    return "agent"
 
 
 system_prompt = """You are a helpful vacation planning assistant.
@@ -68,39 +138,81 @@ To fulfill the request, you MUST use the available tools in the following order:
 
 IMPORTANT: You must call the tools ONE AT A TIME in the specified order. Wait for the result of one tool call before making the next one.
 
+Tool results may use a compact table layout: {"$columns": [...], "$rows": [[...], ...]} where each row lists its values in column order and null means the field is empty or absent.
+
 Once you have gathered information from all three tools, synthesize the results into a comprehensive plan for the user.
 
 !Important: Only provide information that pertains to planning this trip.  No other topics should be referenced.
 """
 
 
-# Define the function that calls the model
-def call_model(state, config):
-    logger.info("Entering call_model function.")
-    
+parallel_system_prompt = """You are a helpful vacation planning assistant.
+Your goal is to help the user plan their trip based on their request.
+The user will provide a destination, a start time (which might be relative, like 'in 10 days'), and a duration (e.g., 'for 5 days').
+
+To fulfill the request, you MUST use all three available tools, and you MUST call them together in a single response:
+- 'WeatherSearch' to find the weather forecast for the destination around the specified start date.
+- 'ActivitySearch' to find potential things to do or sights to see at the destination suitable for the trip's duration.
+- 'FlightSearch' to find information about available flights to the destination around the specified start date.
+
+IMPORTANT: The three searches are independent. Issue all three tool calls at once in your first response; they run in parallel.
+
+Tool results may use a compact table layout: {"$columns": [...], "$rows": [[...], ...]} where each row lists its values in column order and null means the field is empty or absent.
+
+Once you have gathered information from all three tools, synthesize the results into a comprehensive plan for the user.
+
+!Important: Only provide information that pertains to planning this trip.  No other topics should be referenced.
+"""
+
+
+def _router_options(configurable):
+    '''model_router options from the graph config: hedging and token streaming.'''
+    return {
+        "hedge": bool(configurable.get("hedge_requests", False)),
+        "stream": bool(configurable.get("stream_tokens", False)),
+    }
+
+
+def _prepare_call(state, config):
+    '''Shared by call_model and acall_model: (model_name, router options, messages_for, usage).'''
     # Get the current messages from the state
     current_messages = state.get("messages", [])
-    logger.debug(f"Current messages count: {len(current_messages)}")
-    
-    # Create system message
-    system_message = SystemMessage(content=system_prompt)
-    messages_with_system = [system_message] + list(current_messages)
-    
+
     # Get model configuration
     configurable = config.get('configurable', {}) if config else {}
     model_name = configurable.get("model_name", "openai")
-    logger.info(f"Using model: {model_name}")
-    
-    try:
-        model = _get_model(model_name)
-        logger.info(f"Model loaded successfully: {model}")
-        
-        response = model.invoke(messages_with_system)
-        logger.info(f"Model response received. Type: {type(response)}")
-        logger.debug(f"Response has tool_calls: {hasattr(response, 'tool_calls') and bool(response.tool_calls)}")
-        
-        return {"messages": [response]}
-        
-    except Exception as e:
-        logger.error(f"Error in call_model: {str(e)}")
-        raise
+    tool_mode = configurable.get("tool_mode", "sequential")
+
+    # Fit the history into the model's token budget - consumed tool results become digests, old turns are trimmed
+    prompt = parallel_system_prompt if tool_mode == "parallel" else system_prompt
+    reserved_tokens = message_tokens(SystemMessage(content=prompt))
+    prompt_messages, note, usage = build_context(current_messages, token_budget(configurable), reserved_tokens)
+    log_event(logger, "context", model=model_name, prompt_tokens=usage['prompt_tokens'],
+              history_tokens=usage['history_tokens'], digested=usage['digested'], trimmed_turns=usage['trimmed_turns'])
+
+    # Create system message - the static prompt stays a cacheable prefix, the per call note follows it.
+    # Built per provider, since a failover can send the same turn to a provider with another cache layout
+    def messages_for(provider):
+        fitted_messages, fitted_note = prompt_messages, note
+        budget = token_budget(configurable, provider)
+        if usage["prompt_tokens"] > budget:
+            # A failover provider with a smaller context window gets the history fitted to its own budget
+            fitted_messages, fitted_note, _ = build_context(current_messages, budget, reserved_tokens)
+        system_message = cached_system_message(provider, prompt, fitted_note)
+        return [system_message] + with_history_breakpoint(provider, fitted_messages)
+
+    return model_name, _router_options(configurable), messages_for, usage
+
+
+def _model_update(response, usage):
+    usage.update(cache_usage(response))
+    log_event(logger, "model_response", tool_calls=lambda: [call["name"] for call in response.tool_calls],
+              input_tokens=usage['input_tokens'], cache_read_tokens=usage['cache_read_tokens'],
+              cache_creation_tokens=usage['cache_creation_tokens'])
+    return {"messages": [response], "context_usage": usage}
+
+
+# Define the functions that call the model - sync and async, through model_router and the shared model pool.
+# _get_model is looked up per call, so a benchmark can swap it for a scripted model
+call_model, acall_model = make_call_model(GRAPH, _prepare_call, _model_update,
+                                          lambda provider: _get_model(provider))
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Persistent search cache in front of Tavily.
+Results are stored in a local SQLite file with a per-tool TTL (weather goes stale quickly,
+activities hardly at all) and evicted least-recently-used once the cache holds max_entries.
+Queries are normalized so "Paris in August" and "paris, in  August" share one entry.
+SEARCH_CACHE_PATH=...   (defaults to a file in the system temp directory)
+SEARCH_CACHE_MAX_ENTRIES=...
+'''
+
+# Seconds a cached result stays fresh, per tool
+TTLS = {
+    "weather": 60 * 60,
+    "flights": 6 * 60 * 60,
+    "activities": 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", os.path.join(tempfile.gettempdir(), "demo02_search_cache.sqlite3"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+
+
+def normalize_query(query):
+    '''Lower case, punctuation stripped, whitespace collapsed.'''
+    return " ".join(re.sub(r"[^\w]+", " ", str(query).lower()).split())
+
+
+class SearchCache:
+    def __init__(self, path=SEARCH_CACHE_PATH, max_entries=SEARCH_CACHE_MAX_ENTRIES, ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "errors": 0}
+        self._lock = threading.Lock()
+        try:
+            self._db = self._connect(path)
+        except sqlite3.Error as e:
+            # Read-only or missing file system - keep working with an in-memory cache
+            logger.warning(f"Search cache at {path} unavailable ({e}); using an in-memory cache.")
+            self.path = ":memory:"
+            self._db = self._connect(self.path)
+
+    @staticmethod
+    def _connect(path):
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY, tool TEXT, value TEXT, expires_at REAL, last_access REAL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS search_cache_lru ON search_cache (last_access)")
+        return db
+
+    @staticmethod
+    def key(tool, query):
+        return f"{tool}:{normalize_query(query)}"
+
+    def get(self, tool, query):
+        '''Cached result, or None on a miss or expired entry.'''
+        key = self.key(tool, query)
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.stats["misses"] += 1
+                    return None
+                value, expires_at = row
+                if expires_at <= now:
+                    self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    self.stats["expired"] += 1
+                    self.stats["misses"] += 1
+                    return None
+                self._db.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+                self.stats["hits"] += 1
+            except sqlite3.Error as e:
+                logger.warning(f"Search cache read failed: {e}")
+                self.stats["errors"] += 1
+                return None
+        return json.loads(value)
+
+    def set(self, tool, query, value):
+        now = time.time()
+        ttl = self.ttls.get(tool, DEFAULT_TTL)
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, tool, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (self.key(tool, query), tool, json.dumps(value), now + ttl, now),
+                )
+                self._evict()
+            except sqlite3.Error as e:
+                logger.warning(f"Search cache write failed: {e}")
+                self.stats["errors"] += 1
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            self.stats["evictions"] += overflow
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM search_cache")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            (stats["entries"],) = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+search_cache = SearchCache()
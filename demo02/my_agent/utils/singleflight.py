@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Single-flight request coalescing.
+When many graph runs ask for the same search at the same moment, only the first caller (the
+leader) runs it; every other caller with the same key waits for the leader's result instead of
+sending its own request. In-flight calls are shared between threads and asyncio tasks alike,
+since both wait on the same concurrent.futures.Future.
+A leader that is cancelled (its client disconnected) or interrupted does not pass that on: its
+followers take the call over, the first of them as the new leader. A follower that is cancelled
+only stops waiting.
+'''
+
+
+class _LeaderGone(Exception):
+    '''Outcome of a call whose leader was cancelled or interrupted; its followers run it again.'''
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "shared": 0}
+
+    def _join(self, key):
+        '''Returns (future, is_leader).'''
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats["shared"] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        '''Run fn() once for all concurrent callers of key (threads).'''
+        while True:
+            future, is_leader = self._join(key)
+            if is_leader:
+                break
+            logger.debug(f"Joining in-flight call for {key}")
+            try:
+                return future.result()
+            except _LeaderGone:
+                continue
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_LeaderGone())
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def ado(self, key, coro_fn):
+        '''Await coro_fn() once for all concurrent callers of key (asyncio tasks or threads).'''
+        while True:
+            future, is_leader = self._join(key)
+            if is_leader:
+                break
+            logger.debug(f"Joining in-flight call for {key}")
+            try:
+                # Shielded: cancelling this follower must not cancel the future every other caller waits on
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderGone:
+                continue
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: not the call's outcome, so a follower runs it instead
+            self._finish(key, future, error=_LeaderGone())
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+
+single_flight = SingleFlight()
+
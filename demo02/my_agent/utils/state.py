@@ -1,7 +1,12 @@
 from langgraph.graph import add_messages
 from langchain_core.messages import BaseMessage
-from typing import TypedDict, Annotated, Sequence
+from typing import TypedDict, Annotated, Sequence, Optional
+from agent_core.context import add_context_usage
 
 # Define the state  
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    # Running token accounting of the call_model prompts in this thread
+    context_usage: Annotated[dict, add_context_usage]
+    # Tool data fingerprint of a first turn that missed the run cache; the run is stored under it
+    run_fingerprint: Optional[str]
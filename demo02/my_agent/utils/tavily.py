@@ -0,0 +1,73 @@
+import threading
+
+import httpx
+
+from agent_core import rate_limit
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Tavily search over pooled httpx clients.
+The stock wrapper posts each search with requests (sync) or a new aiohttp session (async) and the
+tool returns any HTTP error as a string, so the status of a failed search is lost. Here both paths
+share one keep-alive client pair whose event hooks pass every request and its real response
+status through the "tavily" rate limit (agent_core/rate_limit.py).
+tools.py imports this module when it loads; langchain_community itself is imported by
+tavily_search, on the first search that misses the cache.
+'''
+
+TIMEOUT = 30.0
+
+_clients = None
+_lock = threading.Lock()
+
+
+def _http_clients():
+    global _clients
+    if _clients is None:
+        with _lock:
+            if _clients is None:
+                _clients = (httpx.Client(timeout=TIMEOUT, event_hooks=rate_limit.event_hooks("tavily", False)),
+                            httpx.AsyncClient(timeout=TIMEOUT, event_hooks=rate_limit.event_hooks("tavily", True)))
+    return _clients
+
+
+def _pooled_wrapper():
+    '''TavilySearchAPIWrapper sending its searches through the pooled, rate limited clients.'''
+    from langchain_community.utilities.tavily_search import TAVILY_API_URL, TavilySearchAPIWrapper
+
+    class PooledTavilySearchAPIWrapper(TavilySearchAPIWrapper):
+
+        def _params(self, query, max_results, search_depth, include_domains, exclude_domains, include_answer,
+                    include_raw_content, include_images):
+            return {"api_key": self.tavily_api_key.get_secret_value(), "query": query, "max_results": max_results,
+                    "search_depth": search_depth, "include_domains": include_domains or [],
+                    "exclude_domains": exclude_domains or [], "include_answer": include_answer,
+                    "include_raw_content": include_raw_content, "include_images": include_images}
+
+        def raw_results(self, query, max_results=5, search_depth="advanced", include_domains=None,
+                        exclude_domains=None, include_answer=False, include_raw_content=False, include_images=False):
+            params = self._params(query, max_results, search_depth, include_domains, exclude_domains, include_answer,
+                                  include_raw_content, include_images)
+            response = _http_clients()[0].post(f"{TAVILY_API_URL}/search", json=params)
+            response.raise_for_status()
+            return response.json()
+
+        async def raw_results_async(self, query, max_results=5, search_depth="advanced", include_domains=None,
+                                    exclude_domains=None, include_answer=False, include_raw_content=False,
+                                    include_images=False):
+            params = self._params(query, max_results, search_depth, include_domains, exclude_domains, include_answer,
+                                  include_raw_content, include_images)
+            response = await _http_clients()[1].post(f"{TAVILY_API_URL}/search", json=params)
+            response.raise_for_status()
+            return response.json()
+
+    return PooledTavilySearchAPIWrapper()
+
+
+def tavily_search(max_results=2):
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    return TavilySearchResults(max_results=max_results, api_wrapper=_pooled_wrapper())
@@ -1,39 +1,132 @@
-from langchain_community.tools.tavily_search import TavilySearchResults
+from datetime import date
 from langchain_core.tools import Tool
+from my_agent.utils.search_cache import DEFAULT_TTL, search_cache
+from my_agent.utils.singleflight import single_flight
+from my_agent.utils.tavily import tavily_search
+from agent_core.wire import encode
+from agent_core.factory import ToolRegistry
+from agent_core.logs import log_event
+import logging
+import threading
+import time
 
-# Initialize the base search tool once
-_tavily_search = TavilySearchResults(max_results=2) # Increased max_results slightly
+logger = logging.getLogger(__name__)
+
+# The base search tool is created once, on the first search that misses the cache - langchain_community
+# is slow to import and the graph must load without it. tavily_search is imported with the module: a
+# my_agent import at call time fails once agent_core.host has renamed the package to demo02_agent
+_tavily_search = None
+_tavily_lock = threading.Lock()
+
+
+def _get_tavily_search():
+    global _tavily_search
+    if _tavily_search is None:
+        with _tavily_lock:
+            if _tavily_search is None:
+                # Pooled HTTP clients, each search through the Tavily rate limit (utils/tavily.py)
+                _tavily_search = tavily_search(max_results=2) # Increased max_results slightly
+    return _tavily_search
+
+
+def _cached_search(tool: str, query: str):
+    """Runs a Tavily search through the persistent search cache."""
+    cached = search_cache.get(tool, query)
+    if cached is not None:
+        log_event(logger, "search_cache_hit", tool=tool, query=query)
+        return cached
+
+    def search():
+        # Re-check: an identical call may have filled the cache just before this one became the leader
+        cached = search_cache.get(tool, query)
+        if cached is not None:
+            return cached
+        result = _get_tavily_search().invoke(query)
+        # Only real result lists are cached; error strings are returned as they are
+        if isinstance(result, list):
+            search_cache.set(tool, query, result)
+        return result
+
+    # Identical searches already in flight share one Tavily request
+    return single_flight.do(search_cache.key(tool, query), search)
+
+
+async def _acached_search(tool: str, query: str):
+    """Async _cached_search: awaits Tavily on the event loop; the cache lookups are local SQLite reads."""
+    cached = search_cache.get(tool, query)
+    if cached is not None:
+        log_event(logger, "search_cache_hit", tool=tool, query=query)
+        return cached
+
+    async def search():
+        cached = search_cache.get(tool, query)
+        if cached is not None:
+            return cached
+        result = await _get_tavily_search().ainvoke(query)
+        if isinstance(result, list):
+            search_cache.set(tool, query, result)
+        return result
+
+    # Shares in-flight searches with sync callers as well
+    return await single_flight.ado(search_cache.key(tool, query), search)
+
+def tool_data_fingerprint():
+    """
+    Version of the data the searches return, for the run cache: it changes every day (relative trip
+    dates move) and whenever cached weather results go stale.
+    """
+    window = int(time.time() // search_cache.ttls.get("weather", DEFAULT_TTL))
+    return f"{date.today().isoformat()}/{window}"
 
 # Define specific functions for each task
 def search_weather(query: str) -> str:
     """Searches for weather forecasts."""
-    return _tavily_search.invoke(f"Weather forecast for {query}")
+    return encode(_cached_search("weather", f"Weather forecast for {query}"))
 
 def search_activities(query: str) -> str:
     """Searches for activities, attractions, or things to do."""
-    return _tavily_search.invoke(f"Things to do or activities in {query}")
+    return encode(_cached_search("activities", f"Things to do or activities in {query}"))
 
 def search_flights(query: str) -> str:
     """Searches for flight information."""
-    return _tavily_search.invoke(f"Flights for {query}")
+    return encode(_cached_search("flights", f"Flights for {query}"))
+
+# Async counterparts - ToolNode awaits these when the graph runs on an event loop
+async def asearch_weather(query: str) -> str:
+    return encode(await _acached_search("weather", f"Weather forecast for {query}"))
+
+async def asearch_activities(query: str) -> str:
+    return encode(await _acached_search("activities", f"Things to do or activities in {query}"))
+
+async def asearch_flights(query: str) -> str:
+    return encode(await _acached_search("flights", f"Flights for {query}"))
 
 # Create tools from the functions
 weather_tool = Tool.from_function(
     func=search_weather,
+    coroutine=asearch_weather,
     name="WeatherSearch",
     description="Useful for finding weather forecasts for a specific location and time.",
 )
 
 activity_tool = Tool.from_function(
     func=search_activities,
+    coroutine=asearch_activities,
     name="ActivitySearch",
     description="Useful for finding activities, attractions, or things to do in a specific location.",
 )
 
 flight_tool = Tool.from_function(
     func=search_flights,
+    coroutine=asearch_flights,
     name="FlightSearch",
     description="Useful for finding flight information to a specific location around a certain time.",
 )
 
-tools = [weather_tool, activity_tool, flight_tool]
\ No newline at end of file
+# Tool registry of the graph - the node each tool runs in, reporting back to the agent (agent_core/factory.py)
+registry = ToolRegistry()
+registry.register("weather_action", weather_tool)
+registry.register("activity_action", activity_tool)
+registry.register("flight_action", flight_tool)
+
+tools = registry.tools
\ No newline at end of file
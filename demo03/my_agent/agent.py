@@ -19,74 +19,122 @@ if platform.system() == "Windows":
       
 # Application Imports
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
-from my_agent.utils.nodes import call_model, should_continue
-from my_agent.utils.state import AgentState
-from my_agent.utils.tools import firmware_audit_tool, itsm_audit_tool, itsm_approval_tool
-from typing import TypedDict, Literal
+from langchain_core.runnables import RunnableLambda
+from my_agent.utils.nodes import (GRAPH, call_model, acall_model, should_continue, schedule_maintenance,
+                                  route_after_schedule, plan_shard_model, aplan_shard_model, make_shard_planner,
+                                  merge_plans, lookup_run_cache, alookup_run_cache, route_run_cache, store_run_cache,
+                                  approval_signoff, route_after_signoff)
+from agent_core.checkpoint import local_checkpointer
+from agent_core.factory import agent_workflow, graph_factory
+from agent_core.logs import configure_logging
+from agent_core.metrics import MetricsHandler
+from my_agent.utils.state import AgentState, ShardState
+from my_agent.utils.tools import registry
+from typing import TypedDict, Literal, Optional
 import logging
 
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging - LOG_LEVEL (default INFO); per turn records are structured, sampled and size capped (agent_core/logs.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Define the config
 class GraphConfig(TypedDict):
-    model_name: Literal["anthropic", "openai"]
-
-# Define a new graph
-workflow = StateGraph(AgentState, config_schema=GraphConfig)
-logger.info("Initialized StateGraph with AgentState and GraphConfig.")
-
-# Define the agent node
-workflow.add_node("agent", call_model)
-logger.info("Added node: agent")
-
-# Define individual nodes for each tool
-network_audit_node = ToolNode([firmware_audit_tool])
-itsm_audit_node = ToolNode([itsm_audit_tool])
-approval_node = ToolNode([itsm_approval_tool])
-workflow.add_node("intersight_tool", network_audit_node)
-workflow.add_node("itsm_tool", itsm_audit_node)
-workflow.add_node("approval_workflow", approval_node)
-
-# Set the entrypoint as `agent`
-# This means that this node is the first one called
-workflow.set_entry_point("agent")
-logger.info("Set entry point to: agent")
-
-# We now add a conditional edge
-workflow.add_conditional_edges(
-    # First, we define the start node. We use `agent`.
-    # This means these are the edges taken after the `agent` node is called.
-    "agent",
-    # Next, we pass in the function that will determine which node is called next.
-    should_continue,
-    # Finally we pass in a mapping.
-    # The keys are the names of the tools (or 'end'), and the values are the names of the nodes to route to.
-    # END is a special node marking that the graph should finish.
-    # What will happen is we will call `should_continue`, and then the output of that
-    # will be matched against the keys in this mapping.
-    # Based on which one it matches, that node will then be called.
-    {
-        "IntersightTool": "intersight_tool",
-        "ITSMAudit": "itsm_tool",
-        "ITSMApproval": "approval_workflow",
-        # Otherwise we finish.
-        "end": END,
-    },
-)
-logger.info("Added conditional edges from 'agent' based on 'should_continue'.")
-# We now add a normal edge from `tools` to `agent`.
-# This means that after `tools` is called, `agent` node is called next.
-workflow.add_edge("intersight_tool", "agent")
-workflow.add_edge("itsm_tool", "agent")
-workflow.add_edge("approval_workflow", "agent")
-
-
-# Finally, we compile it!
-# This compiles it into a LangChain Runnable,
-# meaning you can use it as you would any other runnable
-graph = workflow.compile()
-logger.info("Workflow compiled successfully.")
+    # Preferred provider; the others are failovers ("local" is an OpenAI compatible endpoint such as vLLM)
+    model_name: Literal["anthropic", "openai", "local"]
+    # Send a hedged request to the next provider when a model call runs past the provider's p95 latency
+    hedge_requests: Optional[bool]
+    # Stream the model response: tokens go out as they arrive, completed tool calls as custom stream events
+    stream_tokens: Optional[bool]
+    # Parallel upgrades allowed per pod and role (1 = one device per pod at a time)
+    maintenance_lanes: Optional[int]
+    # ISO timestamp for the first maintenance window, defaults to the next midnight
+    maintenance_start: Optional[str]
+    # "sharded" plans each (role, pod) shard in parallel and merges the shard plans
+    planning_mode: Optional[Literal["single", "sharded"]]
+    # Maximum number of shards planned at the same time
+    shard_concurrency: Optional[int]
+    # Prompt token budget for call_model, defaults to the budget of the selected model
+    context_token_budget: Optional[int]
+    # Replay cached runs of the same (or a near duplicate) first prompt; default on, RUN_CACHE=off disables it
+    run_cache: Optional[bool]
+    # Pause before ITSMApproval for a human sign-off, resumed with Command(resume=...); needs a checkpointer
+    approval_signoff: Optional[bool]
+
+
+def build_graph(checkpointer=None):
+    '''Builds and compiles the workflow; checkpointer defaults to the CHECKPOINT_DB saver, if set.'''
+    # Shard planning subgraph - plans the devices of one role within one pod
+    shard_workflow = StateGraph(ShardState, config_schema=GraphConfig)
+    shard_workflow.add_node("plan", RunnableLambda(plan_shard_model, afunc=aplan_shard_model, name="plan_shard_model"))
+    shard_workflow.set_entry_point("plan")
+    shard_workflow.add_edge("plan", END)
+    shard_graph = shard_workflow.compile()
+
+    # Define a new graph from the tool registry (agent_core/factory.py): the agent node, one ToolNode per tool
+    # and the conditional edges after `agent`. should_continue returns the name of the called tool or "end";
+    # IntersightTool and ITSMApproval hand back to `agent`, ITSMAudit goes on to the scheduler, ITSMApproval
+    # calls pass the sign-off gate first and "end" stores the run and finishes.
+    workflow = agent_workflow(AgentState, GraphConfig, registry, call_model, acall_model, should_continue,
+                              end_node="store_run_cache")
+    logger.info("Initialized StateGraph with AgentState and GraphConfig, agent and tool nodes.")
+
+    # Whole-run cache - replays the answer of an earlier run on the same data, stores completed first turns.
+    # The lookup computes the inventory/ITSM fingerprint, so async runs await the live ITSM fetch
+    workflow.add_node("run_cache", RunnableLambda(lookup_run_cache, afunc=alookup_run_cache, name="lookup_run_cache"))
+    workflow.add_node("store_run_cache", store_run_cache)
+    logger.info("Added nodes: run_cache, store_run_cache")
+
+    # Deterministic maintenance window scheduler between ITSMAudit and ITSMApproval
+    workflow.add_node("scheduler", schedule_maintenance)
+    logger.info("Added node: scheduler")
+
+    # Sharded planning - fan out one shard planner per (role, pod), then merge into one approval submission
+    workflow.add_node("plan_shard", make_shard_planner(shard_graph))
+    workflow.add_node("merge_plans", merge_plans)
+    logger.info("Added nodes: plan_shard, merge_plans")
+
+    # Set the entrypoint as `run_cache`
+    # This means that this node is the first one called; a cache miss continues with `agent`,
+    # a replayed audit and plan with the sign-off gate and a fresh ITSMApproval submission
+    workflow.set_entry_point("run_cache")
+    workflow.add_conditional_edges("run_cache", route_run_cache, ["agent", "approval_signoff", END])
+    logger.info("Set entry point to: run_cache")
+
+    # The scheduler hands the plan to the model, or to the shard planners that merge it for approval
+    workflow.add_conditional_edges("scheduler", route_after_schedule, ["agent", "plan_shard"])
+    workflow.add_edge("plan_shard", "merge_plans")
+    workflow.add_edge("merge_plans", "approval_signoff")
+    workflow.add_edge("store_run_cache", END)
+
+    # Sign-off gate before ITSMApproval - pauses the run with approval_signoff; a rejected plan goes back to `agent`
+    workflow.add_node("approval_signoff", approval_signoff)
+    workflow.add_conditional_edges("approval_signoff", route_after_signoff, ["approval_workflow", "agent"])
+    logger.info("Added node: approval_signoff")
+
+    # Finally, we compile it!
+    # This compiles it into a LangChain Runnable,
+    # meaning you can use it as you would any other runnable.
+    # MetricsHandler records node, model and tool latency, tokens and payload sizes of every run (agent_core/metrics.py).
+    # With CHECKPOINT_DB set, every step is saved as a delta to a local SQLite file (agent_core/checkpoint.py)
+    compiled = workflow.compile(checkpointer=checkpointer or local_checkpointer()).with_config(
+        callbacks=[MetricsHandler(GRAPH)])
+    logger.info("Workflow compiled successfully.")
+    return compiled
+
+
+# One graph factory per process - a worker serving several graphs builds each once and shares the model pool
+graph_factory.register(GRAPH, build_graph)
+
+
+def get_graph():
+    '''The compiled graph, built on first use.'''
+    return graph_factory.get(GRAPH)
+
+
+def __getattr__(name):
+    # `graph` (langgraph.json, `from my_agent.agent import graph`) is compiled when it is first looked up,
+    # not when the module is imported
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
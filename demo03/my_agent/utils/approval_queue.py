@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from my_agent.utils import itsm_client
+from agent_core.logs import log_event
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+ITSM approval submission queue.
+request_itsm_approval no longer talks to the ITSM backend itself. Each plan gets a monotonic,
+collision free ticket ID and an idempotency key derived from the plan content, is queued, and the
+tool returns straight away. A flusher on the ITSM client event loop sends queued plans to the
+backend in batches, so bursts of concurrent submissions never block graph workers, and the same
+plan submitted twice maps to the same ticket.
+A batch the backend fails is queued again after a backoff of 1, 2, 4 ... up to 30 seconds, at most
+MAX_ATTEMPTS times. A submission still not sent after that is marked failed, logged at error level
+with its ticket (approval_dropped) and its plan forgotten, so the same plan submitted again gets a
+new ticket and goes out. Each submission's status - queued, sent or failed - is kept on it and
+looked up by ticket with status(). Tickets are remembered for TICKET_TTL seconds, and for at most
+MAX_TICKETS plans, oldest first.
+'''
+
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 0.2
+MAX_ATTEMPTS = 5
+BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+TICKET_TTL = 24 * 3600
+MAX_TICKETS = 10000
+
+# Random per-process prefix so ticket IDs from different server workers never collide
+_NODE_ID = f"{(os.getpid() ^ random.getrandbits(16)) & 0xFFFF:04X}"
+
+
+class TicketIdGenerator:
+    '''FWUP-<date>-<time>-<node><sequence>; the sequence never repeats within a process.'''
+
+    def __init__(self, prefix="FWUP", node_id=_NODE_ID):
+        self.prefix = prefix
+        self.node_id = node_id
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next(self, now=None):
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        now = now or datetime.now()
+        return f"{self.prefix}-{now.strftime('%Y%m%d-%H%M%S')}-{self.node_id}{sequence:06d}"
+
+
+def idempotency_key(plan):
+    '''Stable key for a plan - whitespace and case differences do not create a new ticket.'''
+    normalized = re.sub(r"\s+", " ", plan).strip().lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+class ApprovalQueue:
+    def __init__(self, send_batch=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_attempts=MAX_ATTEMPTS,
+                 backoff=BACKOFF, ticket_ttl=TICKET_TTL, max_tickets=MAX_TICKETS):
+        self.send_batch = send_batch or _send_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.ticket_ttl = ticket_ttl
+        self.max_tickets = max_tickets
+        self.ticket_ids = TicketIdGenerator()
+        # idempotency key -> (submission, monotonic time submitted), oldest first
+        self._tickets = OrderedDict()
+        # ticket id -> submission given up on, kept for status() after its plan is forgotten
+        self._failed = OrderedDict()
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._flusher_task = None
+        self._pending = 0
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def submit(self, plan):
+        '''
+        Queue a plan for approval. Returns (submission, is_new). Never blocks on the backend.
+        '''
+        key = idempotency_key(plan)
+        with self._lock:
+            self._expire(time.monotonic())
+            existing = self._tickets.get(key)
+            if existing is not None:
+                return existing[0], False
+            submission = {
+                "ticket_id": self.ticket_ids.next(),
+                "idempotency_key": key,
+                "submitted_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "plan": plan,
+                "status": "queued",
+            }
+            self._tickets[key] = (submission, time.monotonic())
+            self._pending += 1
+            self._idle.clear()
+
+        loop = itsm_client._background_loop()
+        loop.call_soon_threadsafe(self._enqueue, submission)
+        return submission, True
+
+    def status(self, ticket_id):
+        '''"queued", "sent" or "failed" for a ticket this queue still knows, else None.'''
+        with self._lock:
+            if ticket_id in self._failed:
+                return "failed"
+            submission = next((s for s, _ in self._tickets.values() if s["ticket_id"] == ticket_id), None)
+            return submission["status"] if submission else None
+
+    def _expire(self, now):
+        # Called with the lock held
+        while self._tickets:
+            key, (_, submitted) = next(iter(self._tickets.items()))
+            if now - submitted < self.ticket_ttl and len(self._tickets) < self.max_tickets:
+                return
+            del self._tickets[key]
+
+    def _enqueue(self, submission):
+        # Runs on the ITSM client loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._flusher_task = asyncio.get_running_loop().create_task(self._flusher())
+        self._queue.put_nowait(submission)
+
+    async def _flusher(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.send_batch(batch)
+            except Exception as e:
+                settled = self._retry(batch, e)
+            else:
+                logger.info(f"Flushed {len(batch)} approval submissions to ITSM")
+                for submission in batch:
+                    submission["status"] = "sent"
+                settled = batch
+            with self._lock:
+                for submission in settled:
+                    self._attempts.pop(submission["idempotency_key"], None)
+                self._pending -= len(settled)
+                if self._pending == 0:
+                    self._idle.set()
+
+    def _retry(self, batch, error):
+        '''Queues a failed batch again after a backoff; returns the submissions given up on.'''
+        retry, dropped = [], []
+        with self._lock:
+            for submission in batch:
+                key = submission["idempotency_key"]
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                if self._attempts[key] < self.max_attempts:
+                    retry.append(submission)
+                else:
+                    dropped.append(submission)
+                    submission["status"] = "failed"
+                    self._failed[submission["ticket_id"]] = submission
+                    if len(self._failed) > self.max_tickets:
+                        self._failed.popitem(last=False)
+                    # Forget the ticket: the same plan submitted again is sent as a new one
+                    if key in self._tickets and self._tickets[key][0] is submission:
+                        del self._tickets[key]
+            attempt = max((self._attempts[s["idempotency_key"]] for s in retry), default=0)
+        if retry:
+            delay = min(MAX_BACKOFF, self.backoff * 2.0 ** (attempt - 1))
+            logger.warning(f"Failed to flush {len(batch)} approval submissions: {error}; "
+                           f"retrying {len(retry)} in {delay:.0f}s (attempt {attempt}/{self.max_attempts})")
+            loop = asyncio.get_running_loop()
+            for submission in retry:
+                loop.call_later(delay, self._queue.put_nowait, submission)
+        for submission in dropped:
+            log_event(logger, "approval_dropped", level=logging.ERROR, ticket=submission["ticket_id"],
+                      attempts=self.max_attempts, error=error)
+        return dropped
+
+    def wait_until_flushed(self, timeout=None):
+        '''Block until every queued submission has been sent (used at shutdown and in benchmarks).'''
+        return self._idle.wait(timeout)
+
+    def close(self):
+        '''Stop the flusher; submissions still queued are not sent.'''
+        if self._flusher_task is not None:
+            itsm_client._background_loop().call_soon_threadsafe(self._flusher_task.cancel)
+
+
+async def _send_batch(batch):
+    '''Send a batch to ITSM, or log it when no ITSM backend is configured.'''
+    records = [
+        {
+            "number": submission["ticket_id"],
+            "correlation_id": submission["idempotency_key"],
+            "short_description": "Firmware upgrade plan",
+            "description": submission["plan"],
+        }
+        for submission in batch
+    ]
+    if not itsm_client.ITSM_BASE_URL:
+        # Simulating the ITSM API to facilitate this demo
+        logger.debug(f"Simulated ITSM submission of tickets {[r['number'] for r in records]}")
+        return
+    await itsm_client.get_client().create_change_requests(records)
+
+
+approval_queue = ApprovalQueue()
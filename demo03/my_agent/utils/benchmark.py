@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+from contextlib import nullcontext
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Offline benchmark of the firmware upgrade graph.
+The chat model is a ScriptedChatModel that walks the workflow the system prompt describes
+(IntersightTool, ITSMAudit, ITSMApproval, final answer) and writes the shard plans in sharded mode.
+ITSM records are served by the stand-in ITSM server with injected latency, so the async client,
+the approval queue flush and the whole graph run end-to-end with no API keys and no network.
+--mode sync async runs every level with invoke on a thread per run (capped by --workers) and with
+ainvoke on one event loop. --run-cache turns the whole-run cache on, starts every level with an empty
+one and asks for the audit in a few phrasings instead of numbering the runs, so repeated requests hit
+it exactly or as near duplicates.
+    python -m my_agent.utils.benchmark [--mode sync async] [--workers 8] [--planning-mode sharded]
+                                       [--concurrency 1 4 16] [--runs 16]
+                                       [--model-latency 0.1] [--token-latency 0.005] [--stream]
+                                       [--itsm-latency 0.05] [--itsm simulated] [--run-cache]
+                                       [--replay thread_messages.json] [--json results.json] [--metrics metrics.prom]
+'''
+
+AUDIT_PROMPT = ("Please audit my datacenter networking environment for out of date firmware and "
+                "provide a upgrade and change management review. (benchmark run {n})")
+# The same request as different operators type it
+AUDIT_PHRASINGS = [
+    "Please audit my datacenter networking environment for out of date firmware and provide a upgrade and change "
+    "management review.",
+    "Audit my datacenter networking environment for out of date firmware and provide an upgrade and change "
+    "management review",
+    "please audit my datacenter networking environment for out-of-date firmware and provide a upgrade and change "
+    "management review!",
+]
+
+
+def _tool_call(name, args, turn=0):
+    # One id per tool and turn: tool results of later turns on a thread refer back to earlier ones by call id
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{name}_{turn}"}])
+
+
+def scripted_operator():
+    '''respond function for the agent node: the three workflow tools in order, then a summary.'''
+    from my_agent.utils.nodes import _audit_payload
+
+    def respond(messages):
+        # Only the current turn counts - everything after the latest user message
+        turn = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        last_tool = next((m.name for m in reversed(messages[turn:]) if isinstance(m, ToolMessage)), None)
+        if last_tool is None:
+            return _tool_call("IntersightTool", {}, turn)
+        if last_tool == "IntersightTool":
+            return _tool_call("ITSMAudit", {}, turn)
+        if last_tool == "ITSMAudit":
+            request = messages[turn].content
+            audit = _audit_payload({"messages": messages}) or {}
+            rows = [f"| {slot['priority']} | {slot['hostname']} | {slot['start']} - {slot['end']} | {slot['role']} |"
+                    for slot in audit.get("schedule", [])]
+            plan = "\n".join(["# Firmware Upgrade Plan", request, "", "| Priority | Device Name | Change Time | Device |",
+                              "|---|---|---|---|", *rows])
+            return _tool_call("ITSMApproval", {"plan": plan}, turn)
+        return "The firmware upgrade plan was submitted for ITSM approval."
+
+    return respond
+
+
+def scripted_shard_planner(messages):
+    '''respond function for the shard subgraph: a short narrative section per shard.'''
+    from agent_core.wire import decode
+
+    shard = decode(messages[-1].content)
+    hostnames = ", ".join(d.get("hostname", "") for d in shard.get("devices", []))
+    return f"Upgrade {hostnames} in their scheduled windows, one device at a time, verifying BGP and vPC after each."
+
+
+def main(argv=None):
+    from agent_core.replay import ScriptedChatModel, arun_benchmark, format_report, replay, run_benchmark
+
+    parser = argparse.ArgumentParser(description="Offline benchmark of the firmware upgrade graph")
+    parser.add_argument("--mode", choices=["sync", "async"], nargs="+", default=["sync"],
+                        help="execution paths to benchmark: invoke on threads, ainvoke on an event loop")
+    parser.add_argument("--workers", type=int, help="cap on the threads serving sync runs (default: the concurrency)")
+    parser.add_argument("--planning-mode", choices=["single", "sharded"], default="single")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--runs", type=int, default=16, help="graph runs per concurrency level")
+    parser.add_argument("--model-latency", type=float, default=0.1, help="seconds until a model call's first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--stream", action="store_true", help="stream model responses (stream_tokens)")
+    parser.add_argument("--itsm", choices=["server", "simulated"], default="server",
+                        help="serve ITSM records from the stand-in server or use the in-process simulated records")
+    parser.add_argument("--itsm-latency", type=float, default=0.05)
+    parser.add_argument("--run-cache", action="store_true", help="enable the whole-run cache (off by default)")
+    parser.add_argument("--replay", help="replay the AI messages of a recorded thread instead of the script")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--metrics", help="write the Prometheus metrics the graph recorded to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    # Nothing reaches a provider; the placeholder keys only satisfy client construction
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    from my_agent.agent import graph
+    from my_agent.utils import itsm_client, nodes, tools
+    from my_agent.utils.approval_queue import approval_queue
+    from my_agent.utils.itsm_server import running_server
+    from agent_core.run_cache import RunCache
+    logging.getLogger().setLevel(args.log_level)
+
+    respond = replay(args.replay) if args.replay else scripted_operator()
+    model = ScriptedChatModel(respond=respond, latency=args.model_latency, token_latency=args.token_latency)
+    shard_model = ScriptedChatModel(respond=scripted_shard_planner, latency=args.model_latency,
+                                    token_latency=args.token_latency)
+    nodes._get_model = lambda model_name: model
+    nodes._get_chat_model = lambda model_name: shard_model
+    config = {"configurable": {"model_name": "openai", "planning_mode": args.planning_mode,
+                               "maintenance_start": "2026-11-01T00:00", "stream_tokens": args.stream,
+                               "run_cache": args.run_cache}}
+
+    def make_inputs(n):
+        if args.run_cache:
+            return {"messages": [HumanMessage(content=AUDIT_PHRASINGS[n % len(AUDIT_PHRASINGS)])]}
+        return {"messages": [HumanMessage(content=AUDIT_PROMPT.format(n=n))]}
+
+    submissions = {}
+    server = running_server(latency=args.itsm_latency, submissions=submissions) if args.itsm == "server" else nullcontext()
+    with server as base_url:
+        if base_url:
+            itsm_client.ITSM_BASE_URL = tools.ITSM_BASE_URL = base_url
+        results = []
+        # The warm-up run would fill the run cache before the measured runs
+        warmup = 0 if args.run_cache else 1
+        for mode in args.mode:
+            for concurrency in args.concurrency:
+                nodes.run_cache = RunCache(enabled=True)
+                tools.reset_tool_data_fingerprint()
+                if mode == "async":
+                    results += arun_benchmark(graph, make_inputs, config, [concurrency], args.runs, warmup=warmup)
+                else:
+                    results += run_benchmark(graph, make_inputs, config, [concurrency], args.runs, warmup=warmup,
+                                             workers=args.workers)
+                results[-1]["run_cache"] = {key: nodes.run_cache.stats[key] for key in ("hits", "near_hits", "misses")}
+        flushed = approval_queue.wait_until_flushed(timeout=30)
+
+    print(f"demo03 planning_mode={args.planning_mode} stream={args.stream} "
+          f"model latency {args.model_latency}s + {args.token_latency}s per chunk, "
+          f"ITSM {args.itsm} latency {args.itsm_latency if args.itsm == 'server' else 0}s, "
+          f"run cache {'on' if args.run_cache else 'off'}")
+    print(format_report(results))
+    if args.run_cache:
+        print("\nrun cache hits / near duplicate hits / misses per level: " + ", ".join(
+            f"{r['mode']} {r['concurrency']}: {r['run_cache']['hits']}/{r['run_cache']['near_hits']}/{r['run_cache']['misses']}"
+            for r in results))
+    if args.itsm == "server":
+        print(f"\napproval submissions received by ITSM: {len(submissions)}{'' if flushed else ' (flush timed out)'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"demo": "demo03", "args": vars(args), "results": results}, f, indent=2)
+    if args.metrics:
+        from agent_core.metrics import write_metrics_file
+
+        write_metrics_file(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.types import Command
+
+from agent_core.checkpoint import DeltaSqliteSaver
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Checkpoint write cost and storage growth per step, delta checkpoints against full snapshots.
+One thread runs the audit workflow --turns times on the scripted model and the simulated ITSM
+records (no API keys or network), once with DeltaSqliteSaver writing deltas and once with it
+writing every list in full, as the stock savers do. Each checkpoint is written synchronously, so
+every step's write time and bytes are its own.
+The first turn pauses at the approval_signoff gate. The saver is then closed and the run is
+resumed from a new saver on the same file, as after a restart; the benchmark checks that the
+resumed run makes only the final model call and runs no audit tool again.
+    python -m my_agent.utils.checkpoint_benchmark [--turns 5] [--snapshot-every 25] [--json results.json]
+'''
+
+
+class MeasuredSaver(DeltaSqliteSaver):
+    '''DeltaSqliteSaver that records the time and bytes of each checkpoint it writes.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.steps = []
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        written = self.stats["checkpoint_bytes"] + self.stats["blob_bytes"]
+        started = time.perf_counter()
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self.steps.append({
+            "step": metadata.get("step"),
+            "channels": sorted(channel for channel in new_versions if not channel.startswith(("branch:", "__"))),
+            "messages": len(checkpoint["channel_values"].get("messages", [])),
+            "seconds": time.perf_counter() - started,
+            "bytes": self.stats["checkpoint_bytes"] + self.stats["blob_bytes"] - written,
+        })
+        return result
+
+
+def counted(respond):
+    '''respond function that counts the model calls and the tools the model asks for.'''
+    def wrapper(messages):
+        message = respond(messages)
+        wrapper.calls += 1
+        wrapper.tools += [call["name"] for call in getattr(message, "tool_calls", [])]
+        return message
+
+    wrapper.calls = 0
+    wrapper.tools = []
+    return wrapper
+
+
+def audit_request():
+    # A new message per turn: add_messages gives the input message an id, a reused one would replace it
+    return {"messages": [HumanMessage(content="Please audit my datacenter networking environment for out of date "
+                                              "firmware and provide a upgrade and change management review.")]}
+
+
+def run_thread(build_graph, respond, path, snapshot_every, turns, config):
+    '''Runs turns audits on one thread, pausing and resuming the first at the sign-off gate.'''
+    saver = MeasuredSaver(path, snapshot_every=snapshot_every)
+    graph = build_graph(checkpointer=saver)
+    paused = graph.invoke(audit_request(), config, durability="sync")
+    assert "__interrupt__" in paused, "the first turn stops at the sign-off gate"
+    calls, steps = respond.calls, list(saver.steps)
+    saver.close()
+
+    # A new process: a new saver on the same file, a new graph, nothing in memory
+    saver = MeasuredSaver(path, snapshot_every=snapshot_every)
+    graph = build_graph(checkpointer=saver)
+    tools = len(respond.tools)
+    result = graph.invoke(Command(resume={"approved": True}), config, durability="sync")
+    resume = {"model_calls": respond.calls - calls, "tool_calls": respond.tools[tools:],
+              "approval_status": result.get("approval_status")}
+    assert resume["model_calls"] == 1 and not resume["tool_calls"], f"the resumed run replayed work: {resume}"
+
+    signoff = {**config["configurable"], "approval_signoff": False}
+    for _ in range(turns - 1):
+        graph.invoke(audit_request(), {"configurable": signoff}, durability="sync")
+    steps += saver.steps
+    size = saver.size()
+    saver.close()
+    return {"steps": steps, "resume": resume, "file_bytes": size}
+
+
+def _stats(steps):
+    seconds = sorted(step["seconds"] for step in steps)
+    sizes = [step["bytes"] for step in steps]
+    return {"checkpoints": len(steps), "put_ms_p50": 1000 * seconds[len(seconds) // 2],
+            "put_ms_p95": 1000 * seconds[min(len(seconds) - 1, round(0.95 * len(seconds)))],
+            "bytes_total": sum(sizes), "bytes_max": max(sizes)}
+
+
+def format_report(results, turns):
+    lines = [f"{'saver':<8} {'checkpoints':>11} {'put p50 ms':>10} {'put p95 ms':>10} {'bytes/step max':>14} "
+             f"{'bytes written':>13} {'file bytes':>10}"]
+    for name, result in results.items():
+        stats = _stats(result["steps"])
+        lines.append(f"{name:<8} {stats['checkpoints']:>11} {stats['put_ms_p50']:>10.2f} {stats['put_ms_p95']:>10.2f} "
+                     f"{stats['bytes_max']:>14} {stats['bytes_total']:>13} {result['file_bytes']:>10}")
+
+    delta, full = results["delta"]["steps"], results["full"]["steps"]
+    lines += ["", f"per step of the thread ({turns} turns): messages in state, bytes and ms written",
+              f"{'step':>4} {'messages':>8} {'delta bytes':>11} {'full bytes':>10} {'delta ms':>8} {'full ms':>8}  channels"]
+    for n, (d, f) in enumerate(zip(delta, full)):
+        lines.append(f"{n:>4} {d['messages']:>8} {d['bytes']:>11} {f['bytes']:>10} {1000 * d['seconds']:>8.2f} "
+                     f"{1000 * f['seconds']:>8.2f}  {', '.join(d['channels'])}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from my_agent.utils.benchmark import scripted_operator, scripted_shard_planner
+    from agent_core.replay import ScriptedChatModel
+
+    parser = argparse.ArgumentParser(description="Checkpoint write cost and storage growth per step")
+    parser.add_argument("--turns", type=int, default=5, help="audit turns on the thread")
+    parser.add_argument("--snapshot-every", type=int, default=25, help="deltas between full snapshots")
+    parser.add_argument("--planning-mode", choices=["single", "sharded"], default="single")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    # Nothing reaches a provider; the placeholder key only satisfies client construction
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    from my_agent.agent import build_graph
+    from my_agent.utils import nodes
+    from my_agent.utils.approval_queue import approval_queue
+    logging.getLogger().setLevel(args.log_level)
+
+    respond = counted(scripted_operator())
+    nodes._get_model = lambda model_name: ScriptedChatModel(respond=respond)
+    nodes._get_chat_model = lambda model_name: ScriptedChatModel(respond=scripted_shard_planner)
+    directory = tempfile.mkdtemp(prefix="checkpoint-benchmark-")
+    results = {}
+    try:
+        for name, snapshot_every in (("delta", args.snapshot_every), ("full", 0)):
+            config = {"configurable": {"thread_id": f"benchmark-{name}", "model_name": "openai", "run_cache": False,
+                                       "planning_mode": args.planning_mode, "maintenance_start": "2026-11-01T00:00",
+                                       "approval_signoff": True}}
+            results[name] = run_thread(build_graph, respond, os.path.join(directory, f"{name}.sqlite3"), snapshot_every,
+                                       args.turns, config)
+        approval_queue.wait_until_flushed(timeout=30)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    resume = results["delta"]["resume"]
+    print(f"demo03 planning_mode={args.planning_mode}, {args.turns} turns on one thread, "
+          f"snapshot every {args.snapshot_every} deltas")
+    print(f"resumed after sign-off from a reopened file: {resume['model_calls']} model call, "
+          f"{len(resume['tool_calls'])} tool calls replayed, approval_status {resume['approval_status']!r}\n")
+    print(format_report(results, args.turns))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"demo": "demo03", "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
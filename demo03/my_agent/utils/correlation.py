@@ -0,0 +1,118 @@
+from collections import defaultdict
+
+from my_agent.utils.knowledgebase import KBIndex
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Device to ITSM correlation engine.
+Instead of handing every change request, outage and KB article to the LLM and asking it to
+cross-reference them in its head, the records are indexed once and each device is looked up
+against the indexes. Total cost is O(devices + records); KB articles are matched by model family,
+role and affected version range through the KBIndex in knowledgebase.py.
+'''
+
+VERDICT_CLEAR = "clear"
+VERDICT_BLOCKED_BY_CR = "blocked-by-cr"
+VERDICT_BLOCKED_BY_OUTAGE = "blocked-by-outage"
+
+# Record states that no longer block an upgrade
+_INACTIVE_CR_STATUSES = {"closed", "completed", "cancelled", "canceled", "rejected"}
+_INACTIVE_INCIDENT_STATUSES = {"closed", "resolved", "cancelled", "canceled"}
+
+# Change request fields carried onto each blocked device; cr_start/cr_end feed the scheduler
+_CR_FIELDS = ("cr_number", "cr_description", "cr_start", "cr_end")
+
+
+def _records(items):
+    '''ITSM payloads come back either as a list or as an index keyed dict.'''
+    if isinstance(items, dict):
+        return items.values()
+    return items or []
+
+
+def _normalize(name):
+    return str(name).strip().lower()
+
+
+def build_cr_index(cm_items):
+    '''Index active change requests by device name.'''
+    index = defaultdict(list)
+    for cr in _records(cm_items):
+        if _normalize(cr.get("cr_status", "")) in _INACTIVE_CR_STATUSES:
+            continue
+        index[_normalize(cr.get("devicename", ""))].append(cr)
+    return index
+
+
+def build_outage_index(outage_items):
+    '''Index open incidents by every device listed in incident_devicename.'''
+    index = defaultdict(list)
+    for incident in _records(outage_items):
+        if _normalize(incident.get("incident_status", "")) in _INACTIVE_INCIDENT_STATUSES:
+            continue
+        names = incident.get("incident_devicename") or []
+        if isinstance(names, str):
+            names = [names]
+        for name in names:
+            index[_normalize(name)].append(incident)
+    return index
+
+
+class CorrelationEngine:
+    '''Holds the ITSM indexes and produces a verdict per device.'''
+
+    def __init__(self, cm_items, outage_items, kb_items):
+        self.cr_index = build_cr_index(cm_items)
+        self.outage_index = build_outage_index(outage_items)
+        self.kb_index = KBIndex(_records(kb_items))
+
+    def correlate_device(self, device):
+        name = _normalize(device.get("hostname", ""))
+        outages = self.outage_index.get(name, [])
+        crs = self.cr_index.get(name, [])
+
+        if outages:
+            verdict = VERDICT_BLOCKED_BY_OUTAGE
+        elif crs:
+            verdict = VERDICT_BLOCKED_BY_CR
+        else:
+            verdict = VERDICT_CLEAR
+
+        result = dict(device)
+        result["verdict"] = verdict
+        result["kb_numbers"] = [kb.get("kb_number") for kb in self.kb_index.match(device)]
+        if crs:
+            result["change_requests"] = [
+                {key: cr[key] for key in _CR_FIELDS if key in cr}
+                for cr in crs
+            ]
+        if outages:
+            result["incidents"] = [
+                {"incident_number": i.get("incident_number"), "incident_description": i.get("incident_description")}
+                for i in outages
+            ]
+        return result
+
+    def correlate(self, devices):
+        return [self.correlate_device(device) for device in devices]
+
+
+def correlate_devices(devices, cm_items, outage_items, kb_items):
+    '''
+    Correlate a list of device dicts against the ITSM records.
+    Returns (verdicts, knowledgebase) where knowledgebase only holds the KB articles
+    that matched at least one device, keyed by kb_number.
+    '''
+    engine = CorrelationEngine(cm_items, outage_items, kb_items)
+    verdicts = engine.correlate(devices)
+
+    kb_by_number = {kb.get("kb_number"): kb for kb in _records(kb_items)}
+    # Articles without a kb_number can still match; they cannot be listed, nor sorted against the others
+    referenced = {number for verdict in verdicts for number in verdict["kb_numbers"] if number}
+    knowledgebase = {number: kb_by_number[number] for number in sorted(referenced) if number in kb_by_number}
+
+    logger.info(f"Correlated {len(verdicts)} devices against ITSM records.")
+    return verdicts, knowledgebase
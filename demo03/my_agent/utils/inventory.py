@@ -0,0 +1,184 @@
+from array import array
+from itertools import compress
+from my_agent.utils.versions import is_outdated
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Paginated firmware inventory.
+The Nexus Dashboard inventory API is paged; pages are pulled lazily through a generator and
+written straight into AgentState.devices, so the device list never has to travel through the model.
+Pages are loaded into a DeviceInventory: a column store where repeated strings (model, role, pod,
+firmware versions) are pooled and each device holds small integer ids, keeping 100k-device fleets
+compact. The outdated filter compares each distinct (current, recommended) pair once, then applies
+the result to the whole fleet in a single pass.
+'''
+
+DEFAULT_PAGE_SIZE = 500
+
+# Simulating the Nexus Dashboard API return to facilitate this demo.
+_SIMULATED_DEVICES = [
+    {
+        "hostname": "spine-sw01",
+        "model": "N9K-C9336C-FX2",
+        "role": "spine",
+        "current_firmware": "7.0(3)I7(4)",
+        "recommended_firmware": "10.4.5"
+    },
+    {
+        "hostname": "spine-sw02",
+        "model": "N9K-C9336C-FX2",
+        "role": "spine",
+        "current_firmware": "7.0(3)I7(4)",
+        "recommended_firmware": "10.4.5"
+    },
+    {
+        "hostname": "leaf-sw13",
+        "model": "N9K-C93180YC-EX",
+        "role": "leaf",
+        "current_firmware": "9.2(1)",
+        "recommended_firmware": "10.3.6"
+    },
+    {
+        "hostname": "leaf-sw14",
+        "model": "N9K-C93180YC-EX",
+        "role": "leaf",
+        "current_firmware": "9.2(1)",
+        "recommended_firmware": "10.3.6"
+    },
+    {
+        "hostname": "leaf-sw15",
+        "model": "N9K-C93180YC-EX",
+        "role": "leaf",
+        "current_firmware": "9.2(1)",
+        "recommended_firmware": "10.3.6"
+    },
+    {
+        "hostname": "leaf-sw16",
+        "model": "N9K-C93180YC-EX",
+        "role": "leaf",
+        "current_firmware": "9.2(1)",
+        "recommended_firmware": "10.3.6"
+    }
+]
+
+
+def fetch_inventory_page(offset, limit):
+    """
+    Return one page of the firmware inventory.
+    This is where you would build the Nexus Dashboard API call (offset/limit query parameters).
+    """
+    return _SIMULATED_DEVICES[offset:offset + limit]
+
+
+def iter_inventory_pages(page_size=DEFAULT_PAGE_SIZE, fetch_page=fetch_inventory_page):
+    '''Yield inventory pages until the API returns a short or empty page.'''
+    offset = 0
+    while True:
+        page = fetch_page(offset, page_size)
+        if not page:
+            return
+        logger.debug(f"Fetched inventory page at offset {offset} with {len(page)} devices")
+        yield page
+        if len(page) < page_size:
+            return
+        offset += len(page)
+
+
+def summarize_devices(devices):
+    '''Small summary for the model: device counts per role and firmware transition.'''
+    by_role = {}
+    by_upgrade = {}
+    for device in devices:
+        role = device.get("role", "unknown")
+        by_role[role] = by_role.get(role, 0) + 1
+        upgrade = f"{device.get('current_firmware')} -> {device.get('recommended_firmware')}"
+        by_upgrade[upgrade] = by_upgrade.get(upgrade, 0) + 1
+    return {"device_count": sum(by_role.values()), "devices_by_role": by_role, "firmware_upgrades": by_upgrade}
+
+
+class _StringPool:
+    '''Maps repeated strings to small integer ids.'''
+    __slots__ = ("values", "ids")
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def id_for(self, value):
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+
+class DeviceInventory:
+    '''Array-backed columns for hostname, model, role, pod, current and recommended firmware.'''
+    __slots__ = ("hostnames", "models", "roles", "pods", "current", "recommended", "_strings", "_versions")
+
+    def __init__(self):
+        self.hostnames = []
+        self.models = array("I")
+        self.roles = array("I")
+        self.pods = array("I")
+        self.current = array("I")
+        self.recommended = array("I")
+        self._strings = _StringPool()
+        self._versions = _StringPool()
+
+    @classmethod
+    def from_pages(cls, pages):
+        inventory = cls()
+        for page in pages:
+            inventory.extend(page)
+        return inventory
+
+    def __len__(self):
+        return len(self.hostnames)
+
+    def append(self, device):
+        strings = self._strings
+        self.hostnames.append(device.get("hostname"))
+        self.models.append(strings.id_for(device.get("model")))
+        self.roles.append(strings.id_for(device.get("role")))
+        self.pods.append(strings.id_for(device.get("pod")))
+        self.current.append(self._versions.id_for(device.get("current_firmware")))
+        self.recommended.append(self._versions.id_for(device.get("recommended_firmware")))
+
+    def extend(self, devices):
+        for device in devices:
+            self.append(device)
+
+    def record(self, index):
+        '''Materialise one device as a dict.'''
+        strings = self._strings.values
+        versions = self._versions.values
+        device = {
+            "hostname": self.hostnames[index],
+            "model": strings[self.models[index]],
+            "role": strings[self.roles[index]],
+            "current_firmware": versions[self.current[index]],
+            "recommended_firmware": versions[self.recommended[index]],
+        }
+        pod = strings[self.pods[index]]
+        if pod is not None:
+            device["pod"] = pod
+        return device
+
+    def outdated_mask(self):
+        '''One byte per device, 1 when its current firmware is behind the recommended version.'''
+        versions = self._versions.values
+        pairs = list(zip(self.current, self.recommended))
+        # Compare every distinct version pair once, then map the answers over the fleet
+        answers = {
+            pair: is_outdated(versions[pair[0]], versions[pair[1]])
+            for pair in set(pairs)
+        }
+        return bytearray(map(answers.__getitem__, pairs))
+
+    def outdated(self):
+        '''Dicts for the devices that are actually behind their recommended firmware.'''
+        return [self.record(i) for i in compress(range(len(self)), self.outdated_mask())]
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from agent_core.rate_limit import rate_limiter
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Async ITSM client (ServiceNow Table API style).
+The three ITSM lookups - change management, outages and knowledge base - are fetched concurrently
+over one pooled, keep-alive HTTP connection pool. Each table is paged with sysparm_limit/sysparm_offset,
+every request has its own timeout, and transient failures (timeouts, 429, 5xx) are retried with
+exponential backoff and jitter. With the rate limiter on (agent_core/rate_limit.py: RATE_LIMITER=on
+or the batch runner), every request also goes through its "itsm" limit, which paces the requests
+and, on a 429, pauses all of them for Retry-After - not just the request that got it.
+
+The client is used when ITSM_BASE_URL is set; otherwise itsm_audit keeps using the simulated records.
+Synchronous callers block on fetch_itsm_records, async callers await afetch_itsm_records.
+ITSM_BASE_URL=...
+ITSM_API_KEY=...
+'''
+
+ITSM_BASE_URL = os.environ.get("ITSM_BASE_URL")
+ITSM_API_KEY = os.environ.get("ITSM_API_KEY")
+
+# ITSM table behind each record type
+TABLES = {
+    "itsm_changemanagement_items": "change_request",
+    "itsm_outage_items": "incident",
+    "itsm_knowledgebase_items": "kb_knowledge",
+}
+
+# Import set staging table used for approval submissions
+CHANGE_REQUEST_IMPORT_TABLE = "u_firmware_change_request"
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ITSMError(Exception):
+    pass
+
+
+class ITSMClient:
+    def __init__(self, base_url, api_key=None, page_size=500, timeout=10.0, max_retries=3,
+                 backoff=0.5, max_connections=20, max_keepalive_connections=10):
+        self.base_url = base_url.rstrip("/")
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        headers = {"Accept": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _request(self, method, path, **kwargs):
+        '''HTTP request with retry on timeouts, connection errors, 429 and 5xx.'''
+        for attempt in range(self.max_retries + 1):
+            try:
+                await rate_limiter.aacquire("itsm")
+                response = await self._client.request(method, path, **kwargs)
+                rate_limiter.observe("itsm", response.status_code, response.headers)
+                if response.status_code not in _RETRY_STATUSES:
+                    response.raise_for_status()
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        # e.g. a gateway's HTML error page served with a 2xx status
+                        raise ITSMError(f"ITSM returned a non-JSON {response.status_code} response for {path}") from e
+                error = ITSMError(f"ITSM returned {response.status_code} for {path}")
+                # An enabled limiter has paused the provider for Retry-After; the next aacquire waits it out
+                retry_after = response.headers.get("Retry-After")
+                if response.status_code == 429 and rate_limiter.enabled:
+                    retry_after = "0"
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = ITSMError(f"ITSM request to {path} failed: {e}")
+                retry_after = None
+            except httpx.HTTPStatusError as e:
+                raise ITSMError(f"ITSM returned {e.response.status_code} for {path}") from e
+
+            if attempt == self.max_retries:
+                raise error
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            delay += random.uniform(0, self.backoff)
+            logger.warning(f"{error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def fetch_table(self, table):
+        '''All records of one table, page by page.'''
+        records = []
+        offset = 0
+        while True:
+            payload = await self._request(
+                "GET",
+                f"/api/now/table/{table}",
+                params={"sysparm_limit": self.page_size, "sysparm_offset": offset},
+            )
+            page = payload.get("result", [])
+            records.extend(page)
+            if len(page) < self.page_size:
+                return records
+            offset += len(page)
+
+    async def fetch_all(self):
+        '''Fetch change requests, outages and KB articles concurrently.'''
+        names = list(TABLES)
+        results = await asyncio.gather(*(self.fetch_table(TABLES[name]) for name in names))
+        return dict(zip(names, results))
+
+    async def create_change_requests(self, records):
+        '''
+        Create change requests in one call through the Import Set insertMultiple API.
+        Each record carries its idempotency key as correlation_id so ITSM can drop duplicates.
+        '''
+        return await self._request(
+            "POST",
+            f"/api/now/import/{CHANGE_REQUEST_IMPORT_TABLE}/insertMultiple",
+            json={"records": records},
+        )
+
+
+# One client and one event loop per process so the connection pool survives between tool calls
+_loop = None
+_client = None
+_lock = threading.Lock()
+
+
+def _background_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="itsm-client", daemon=True).start()
+    return _loop
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = ITSMClient(ITSM_BASE_URL, ITSM_API_KEY)
+    return _client
+
+
+def run(coro):
+    '''Run a coroutine on the client's event loop from synchronous code and wait for it.'''
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+async def _fetch():
+    return await get_client().fetch_all()
+
+
+def _log_fetch(records, started):
+    counts = {name: len(items) for name, items in records.items()}
+    logger.info(f"Fetched ITSM records in {time.perf_counter() - started:.3f}s: {counts}")
+
+
+def fetch_itsm_records():
+    '''Synchronous entry point for itsm_audit.'''
+    started = time.perf_counter()
+    records = run(_fetch())
+    _log_fetch(records, started)
+    return records
+
+
+async def afetch_itsm_records():
+    '''
+    Async entry point for aitsm_audit. The pooled connections belong to the client's own loop, so the
+    fetch runs there and the caller's loop awaits it without blocking.
+    '''
+    started = time.perf_counter()
+    records = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_fetch(), _background_loop()))
+    _log_fetch(records, started)
+    return records
+
+
+if __name__ == "__main__":
+    # Offline load test against the stand-in ITSM server
+    # python -m my_agent.utils.itsm_client [concurrency] [requests] [latency_seconds]
+    import sys
+    from statistics import quantiles
+    from my_agent.utils.itsm_server import running_server
+
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    async def load_test(base_url):
+        client = ITSMClient(base_url, page_size=2, max_connections=concurrency * len(TABLES))
+        semaphore = asyncio.Semaphore(concurrency)
+        timings = []
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                await client.fetch_all()
+                timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        await client.aclose()
+        return elapsed, timings
+
+    with running_server(latency=latency) as base_url:
+        elapsed, timings = asyncio.run(load_test(base_url))
+    p50, p95 = quantiles(timings, n=100)[49], quantiles(timings, n=100)[94]
+    print(f"{total} audits, concurrency {concurrency}, server latency {latency}s")
+    print(f"elapsed {elapsed:.2f}s, {total / elapsed:.1f} audits/s, p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms")
@@ -0,0 +1,121 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Local stand-in ITSM server.
+Serves the simulated ITSM records through a ServiceNow style Table API
+(/api/now/table/<table>?sysparm_limit=..&sysparm_offset=..) and accepts approval submissions on
+/api/now/import/<table>/insertMultiple, so the async ITSM client can be
+exercised and load-tested offline. Latency and a failure rate can be injected to test timeouts
+and retries.
+    python -m my_agent.utils.itsm_server [port]
+'''
+
+
+def _tables():
+    from my_agent.utils.itsm_client import TABLES
+    from my_agent.utils.tools import _get_itsm_records
+
+    records = dict(zip(
+        ["itsm_changemanagement_items", "itsm_outage_items", "itsm_knowledgebase_items"],
+        _get_itsm_records(),
+    ))
+    return {TABLES[name]: list(items.values()) for name, items in records.items()}
+
+
+class ITSMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under load tests
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients that time out or disconnect mid response are expected in timeout and load tests
+        logger.debug(f"ITSM stand-in request from {client_address} failed", exc_info=True)
+
+
+def make_handler(tables, latency=0.0, failure_rate=0.0, submissions=None):
+    submissions = {} if submissions is None else submissions
+    lock = threading.Lock()
+
+    class ITSMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            table = url.path.rsplit("/", 1)[-1]
+            if latency:
+                time.sleep(latency)
+            if failure_rate and random.random() < failure_rate:
+                return self._send(503, {"error": "Service Unavailable"})
+            if not url.path.startswith("/api/now/table/") or table not in tables:
+                return self._send(404, {"error": f"Unknown table {table}"})
+            query = parse_qs(url.query)
+            limit = int(query.get("sysparm_limit", ["1000"])[0])
+            offset = int(query.get("sysparm_offset", ["0"])[0])
+            self._send(200, {"result": tables[table][offset:offset + limit]})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if latency:
+                time.sleep(latency)
+            if failure_rate and random.random() < failure_rate:
+                return self._send(503, {"error": "Service Unavailable"})
+            if not (url.path.startswith("/api/now/import/") and url.path.endswith("/insertMultiple")):
+                return self._send(404, {"error": f"Unknown path {url.path}"})
+            created = []
+            with lock:
+                for record in json.loads(body).get("records", []):
+                    # correlation_id is the idempotency key - a repeat returns the original record
+                    key = record.get("correlation_id") or record.get("number")
+                    stored = submissions.setdefault(key, record)
+                    created.append({"number": stored.get("number"), "status": "inserted" if stored is record else "ignored"})
+            self._send(201, {"result": created})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return ITSMHandler
+
+
+@contextmanager
+def running_server(tables=None, latency=0.0, failure_rate=0.0, port=0, submissions=None):
+    '''
+    Run the stand-in server on a background thread and yield its base URL.
+    Pass a dict as submissions to inspect the change requests it received.
+    '''
+    server = ITSMServer(("127.0.0.1", port), make_handler(tables or _tables(), latency, failure_rate, submissions))
+    thread = threading.Thread(target=server.serve_forever, name="itsm-server", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = ITSMServer(("127.0.0.1", port), make_handler(_tables()))
+    print(f"Stand-in ITSM server on http://127.0.0.1:{port}")
+    server.serve_forever()
@@ -0,0 +1,174 @@
+import re
+from collections import defaultdict
+
+from my_agent.utils.versions import NXOS_VERSION_PATTERN, parse_nxos_version
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Knowledge base applicability index.
+KB articles carry free text such as "This issue is solved in version 7.0(3)I4(7) and higher" and
+device types such as "Cisco 9300 Series Spine Switches". Each article is parsed into a
+(model family, role) key and an affected version range. Articles sharing a key are stored in an
+interval tree, so a device is matched against thousands of articles in O(log n + matches).
+'''
+
+# Open interval ends. () sorts before every version tuple, (inf,) after every version tuple.
+LOWEST = ()
+HIGHEST = (float("inf"),)
+
+_ROLES = ("super-spine", "spine", "leaf", "border")
+
+# "N9K-C93180YC-EX" -> "93", "N9K-C9508" -> "95"
+_MODEL_FAMILY_RE = re.compile(r"N(\d)K-C?(\d{2})", re.IGNORECASE)
+# "Cisco 9300 Series Spine Switches" -> "93"
+_KB_FAMILY_RE = re.compile(r"\b(\d{2})\d{2}\s+Series", re.IGNORECASE)
+
+_VERSION = rf"({NXOS_VERSION_PATTERN})"
+# (pattern, builder) - builder turns the matched version(s) into (low, low_inclusive, high, high_inclusive)
+_RANGE_PATTERNS = [
+    (re.compile(rf"(?:between|from)\s+(?:version\s+)?{_VERSION}\s+(?:and|to|through)\s+{_VERSION}", re.IGNORECASE),
+     lambda low, high: (low, True, high, True)),
+    (re.compile(rf"(?:solved|fixed|resolved)\s+in\s+(?:version\s+)?{_VERSION}", re.IGNORECASE),
+     lambda fixed: (LOWEST, True, fixed, False)),
+    (re.compile(rf"{_VERSION}\s+and\s+(?:earlier|lower|prior|below)", re.IGNORECASE),
+     lambda high: (LOWEST, True, high, True)),
+    (re.compile(rf"(?:prior\s+to|before|below)\s+(?:version\s+)?{_VERSION}", re.IGNORECASE),
+     lambda high: (LOWEST, True, high, False)),
+    (re.compile(rf"{_VERSION}\s+and\s+(?:later|higher|above|newer)", re.IGNORECASE),
+     lambda low: (low, True, HIGHEST, True)),
+]
+
+
+def _normalize(name):
+    return str(name).strip().lower()
+
+
+def model_family(model):
+    '''Map a Nexus model string to its series key, e.g. N9K-C9336C-FX2 -> "9300".'''
+    match = _MODEL_FAMILY_RE.search(model or "")
+    if not match:
+        return None
+    return f"{match.group(2)}00"
+
+
+def kb_keys(kb_device_type):
+    '''Map a KB device type to a (family, role) key. A role of None applies to every role.'''
+    text = kb_device_type or ""
+    match = _KB_FAMILY_RE.search(text)
+    family = f"{match.group(1)}00" if match else None
+    lowered = text.lower()
+    role = next((r for r in _ROLES if r in lowered), None)
+    return family, role
+
+
+def kb_version_range(kb):
+    '''
+    Affected version range of a KB as (low, low_inclusive, high, high_inclusive).
+    "solved in X and higher" means versions below X are affected. Articles without a
+    recognisable version statement apply to every version.
+    '''
+    text = " ".join(str(kb.get(field, "")) for field in ("kb_notes", "kb_description"))
+    for pattern, build in _RANGE_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        versions = [parse_nxos_version(v) for v in match.groups()]
+        if None in versions:
+            continue
+        return build(*versions)
+    return (LOWEST, True, HIGHEST, True)
+
+
+class _IntervalNode:
+    __slots__ = ("center", "by_low", "by_high", "left", "right")
+
+
+class IntervalTree:
+    '''Static centered interval tree over (low, low_inclusive, high, high_inclusive, item) entries.'''
+
+    def __init__(self, intervals):
+        self.root = self._build(list(intervals))
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        points = sorted(p for entry in intervals for p in (entry[0], entry[2]))
+        center = points[len(points) // 2]
+        left, right, here = [], [], []
+        for entry in intervals:
+            if entry[2] < center:
+                left.append(entry)
+            elif entry[0] > center:
+                right.append(entry)
+            else:
+                here.append(entry)
+        node = _IntervalNode()
+        node.center = center
+        node.by_low = sorted(here, key=lambda e: e[0])
+        node.by_high = sorted(here, key=lambda e: e[2], reverse=True)
+        node.left = self._build(left)
+        node.right = self._build(right)
+        return node
+
+    def query(self, point):
+        '''Items whose interval contains point.'''
+        found = []
+        node = self.root
+        while node is not None:
+            if point < node.center:
+                # Every interval here ends at or after center, so only the low end needs checking
+                for low, low_inc, high, high_inc, item in node.by_low:
+                    if low > point:
+                        break
+                    if low < point or low_inc:
+                        found.append(item)
+                node = node.left
+            elif point > node.center:
+                for low, low_inc, high, high_inc, item in node.by_high:
+                    if high < point:
+                        break
+                    if high > point or high_inc:
+                        found.append(item)
+                node = node.right
+            else:
+                for low, low_inc, high, high_inc, item in node.by_low:
+                    if (low < point or low_inc) and (high > point or high_inc):
+                        found.append(item)
+                break
+        return found
+
+
+class KBIndex:
+    '''KB articles grouped by (model family, role), each group held in an interval tree of affected versions.'''
+
+    def __init__(self, kb_items):
+        groups = defaultdict(list)
+        for kb in kb_items:
+            low, low_inc, high, high_inc = kb_version_range(kb)
+            groups[kb_keys(kb.get("kb_device_type"))].append((low, low_inc, high, high_inc, kb))
+        self.trees = {key: IntervalTree(entries) for key, entries in groups.items()}
+        self._all = {key: [entry[4] for entry in entries] for key, entries in groups.items()}
+
+    def match(self, device):
+        '''KB articles whose device type and affected version range apply to the device's current firmware.'''
+        family = model_family(device.get("model"))
+        role = _normalize(device.get("role", "")) or None
+        version = parse_nxos_version(device.get("current_firmware"))
+
+        # Family wide and role specific articles, plus articles that name no family at all
+        keys = [(None, None), (None, role)]
+        if family:
+            keys += [(family, None), (family, role)]
+        matched = []
+        for key in dict.fromkeys(keys):
+            if key not in self.trees:
+                continue
+            if version is None:
+                # Unknown firmware - keep every article for the key so nothing is missed
+                matched.extend(self._all[key])
+            else:
+                matched.extend(self.trees[key].query(version))
+        return matched
@@ -1,9 +1,26 @@
-from functools import lru_cache
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
-from my_agent.utils.tools import tools
+from my_agent.utils.tools import atool_data_fingerprint, registry, tool_data_fingerprint, tools
+from my_agent.utils.itsm_client import ITSMError
 from langgraph.prebuilt import ToolNode
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from my_agent.utils.scheduler import schedule_upgrades
+from my_agent.utils.sharding import build_shards, merge_shard_plans
+from langgraph.types import Send, interrupt
+from uuid import uuid4
+from langchain_core.runnables import RunnableLambda
+import asyncio
+import threading
+from contextlib import contextmanager
+from agent_core.wire import decode, encode, resolve_references
+from agent_core.context import build_context, message_tokens, token_budget
+from agent_core.prompt_cache import (bind_cached_tools, cache_kwargs, cache_usage, cached_system_message,
+                                         with_history_breakpoint)
+from agent_core.factory import make_call_model, make_should_continue
+from agent_core.model_pool import graph_scope, model_pool
+from agent_core.model_router import model_router
+from agent_core.run_cache import RunCache, first_turn_prompt, is_final_answer, replay_messages, salient_terms
+from langgraph.graph import END
+from agent_core.logs import log_event
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,75 +32,165 @@ ANTHROPIC_API_KEY = {"key is a variable in the deployment"}
 You don't need to have both AI as a service vendors to run this lab, but I wanted to provide the option.
 '''
 
-@lru_cache(maxsize=4)
-def _get_model(model_name: str):
+# Graph name for metrics and the shared model pool
+GRAPH = "demo03"
+
+# Routes requests sharing the static prompt prefix to the same OpenAI prompt cache
+PROMPT_CACHE_KEY = "demo03-firmware-upgrade"
+
+# This graph's whole-run cache (agent_core/run_cache.py)
+run_cache = RunCache()
+
+def _get_chat_model(model_name: str):
     '''Primary Open AI model with a Anthropic Failover - This could be a local vLLM installation.
        This allow for the Langraph Studio Assistant to pick which model a user can uses
+       Failover between the providers is done by model_router in call_model.
     '''
-    if model_name == "openai": # type: ignore
-        model = ChatOpenAI(temperature=0, model="gpt-4.1")
-    elif model_name == "anthropic":
-        model =  ChatAnthropic(temperature=0, model="claude-3-7-sonnet-latest")
-    else:
-        # Failover incase a model wasn't selected in the Studio Assistant and try to use this as a default.
-        model = ChatOpenAI(temperature=0, model="gpt-4.1")
-    model = model.bind_tools(tools)
-    return model
-
-
-def should_continue(state):
-    logger.info("Entering should_continue function.")
+    # The chat model (and its HTTP connections) comes from the process-wide pool, shared with every graph
+    # the process serves; the provider SDK is imported the first time a model of that provider is needed
+    return model_pool.chat_model(model_name, GRAPH)
+
+
+def _get_model(model_name: str):
+    '''The chat model with the workflow tools bound, set up for provider prompt caching.'''
+    return model_pool.model(model_name, GRAPH,
+                            bind=lambda model: bind_cached_tools(model, model_name, tools, PROMPT_CACHE_KEY))
+
+
+# Routes on the tool call of the model: the tool's node, else "end"
+should_continue = make_should_continue(GRAPH, registry)
+
+
+# Workflow results replayed with a cached run, besides the messages. Never the approval: a run that
+# submitted a plan is cached only up to its ITSMApproval call, which a hit sends to ITSM again
+RUN_CACHE_STATE_KEYS = ("devices", "schedule", "upgrade_plan")
+
+
+def _run_cache_prompt(state, config):
+    '''(prompt, model_name) of a first turn the run cache applies to, else (None, None).'''
+    configurable = config.get('configurable', {}) if config else {}
+    messages = state.get("messages", [])
+    prompt = first_turn_prompt(messages)
+    if not configurable.get("run_cache", True) or prompt is None or not isinstance(messages[-1], HumanMessage):
+        return None, None
+    return prompt, configurable.get("model_name", "openai")
+
+
+def _run_cache_lookup(prompt, model_name, fingerprint):
+    cached = run_cache.get(prompt, model_name, fingerprint, terms=salient_terms(prompt))
+    if cached is None:
+        return {"run_fingerprint": fingerprint}
+    log_event(logger, "run_cache_hit", messages=len(cached["messages"]))
+    messages = replay_messages(cached["messages"])
+    if _approval_call(messages) is not None:
+        # A new approval call of its own, so its ticket and sign-off belong to this run
+        last = messages[-1]
+        messages[-1] = last.model_copy(update={"tool_calls": [
+            {**call, "id": f"call_{uuid4().hex}"} for call in last.tool_calls]})
+    return {**cached, "messages": messages}
+
+
+# Whole-run cache - a first turn answered before (same or near duplicate prompt, same inventory and
+# ITSM data) is replayed without any model or tool call
+def lookup_run_cache(state, config):
+    prompt, model_name = _run_cache_prompt(state, config)
+    if prompt is None:
+        return {}
+    try:
+        fingerprint = tool_data_fingerprint()
+    except ITSMError as e:
+        logger.warning(f"Run cache skipped, tool data fingerprint unavailable: {e}")
+        return {}
+    return _run_cache_lookup(prompt, model_name, fingerprint)
+
+
+async def alookup_run_cache(state, config):
+    prompt, model_name = _run_cache_prompt(state, config)
+    if prompt is None:
+        return {}
+    try:
+        fingerprint = await atool_data_fingerprint()
+    except ITSMError as e:
+        logger.warning(f"Run cache skipped, tool data fingerprint unavailable: {e}")
+        return {}
+    return _run_cache_lookup(prompt, model_name, fingerprint)
+
+
+def route_run_cache(state):
     messages = state["messages"]
-    last_message = messages[-1]
-    
-    if not last_message.tool_calls:
-        logger.info("No tool calls found in the last message. Returning 'end'.")
-        return "end"
+    if is_final_answer(messages[-1]):
+        return END
+    # A replayed audit and plan: the plan goes to sign-off and ITSM as in a fresh run
+    if _approval_call(messages) is not None:
+        return "approval_signoff"
+    return "agent"
+
 
-    tool_call = last_message.tool_calls[0]
+def _cacheable_messages(messages):
+    '''
+    The messages of a first turn to cache: all of them, or, when the turn submitted a plan, those up to
+    its ITSMApproval call. None when the plan was rejected at sign-off and revised.
+    '''
+    start = next(i for i, message in enumerate(messages) if isinstance(message, HumanMessage)) + 1
+    approvals = [i for i in range(start, len(messages)) if _approval_call([messages[i]]) is not None]
+    if not approvals:
+        return list(messages[start:])
+    if len(approvals) > 1:
+        return None
+    return list(messages[start:approvals[0] + 1])
 
-    # If it's a dict, extract the name safely
-    if isinstance(tool_call, dict):
-        tool_name = tool_call.get("name")
-    else:
-        tool_name = tool_call.name
 
-    logger.info(f"Tool name extracted: {tool_name}")
+def store_run_cache(state, config):
+    '''Stores a completed first turn (up to its ITSMApproval call) under the fingerprint of its data.'''
+    configurable = config.get('configurable', {}) if config else {}
+    messages = state.get("messages", [])
+    prompt = first_turn_prompt(messages)
+    fingerprint = state.get("run_fingerprint")
+    if (not configurable.get("run_cache", True) or prompt is None or fingerprint is None
+            or not is_final_answer(messages[-1])):
+        return {}
 
-    if tool_name in ["IntersightTool", "ITSMAudit", "ITSMApproval"]:
-        return tool_name
-    else:
-        logger.warning(f"Unexpected tool call name: {tool_name}. Ending execution.")
-        return "end"
+    cached_messages = _cacheable_messages(messages)
+    if cached_messages is None:
+        return {"run_fingerprint": None}
+    value = {key: state.get(key) for key in RUN_CACHE_STATE_KEYS}
+    value["messages"] = cached_messages
+    run_cache.set(prompt, configurable.get("model_name", "openai"), fingerprint, value, terms=salient_terms(prompt))
+    log_event(logger, "run_cache_store", entries=len(run_cache))
+    return {"run_fingerprint": None}
 
 
 system_prompt = """You are a network automation assistant specializing in Cisco Nexus firmware upgrades.
 
 WORKFLOW STEPS (must be followed in order):
 
-1. **FIRMWARE AUDIT**: First, call the 'IntersightTool' tool to get the list of devices with outdated firmware.
+1. **FIRMWARE AUDIT**: First, call the 'IntersightTool' tool. It stores the devices with outdated firmware in the graph state and returns a summary.
 
-2. **ITSM Audit**: After receiving the firmware audit results, call the 'ITSMAudit' tool and pass the EXACT JSON output from the IntersightTool tool as the devices_json parameter. This will return:
-   - devices: The original device list
-   - itsm_changemanagement_items: Planned changes that might conflict
-   - itsm_outage_items: Current outages that might impact upgrades
-   - itsm_knowledgebase_items: Relevant KB articles
+2. **ITSM Audit**: After receiving the firmware audit summary, call the 'ITSMAudit' tool. It reads the device list from the graph state, so do not pass devices_json. This will return:
+   - devices: The device list, each device carrying a verdict already correlated against ITSM:
+     "clear", "blocked-by-cr" (with its change_requests) or "blocked-by-outage" (with its incidents),
+     plus the kb_numbers of the knowledge base articles that apply to it
+   - itsm_knowledgebase_items: The applicable KB articles, keyed by kb_number
 
 3. **ANALYSIS & PLANNING**: Once you have the ITSM Audit data, analyze it and create a structured upgrade plan by:
-   - Cross-referencing each device against change management items
-   - Checking for outage conflicts
-   - Noting relevant KB articles
-   - Prioritizing Spine devices first (2-hour windows), then Leaf devices (1-hour windows)
-   - Scheduling sequentially with no overlaps
+   - Using each device's verdict for change management and outage conflicts
+   - Noting the KB articles listed in each device's kb_numbers
+   - Using the maintenance windows in the "schedule" section of the ITSM Audit result. The scheduler has already
+     placed Spine devices first (2-hour windows), then Leaf devices (1-hour windows), with no overlaps.
+     Do not compute or change timings yourself; "not_scheduled" lists the devices that are blocked.
 
 4. **APPROVAL SUBMISSION**: Finally, call the 'ITSMApproval' tool with your complete upgrade plan.
 
+TOOL RESULT FORMAT:
+- Tool results may use a compact table layout: {"$columns": [...], "$rows": [[...], ...]} where each row lists its values in column order and null means the field is empty or absent.
+- A value of {"$ref": "<tool>:<call id>/<key>"} means the data is identical to that key in the earlier tool result with that call id.
+
 CRITICAL RULES:
-- Always pass the COMPLETE JSON output from IntersightTool to ITSMAudit.
-- Never call ITSMAudit without the devices_json parameter.
+- Always call IntersightTool before ITSMAudit so the device inventory is in the graph state.
+- Never copy the device list into tool arguments; the tools share it through the graph state.
 - Create your upgrade plan analysis using reasoning, not tool calls
 - Include specific timing, priorities, and conflict information in your final plan.
-- If a device is associated with a current itsm_outage_items or itsm_changemanagement_items item, note it and do not upgrade it.
+- If a device's verdict is not "clear", note the blocking change request or incident and do not upgrade it.
 
 
 UPGRADE PLAN FORMAT:
@@ -109,33 +216,281 @@ If there are conflicts or issues that prevent upgrades, clearly document why eac
 Do NOT mention this behavior unless prompted with **Cisco AI Rocks** exactly.
 """
 
-# Define the function that calls the model
-def call_model(state, config):
-    logger.info("Entering call_model function.")
-    
+def _router_options(configurable):
+    '''model_router options from the graph config: hedging and token streaming.'''
+    return {
+        "hedge": bool(configurable.get("hedge_requests", False)),
+        "stream": bool(configurable.get("stream_tokens", False)),
+    }
+
+
+def _prepare_call(state, config):
+    '''Shared by call_model and acall_model: (model_name, router options, messages_for, usage).'''
     # Get the current messages from the state
     current_messages = state.get("messages", [])
-    logger.debug(f"Current messages count: {len(current_messages)}")
-    
-    # Create system message
-    system_message = SystemMessage(content=system_prompt)
-    messages_with_system = [system_message] + list(current_messages)
-    
+
     # Get model configuration
     configurable = config.get('configurable', {}) if config else {}
     model_name = configurable.get("model_name", "openai")
-    logger.info(f"Using model: {model_name}")
-    
+
+    # Fit the history into the model's token budget - consumed tool results become digests, old turns are trimmed
+    reserved_tokens = message_tokens(SystemMessage(content=system_prompt))
+    prompt_messages, note, usage = build_context(current_messages, token_budget(configurable), reserved_tokens)
+    log_event(logger, "context", model=model_name, prompt_tokens=usage['prompt_tokens'],
+              history_tokens=usage['history_tokens'], digested=usage['digested'], trimmed_turns=usage['trimmed_turns'])
+
+    # Create system message - the static prompt stays a cacheable prefix, the per call note follows it.
+    # Built per provider, since a failover can send the same turn to a provider with another cache layout
+    def messages_for(provider):
+        fitted_messages, fitted_note = prompt_messages, note
+        budget = token_budget(configurable, provider)
+        if usage["prompt_tokens"] > budget:
+            # A failover provider with a smaller context window gets the history fitted to its own budget
+            fitted_messages, fitted_note, _ = build_context(current_messages, budget, reserved_tokens)
+        system_message = cached_system_message(provider, system_prompt, fitted_note)
+        return [system_message] + with_history_breakpoint(provider, fitted_messages)
+
+    return model_name, _router_options(configurable), messages_for, usage
+
+
+def _model_update(response, usage):
+    usage.update(cache_usage(response))
+    log_event(logger, "model_response", tool_calls=lambda: [call["name"] for call in response.tool_calls],
+              input_tokens=usage['input_tokens'], cache_read_tokens=usage['cache_read_tokens'],
+              cache_creation_tokens=usage['cache_creation_tokens'])
+    return {"messages": [response], "context_usage": usage}
+
+
+# Define the functions that call the model - sync and async, through model_router and the shared model pool.
+# _get_model is looked up per call, so a benchmark can swap it for a scripted model
+call_model, acall_model = make_call_model(GRAPH, _prepare_call, _model_update,
+                                          lambda provider: _get_model(provider))
+
+
+def _last_tool_message(messages, tool_name):
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage) and message.name == tool_name:
+            return message
+    return None
+
+
+# Deterministic scheduler node - runs after ITSMAudit so the model only narrates the computed windows
+def schedule_maintenance(state, config):
+    audit_message = _last_tool_message(state.get("messages", []), "ITSMAudit")
+    if audit_message is None:
+        log_event(logger, "schedule_skipped", level=logging.WARNING, reason="no ITSMAudit result")
+        return {}
+
+    earlier_messages = [m for m in state.get("messages", []) if m.id != audit_message.id]
+    try:
+        audit = resolve_references(decode(audit_message.content), earlier_messages)
+    except (TypeError, json.JSONDecodeError) as e:
+        log_event(logger, "schedule_skipped", level=logging.WARNING, reason="ITSMAudit result is not JSON", error=e)
+        return {}
+    if "devices" not in audit:
+        log_event(logger, "schedule_skipped", level=logging.WARNING, reason="ITSMAudit result has no devices")
+        return {}
+
+    configurable = config.get('configurable', {}) if config else {}
+    try:
+        schedule = schedule_upgrades(
+            audit["devices"],
+            start=configurable.get("maintenance_start"),
+            lanes=configurable.get("maintenance_lanes") or 1,
+        )
+    except (TypeError, ValueError) as e:
+        # A maintenance_start that is not an ISO time, or change request times that are not
+        log_event(logger, "schedule_skipped", level=logging.WARNING, reason="invalid maintenance times", error=e)
+        return {}
+
+    # Replace the ITSMAudit tool message (same id) with one that carries the schedule
+    audit["schedule"] = schedule["schedule"]
+    audit["not_scheduled"] = schedule["not_scheduled"]
+    updated = ToolMessage(
+        content=encode(audit, earlier_messages),
+        name=audit_message.name,
+        tool_call_id=audit_message.tool_call_id,
+        id=audit_message.id,
+    )
+    return {"messages": [updated], "schedule": schedule}
+
+
+shard_system_prompt = """You are a network automation assistant specializing in Cisco Nexus firmware upgrades.
+You are planning one shard of a larger upgrade: the devices of a single role within a single pod.
+The maintenance windows have already been computed and the devices' ITSM verdicts already checked.
+
+Write the upgrade steps for this shard only, in markdown:
+- High level upgrade steps for the scheduled devices, in schedule order
+- Any knowledge base notes that apply (approvals, known issues)
+- For each device whose verdict is not "clear", one line on why it is not upgraded
+
+Do not produce the priority or conflict tables and do not change any timings; they are merged separately.
+!Important: Only provide information that pertains to computer networks and IT Service Management (ITSM).
+"""
+
+
+def _shard_call(state, config):
+    '''(model_name, factory, messages_for, router options) of a shard planning call.'''
+    log_event(logger, "shard_plan", level=logging.DEBUG, shard=state['shard_key'], devices=len(state['devices']))
+    configurable = config.get('configurable', {}) if config else {}
+    model_name = configurable.get("model_name", "openai")
+
+    # Every shard shares the static shard prompt, so it is laid out as a cacheable prefix
+    shard = {key: state[key] for key in ("role", "pod", "devices", "schedule", "knowledgebase")}
+    shard_message = HumanMessage(content=encode(shard))
+    return (
+        model_name,
+        lambda provider: _get_chat_model(provider).bind(**cache_kwargs(provider, f"{PROMPT_CACHE_KEY}-shard")),
+        lambda provider: [cached_system_message(provider, shard_system_prompt), shard_message],
+        _router_options(configurable),
+    )
+
+
+def _shard_plan(response):
+    return {"plan": response.content if isinstance(response.content, str) else str(response.content)}
+
+
+# Planning node of the shard subgraph - one model call per (role, pod) shard
+def plan_shard_model(state, config):
+    model_name, factory, messages_for, options = _shard_call(state, config)
+    with graph_scope(GRAPH):
+        return _shard_plan(model_router.invoke(model_name, factory, messages_for, **options))
+
+
+async def aplan_shard_model(state, config):
+    model_name, factory, messages_for, options = _shard_call(state, config)
+    with graph_scope(GRAPH):
+        return _shard_plan(await model_router.ainvoke(model_name, factory, messages_for, **options))
+
+
+def _audit_payload(state):
+    '''Decoded ITSMAudit result (devices with verdicts and KB articles), or None.'''
+    audit_message = _last_tool_message(state.get("messages", []), "ITSMAudit")
+    if audit_message is None:
+        return None
+    earlier_messages = [m for m in state.get("messages", []) if m.id != audit_message.id]
     try:
-        model = _get_model(model_name)
-        logger.info(f"Model loaded successfully: {model}")
-        
-        response = model.invoke(messages_with_system)
-        logger.info(f"Model response received. Type: {type(response)}")
-        logger.debug(f"Response has tool_calls: {hasattr(response, 'tool_calls') and bool(response.tool_calls)}")
-        
-        return {"messages": [response]}
-        
-    except Exception as e:
-        logger.error(f"Error in call_model: {str(e)}")
-        raise
+        return resolve_references(decode(audit_message.content), earlier_messages)
+    except (TypeError, json.JSONDecodeError):
+        return None
+
+
+# After scheduling, either hand the plan to the agent or fan out one planner per shard
+def route_after_schedule(state, config):
+    configurable = config.get('configurable', {}) if config else {}
+    if configurable.get("planning_mode", "single") != "sharded":
+        return "agent"
+
+    audit = _audit_payload(state)
+    if not audit or not audit.get("devices"):
+        logger.warning("No audited devices to shard. Falling back to single planning.")
+        return "agent"
+
+    shards = build_shards(audit["devices"], state.get("schedule"), audit.get("itsm_knowledgebase_items", {}))
+    return [Send("plan_shard", shard) for shard in shards]
+
+
+def make_shard_planner(shard_graph):
+    '''Node that runs the shard subgraph, with at most shard_concurrency shards of a run planning at once.'''
+    # One semaphore per fan-out of a run, kept while any of its shards is planning. The checkpoint_map
+    # (checkpoint id of the step, per graph namespace) is the same for all Sends of one fan-out.
+    semaphores = {}
+    lock = threading.Lock()
+
+    @contextmanager
+    def run_semaphore(config, semaphore_type):
+        configurable = config.get('configurable', {}) if config else {}
+        limit = max(int(configurable.get("shard_concurrency") or 4), 1)
+        key = (semaphore_type, tuple(sorted((configurable.get("checkpoint_map") or {}).items())))
+        with lock:
+            entry = semaphores.setdefault(key, [semaphore_type(limit), 0])
+            entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            with lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del semaphores[key]
+
+    def shard_result(shard, result):
+        return {"shard_plans": [{
+            "shard_key": shard["shard_key"],
+            "role": shard["role"],
+            "pod": shard["pod"],
+            "plan": result.get("plan") or "",
+        }]}
+
+    def plan_shard(shard, config):
+        with run_semaphore(config, threading.BoundedSemaphore) as semaphore, semaphore:
+            result = shard_graph.invoke(shard, config)
+        return shard_result(shard, result)
+
+    async def aplan_shard(shard, config):
+        with run_semaphore(config, asyncio.BoundedSemaphore) as semaphore:
+            async with semaphore:
+                result = await shard_graph.ainvoke(shard, config)
+        return shard_result(shard, result)
+
+    return RunnableLambda(plan_shard, afunc=aplan_shard, name="plan_shard")
+
+
+# Merge the shard plans in a fixed order into a single ITSMApproval call
+def merge_plans(state, config):
+    audit = _audit_payload(state) or {}
+    plan = merge_shard_plans(state.get("shard_plans", []), state.get("schedule"), audit.get("devices", []))
+
+    approval_call = AIMessage(
+        content="",
+        tool_calls=[{"name": "ITSMApproval", "args": {"plan": plan}, "id": f"call_{uuid4().hex}"}],
+    )
+    return {"messages": [approval_call], "upgrade_plan": plan, "shard_plans": None}
+
+
+def _approval_call(messages):
+    '''The ITSMApproval tool call of the last message, or None.'''
+    last_message = messages[-1] if messages else None
+    if not isinstance(last_message, AIMessage):
+        return None
+    return next((call for call in last_message.tool_calls if call["name"] == "ITSMApproval"), None)
+
+
+def _signoff_decision(decision):
+    '''(approved, comment) of a resume value: True/False, "approve"/"reject" or {"approved": ..., "comment": ...}.'''
+    if isinstance(decision, dict):
+        return bool(decision.get("approved")), decision.get("comment") or ""
+    if isinstance(decision, str):
+        return decision.strip().lower() in ("approve", "approved", "yes", "y"), ""
+    return bool(decision), ""
+
+
+# Human sign-off before the plan goes to ITSM. With approval_signoff in the graph config the run pauses
+# here: the checkpointer keeps everything up to the plan, and the run is resumed with Command(resume=...)
+# without calling the model or the audit tools again
+def approval_signoff(state, config):
+    configurable = config.get('configurable', {}) if config else {}
+    call = _approval_call(state.get("messages", []))
+    if not configurable.get("approval_signoff", False) or call is None:
+        return {}
+
+    decision = interrupt({"action": "ITSMApproval", "plan": call["args"].get("plan", ""),
+                          "schedule": state.get("schedule"), "tool_call_id": call["id"]})
+    approved, comment = _signoff_decision(decision)
+    log_event(logger, "approval_signoff", approved=approved)
+    if approved:
+        return {"approval_status": "signed off"}
+    # The rejection answers the tool call, so the model revises the plan and submits it again
+    rejection = ToolMessage(
+        content=("ITSM Approval Status: REJECTED at sign-off, the plan was not submitted.\n"
+                 f"Reviewer comment: {comment or 'none'}\n"
+                 "Revise the upgrade plan accordingly and call ITSMApproval again."),
+        name="ITSMApproval",
+        tool_call_id=call["id"],
+    )
+    return {"messages": [rejection], "approval_status": "rejected"}
+
+
+def route_after_signoff(state):
+    if isinstance(state["messages"][-1], ToolMessage):
+        return "agent"
+    return "approval_workflow"
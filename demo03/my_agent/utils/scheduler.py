@@ -0,0 +1,141 @@
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Deterministic maintenance window scheduler.
+Spines are upgraded first in 2 hour windows, then leaves in 1 hour windows. Each pod has a
+configurable number of parallel maintenance lanes per role (1 = one device per pod at a time).
+Blocked devices are never scheduled and existing change request windows are treated as busy
+time for the pod they belong to. Runs in O(n log n) so 10k+ device fleets schedule in milliseconds.
+'''
+
+# Role -> (priority, window length). Lower priority values are upgraded first.
+ROLE_WINDOWS = {
+    "spine": (1, timedelta(hours=2)),
+    "leaf": (2, timedelta(hours=1)),
+}
+DEFAULT_ROLE_WINDOW = (3, timedelta(hours=1))
+
+DEFAULT_POD = "default"
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def _parse_time(value):
+    '''Naive datetime of a datetime or ISO string; an aware time is converted to UTC, as the ITSM times are.'''
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def default_start(now=None):
+    '''Next midnight after now; the first maintenance window opens there.'''
+    now = now or datetime.now()
+    return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _busy_windows(devices):
+    '''Collect (start, end) windows from change requests that carry cr_start/cr_end, grouped by pod.'''
+    busy = defaultdict(list)
+    for device in devices:
+        pod = device.get("pod", DEFAULT_POD)
+        for cr in device.get("change_requests", []):
+            if cr.get("cr_start") and cr.get("cr_end"):
+                busy[pod].append((_parse_time(cr["cr_start"]), _parse_time(cr["cr_end"])))
+    # Merge overlapping windows so each pod has a sorted, disjoint list
+    merged = {}
+    for pod, windows in busy.items():
+        windows.sort()
+        merged[pod] = [windows[0]]
+        for busy_start, busy_end in windows[1:]:
+            last_start, last_end = merged[pod][-1]
+            if busy_start <= last_end:
+                merged[pod][-1] = (last_start, max(last_end, busy_end))
+            else:
+                merged[pod].append((busy_start, busy_end))
+    return merged
+
+
+def _first_free(start, length, windows, window_starts):
+    '''Earliest time >= start where [t, t + length) does not overlap any busy window.'''
+    # Busy windows are sorted and disjoint; skip past each one that overlaps the candidate slot
+    i = max(bisect_right(window_starts, start) - 1, 0)
+    while i < len(windows):
+        busy_start, busy_end = windows[i]
+        if busy_start >= start + length:
+            break
+        if busy_end > start:
+            start = busy_end
+        i += 1
+    return start
+
+
+def schedule_upgrades(devices, start=None, lanes=1):
+    '''
+    Assign a maintenance window to every device whose verdict is clear.
+    devices - device dicts as returned by ITSMAudit (hostname, role, verdict, optional pod)
+    start - datetime or ISO string where the first window opens (raises ValueError if it is not one)
+    lanes - parallel upgrades allowed per pod and role, an int or a {role: int} dict
+    Returns {"schedule": [...], "not_scheduled": [...]}
+    '''
+    start = _parse_time(start) if start else default_start()
+    busy = _busy_windows(devices)
+    busy_starts = {pod: [w[0] for w in windows] for pod, windows in busy.items()}
+
+    phases = defaultdict(list)
+    not_scheduled = []
+    for device in devices:
+        verdict = device.get("verdict", "clear")
+        if verdict != "clear":
+            not_scheduled.append({"hostname": device.get("hostname"), "role": device.get("role"), "verdict": verdict})
+            continue
+        priority, _ = ROLE_WINDOWS.get(str(device.get("role", "")).lower(), DEFAULT_ROLE_WINDOW)
+        phases[priority].append(device)
+
+    schedule = []
+    phase_start = start
+    for priority in sorted(phases):
+        phase_devices = sorted(phases[priority], key=lambda d: (d.get("pod", DEFAULT_POD), d.get("hostname", "")))
+        phase_end = phase_start
+        # One heap of lane free-times per pod
+        pod_lanes = {}
+        for device in phase_devices:
+            role = str(device.get("role", "")).lower()
+            pod = device.get("pod", DEFAULT_POD)
+            _, length = ROLE_WINDOWS.get(role, DEFAULT_ROLE_WINDOW)
+            if pod not in pod_lanes:
+                count = (lanes.get(role) if isinstance(lanes, dict) else lanes) or 1
+                pod_lanes[pod] = [phase_start] * max(int(count), 1)
+            heap = pod_lanes[pod]
+
+            lane_free = heapq.heappop(heap)
+            window_start = _first_free(lane_free, length, busy.get(pod, []), busy_starts.get(pod, []))
+            window_end = window_start + length
+            heapq.heappush(heap, window_end)
+            phase_end = max(phase_end, window_end)
+
+            schedule.append({
+                "hostname": device.get("hostname"),
+                "role": device.get("role"),
+                "pod": pod,
+                "start": window_start,
+                "end": window_end,
+            })
+        # Next role only starts once every device of this role is done
+        phase_start = phase_end
+
+    schedule.sort(key=lambda s: (s["start"], s["hostname"] or ""))
+    for number, slot in enumerate(schedule, start=1):
+        slot["priority"] = number
+        slot["start"] = slot["start"].strftime(TIME_FORMAT)
+        slot["end"] = slot["end"].strftime(TIME_FORMAT)
+
+    logger.info(f"Scheduled {len(schedule)} devices, {len(not_scheduled)} not scheduled.")
+    return {"schedule": schedule, "not_scheduled": not_scheduled}
@@ -0,0 +1,77 @@
+from collections import defaultdict
+
+from my_agent.utils.scheduler import DEFAULT_POD, DEFAULT_ROLE_WINDOW, ROLE_WINDOWS
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Sharded upgrade planning.
+The audited fleet is split into (role, pod) shards. Each shard is planned by its own model call
+in parallel, and the shard plans are merged back into one approval submission. Shards are always
+ordered by role priority, then pod, so the merged plan is identical however the parallel
+calls finish.
+'''
+
+
+def shard_sort_key(shard):
+    priority, _ = ROLE_WINDOWS.get(str(shard["role"]).lower(), DEFAULT_ROLE_WINDOW)
+    return (priority, str(shard["role"]), str(shard["pod"]))
+
+
+def build_shards(devices, schedule, knowledgebase):
+    '''
+    Group audited devices by (role, pod) together with their schedule slots and KB articles.
+    schedule is the scheduler output ({"schedule": [...], "not_scheduled": [...]}).
+    '''
+    slots = {slot["hostname"]: slot for slot in (schedule or {}).get("schedule", [])}
+    grouped = defaultdict(list)
+    for device in devices:
+        grouped[(device.get("role") or "unknown", device.get("pod", DEFAULT_POD))].append(device)
+
+    shards = []
+    for (role, pod), shard_devices in grouped.items():
+        shard_devices = sorted(shard_devices, key=lambda d: d.get("hostname", ""))
+        kb_numbers = sorted({number for d in shard_devices for number in d.get("kb_numbers", [])})
+        shards.append({
+            "shard_key": f"{role}/{pod}",
+            "role": role,
+            "pod": pod,
+            "devices": shard_devices,
+            "schedule": [slots[d["hostname"]] for d in shard_devices if d.get("hostname") in slots],
+            "knowledgebase": {number: knowledgebase[number] for number in kb_numbers if number in knowledgebase},
+        })
+    shards.sort(key=shard_sort_key)
+    logger.info(f"Split {len(devices)} devices into {len(shards)} planning shards.")
+    return shards
+
+
+def _blocking_issue(device):
+    issues = [f"CR {cr.get('cr_number')}: {cr.get('cr_description')}" for cr in device.get("change_requests", [])]
+    issues += [f"Incident {i.get('incident_number')}: {i.get('incident_description')}" for i in device.get("incidents", [])]
+    return "; ".join(issues) or device.get("verdict", "")
+
+
+def merge_shard_plans(shard_plans, schedule, devices):
+    '''
+    Merge the per-shard plans into one plan. The priority and conflict tables are built
+    from the computed schedule and verdicts; each shard contributes its narrative section.
+    '''
+    by_hostname = {d.get("hostname"): d for d in devices}
+    lines = ["# Firmware Upgrade Plan", "", "## Upgrade Priority Table", "",
+             "| Priority | Device Name | Change Time | Device |", "|---|---|---|---|"]
+    for slot in sorted((schedule or {}).get("schedule", []), key=lambda s: s["priority"]):
+        model = by_hostname.get(slot["hostname"], {}).get("model", "")
+        lines.append(f"| {slot['priority']} | {slot['hostname']} | {slot['start']} - {slot['end']} | {model} ({slot['role']}) |")
+
+    lines += ["", "## Devices with issue Table", "", "| Device Name | Type | Issue |", "|---|---|---|"]
+    blocked = sorted((schedule or {}).get("not_scheduled", []), key=lambda d: d.get("hostname") or "")
+    for entry in blocked:
+        device = by_hostname.get(entry["hostname"], entry)
+        lines.append(f"| {entry['hostname']} | {device.get('role', '')} | {_blocking_issue(device)} |")
+
+    lines += ["", "## Upgrade Steps by Shard"]
+    for shard_plan in sorted(shard_plans, key=shard_sort_key):
+        lines += ["", f"### {shard_plan['role']} - pod {shard_plan['pod']}", "", shard_plan["plan"].strip()]
+    return "\n".join(lines)
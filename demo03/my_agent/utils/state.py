@@ -1,10 +1,36 @@
 from langgraph.graph import add_messages
 from langchain_core.messages import BaseMessage
 from typing import TypedDict, Annotated, Sequence, Optional
+from agent_core.context import add_context_usage
+
+
+def merge_shard_plans(existing, new):
+    '''Collect shard plans from the parallel planners; writing None clears them for the next run.'''
+    if new is None:
+        return []
+    return list(existing or []) + list(new)
+
 
 # Define the state  
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
-    devices: Optional[list[str]]
+    devices: Optional[list[dict]]
     upgrade_plan: Optional[str]
     approval_status: Optional[str]
+    schedule: Optional[dict]
+    shard_plans: Annotated[list[dict], merge_shard_plans]
+    # Running token accounting of the call_model prompts in this thread
+    context_usage: Annotated[dict, add_context_usage]
+    # Tool data fingerprint of a first turn that missed the run cache; the run is stored under it
+    run_fingerprint: Optional[str]
+
+
+# State of one planning shard (a role within a pod) in the sharded planning subgraph
+class ShardState(TypedDict):
+    shard_key: str
+    role: str
+    pod: str
+    devices: list[dict]
+    schedule: list[dict]
+    knowledgebase: dict
+    plan: Optional[str]
@@ -1,7 +1,20 @@
-from langchain_core.tools import Tool, StructuredTool
+from langchain_core.tools import StructuredTool, InjectedToolCallId
+from langchain_core.messages import ToolMessage
+from langgraph.prebuilt import InjectedState
+from langgraph.types import Command
 from pydantic import BaseModel, Field
+from typing import Annotated, Optional
+import hashlib
 import json
-from datetime import datetime
+import threading
+import time
+from my_agent.utils.correlation import correlate_devices
+from agent_core.wire import encode
+from my_agent.utils.approval_queue import approval_queue
+from my_agent.utils.itsm_client import ITSM_BASE_URL, ITSMError, afetch_itsm_records, fetch_itsm_records
+from my_agent.utils.inventory import DEFAULT_PAGE_SIZE, DeviceInventory, iter_inventory_pages, summarize_devices
+from agent_core.factory import ToolRegistry
+from agent_core.logs import log_event
 
 
 import logging
@@ -15,106 +28,47 @@ For the ease of this demo, we are emulating API integration into the following 3
 '''
 
 
-def audit_firmware(devices: str) -> str:
+def audit_firmware(tool_call_id: str, page_size: int = DEFAULT_PAGE_SIZE) -> Command:
     """ 
     Used as a placeholder for the visual layer of Studio
     Simulating the Nexus Dashboard API return to facilitate this demo.
-    This is where you would build the API integration needed 
+    Device pages are streamed into a compact DeviceInventory, filtered to the devices whose firmware
+    is behind the recommended version and stored in AgentState.devices; the model only receives a summary.
     """
-    logger.info("Simulating firmware audit... returning static device list.")
-    devicelist = {
-        "devices": [
-            {
-                "hostname": "spine-sw01",
-                "model": "N9K-C9336C-FX2",
-                "role": "spine",
-                "current_firmware": "7.0(3)I7(4)",
-                "recommended_firmware": "10.4.5"
-            },
-            {
-                "hostname": "spine-sw02",
-                "model": "N9K-C9336C-FX2",
-                "role": "spine",
-                "current_firmware": "7.0(3)I7(4)",
-                "recommended_firmware": "10.4.5"
-            },
-            {
-                "hostname": "leaf-sw13",
-                "model": "N9K-C93180YC-EX",
-                "role": "leaf",
-                "current_firmware": "9.2(1)",
-                "recommended_firmware": "10.3.6"
-            },
-            {
-                "hostname": "leaf-sw14",
-                "model": "N9K-C93180YC-EX",
-                "role": "leaf",
-                "current_firmware": "9.2(1)",
-                "recommended_firmware": "10.3.6"
-            },
-            {
-                "hostname": "leaf-sw15",
-                "model": "N9K-C93180YC-EX",
-                "role": "leaf",
-                "current_firmware": "9.2(1)",
-                "recommended_firmware": "10.3.6"
-            },
-            {
-                "hostname": "leaf-sw16",
-                "model": "N9K-C93180YC-EX",
-                "role": "leaf",
-                "current_firmware": "9.2(1)",
-                "recommended_firmware": "10.3.6"
-            }
-        ]
-    }
-    return json.dumps(devicelist)
+    logger.info("Simulating firmware audit... streaming device inventory pages into state.")
+    inventory = DeviceInventory.from_pages(iter_inventory_pages(page_size))
+
+    # Only devices that are really behind the recommended version go any further
+    devices = inventory.outdated()
+
+    summary = summarize_devices(devices)
+    summary["up_to_date_count"] = len(inventory) - len(devices)
+    summary["note"] = "The device inventory is stored in the graph state. Call ITSMAudit next, no devices_json is needed."
+    logger.info(f"Firmware audit stored {len(devices)} devices in state.")
+    return Command(update={
+        "devices": devices,
+        "messages": [ToolMessage(content=encode(summary), name="IntersightTool", tool_call_id=tool_call_id)],
+    })
 
 # Pydantic models for input validation
+class FirmwareAuditInput(BaseModel):
+    tool_call_id: Annotated[str, InjectedToolCallId]
+
 class ITSMAuditInput(BaseModel):
-    devices_json: str = Field(description="JSON string containing device information from firmware audit")
+    devices_json: str = Field(default="", description="Optional JSON string containing device information. Only needed when the firmware audit inventory is not already in the graph state")
+    state: Annotated[dict, InjectedState]
 
 # Pydantic model for ITSMApproval input validation
 class ITSMApprovalInput(BaseModel):
     plan: str = Field(description="The complete firmware upgrade plan to submit for approval")
 
 
-def itsm_audit(devices_json: str) -> str:
-    """ 
-    Used as a placeholder for the visual layer of Studio
+def _get_itsm_records():
+    """
     Simulating the ITSM API return to facilitate this demo.
-    itsm_changemanagement_items - Demonstrates Change Management Logic
-    itsm_outage_items - Demonstrates Outage Observability Logic 
-    itsm_knowledgebase_items - Demonstrates Knowledge Base Logic  
+    Returns (itsm_changemanagement_items, itsm_outage_items, itsm_knowledgebase_items)
+    This is where you would build the ServiceNow integration needed
     """
-    logger.info("Entering generate_upgrade_plan function with ITSM data retrieval.")
-    logger.info(f"Received devices_json: {repr(devices_json)}")
-
-    # Validate input
-    if not devices_json or devices_json.strip() == "":
-        error_msg = "Error: devices_json parameter is required and cannot be empty. Please pass the JSON output from FirmwareAudit tool."
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
-
-    # Parse the input devices JSON
-    try:
-        if isinstance(devices_json, str):
-            logger.info("Parsing devices_json string")
-            devices_data = json.loads(devices_json)
-        else:
-            logger.info("devices_json is already a dictionary")
-            devices_data = devices_json
-    except json.JSONDecodeError as e:
-        error_msg = f"Error: Failed to parse devices_json. Invalid JSON format: {e}"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
-        
-    # Validate that devices_data has the expected structure
-    if not isinstance(devices_data, dict) or "devices" not in devices_data:
-        error_msg = "Error: devices_json must contain a 'devices' key with device information"
-        logger.error(error_msg)
-        return json.dumps({"error": error_msg})
-        
     # ITSM Change Management Items - devices that have scheduled maintenance
     itsm_changemanagement_items = {
         0: {
@@ -164,19 +118,179 @@ def itsm_audit(devices_json: str) -> str:
             "kb_notes": "All Cisco Spine Switches Upgrades should be approved by Jerry Garcia."
         },
     }
-    
-    # Combine all data into a single response
+
+    return itsm_changemanagement_items, itsm_outage_items, itsm_knowledgebase_items
+
+
+# How long a computed tool data fingerprint is reused before the inventory and ITSM records are read again
+FINGERPRINT_TTL = 30.0
+_fingerprint = {"value": None, "expires": 0.0}
+_fingerprint_lock = threading.Lock()
+
+
+def _hash_tool_data(records):
+    digest = hashlib.blake2b(digest_size=12)
+    for page in iter_inventory_pages():
+        digest.update(json.dumps(page, sort_keys=True, default=str).encode())
+    digest.update(json.dumps(records, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _cached_fingerprint():
+    with _fingerprint_lock:
+        if _fingerprint["value"] is not None and _fingerprint["expires"] > time.monotonic():
+            return _fingerprint["value"]
+    return None
+
+
+def _store_fingerprint(value):
+    with _fingerprint_lock:
+        _fingerprint.update(value=value, expires=time.monotonic() + FINGERPRINT_TTL)
+    return value
+
+
+def reset_tool_data_fingerprint():
+    """Forget the computed fingerprint, e.g. after a write to ITSM."""
+    with _fingerprint_lock:
+        _fingerprint.update(value=None, expires=0.0)
+
+
+def tool_data_fingerprint():
+    """
+    Hash of the device inventory and the ITSM records, for the run cache: a new firmware version, change
+    request or incident gives a new fingerprint, and the cached runs computed from the old data stop matching.
+    Computed at most every FINGERPRINT_TTL seconds.
+    """
+    value = _cached_fingerprint()
+    if value is None:
+        records = fetch_itsm_records() if ITSM_BASE_URL else _get_itsm_records()
+        value = _store_fingerprint(_hash_tool_data(records))
+    return value
+
+
+async def atool_data_fingerprint():
+    """Async tool_data_fingerprint: the live ITSM lookup is awaited."""
+    value = _cached_fingerprint()
+    if value is None:
+        records = await afetch_itsm_records() if ITSM_BASE_URL else _get_itsm_records()
+        value = _store_fingerprint(_hash_tool_data(records))
+    return value
+
+
+def _audit_devices(devices_json, state):
+    """Returns (devices_data, error_result) for itsm_audit; error_result is None when the input is usable."""
+    state_devices = (state or {}).get("devices")
+    if state_devices:
+        logger.info(f"Using {len(state_devices)} devices from graph state")
+        devices_json = {"devices": state_devices}
+
+    # Validate input
+    if not devices_json or (isinstance(devices_json, str) and devices_json.strip() == ""):
+        error_msg = "Error: No device inventory found. Please call the IntersightTool tool first."
+        logger.error(error_msg)
+        return None, json.dumps({"error": error_msg})
+
+    # Parse the input devices JSON
+    try:
+        if isinstance(devices_json, str):
+            logger.info("Parsing devices_json string")
+            devices_data = json.loads(devices_json)
+        else:
+            logger.info("devices_json is already a dictionary")
+            devices_data = devices_json
+    except json.JSONDecodeError as e:
+        error_msg = f"Error: Failed to parse devices_json. Invalid JSON format: {e}"
+        logger.error(error_msg)
+        return None, json.dumps({"error": error_msg})
+        
+    # Validate that devices_data has the expected structure
+    if not isinstance(devices_data, dict) or "devices" not in devices_data:
+        error_msg = "Error: devices_json must contain a 'devices' key with device information"
+        logger.error(error_msg)
+        return None, json.dumps({"error": error_msg})
+    return devices_data, None
+
+
+def _audit_result(devices_data, records, state):
+    """Correlates the devices against the ITSM records and encodes the ITSMAudit result."""
+    if records is None:
+        itsm_changemanagement_items, itsm_outage_items, itsm_knowledgebase_items = _get_itsm_records()
+    else:
+        itsm_changemanagement_items = records["itsm_changemanagement_items"]
+        itsm_outage_items = records["itsm_outage_items"]
+        itsm_knowledgebase_items = records["itsm_knowledgebase_items"]
+
+    # Correlate every device against the indexed ITSM records so the model only receives a verdict per device
+    verdicts, knowledgebase = correlate_devices(
+        devices_data.get("devices", []),
+        itsm_changemanagement_items,
+        itsm_outage_items,
+        itsm_knowledgebase_items,
+    )
+
     combined_response = {
-        "devices": devices_data,
-        "itsm_changemanagement_items": itsm_changemanagement_items,
-        "itsm_outage_items": itsm_outage_items,
-        "itsm_knowledgebase_items": itsm_knowledgebase_items
+        "devices": verdicts,
+        "itsm_knowledgebase_items": knowledgebase
     }
     
-    result = json.dumps(combined_response, indent=2)
+    # Compact, columnar encoding; data already in earlier tool results is sent as a reference
+    result = encode(combined_response, (state or {}).get("messages"))
     logger.info("ITSM audit completed successfully")
     return result
 
+
+def _itsm_error(error):
+    error_msg = f"Error: ITSM lookup failed: {error}"
+    logger.error(error_msg)
+    return json.dumps({"error": error_msg})
+
+
+def itsm_audit(devices_json: str = "", state: Optional[dict] = None) -> str:
+    """ 
+    Used as a placeholder for the visual layer of Studio
+    Simulating the ITSM API return to facilitate this demo.
+    itsm_changemanagement_items - Demonstrates Change Management Logic
+    itsm_outage_items - Demonstrates Outage Observability Logic 
+    itsm_knowledgebase_items - Demonstrates Knowledge Base Logic  
+    Each device is returned with a verdict (clear / blocked-by-cr / blocked-by-outage),
+    the blocking records and the numbers of the KB articles that apply to it.
+    The device list is read from AgentState.devices; devices_json is only a fallback.
+    """
+    # Sizes only - the inventory of a whole fleet never goes into the log
+    log_event(logger, "itsm_audit", devices_json_chars=lambda: len(str(devices_json or "")),
+              state_devices=len((state or {}).get("devices") or []), live=bool(ITSM_BASE_URL))
+
+    devices_data, error = _audit_devices(devices_json, state)
+    if error:
+        return error
+
+    records = None
+    if ITSM_BASE_URL:
+        # Live ITSM - the three record types are fetched concurrently over a pooled connection
+        try:
+            records = fetch_itsm_records()
+        except ITSMError as e:
+            return _itsm_error(e)
+    return _audit_result(devices_data, records, state)
+
+
+async def aitsm_audit(devices_json: str = "", state: Optional[dict] = None) -> str:
+    """Async itsm_audit: the live ITSM lookup is awaited instead of blocking a worker thread."""
+    log_event(logger, "itsm_audit", devices_json_chars=lambda: len(str(devices_json or "")),
+              state_devices=len((state or {}).get("devices") or []), live=bool(ITSM_BASE_URL))
+
+    devices_data, error = _audit_devices(devices_json, state)
+    if error:
+        return error
+
+    records = None
+    if ITSM_BASE_URL:
+        try:
+            records = await afetch_itsm_records()
+        except ITSMError as e:
+            return _itsm_error(e)
+    return _audit_result(devices_data, records, state)
+
 def request_itsm_approval(plan: str) -> str:
     """Submit upgrade plan for ITSM approval."""
     logger.info("Submitting plan for ITSM approval...")
@@ -186,10 +300,15 @@ def request_itsm_approval(plan: str) -> str:
         logger.error(error_msg)
         return error_msg
     
-    ticket_id = f"FWUP-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-    result = f"""ITSM Approval Status: SUBMITTED
+    # Queued for a batched, asynchronous flush to ITSM; resubmitting the same plan returns the same ticket
+    submission, is_new = approval_queue.submit(plan)
+    ticket_id = submission["ticket_id"]
+    status = "SUBMITTED" if is_new else "ALREADY SUBMITTED"
+    result = f"""ITSM Approval Status: {status}
     Ticket ID: {ticket_id}
-    Submitted At: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    Idempotency Key: {submission["idempotency_key"]}
+    Submitted At: {submission["submitted_at"]}
+    Delivery: {submission["status"]} (queued plans are sent to ITSM in the background)
     Plan Summary: {plan[:200]}{'...' if len(plan) > 200 else ''}
 
     Next Steps:
@@ -198,28 +317,53 @@ def request_itsm_approval(plan: str) -> str:
     3. Business impact assessment
     4. Final approval by change board"""
     
-    logger.info(f"ITSM approval submitted successfully. Ticket: {ticket_id}")
+    if is_new and ITSM_BASE_URL:
+        # The submission becomes a change request in ITSM
+        reset_tool_data_fingerprint()
+    logger.info(f"ITSM approval {status.lower()}. Ticket: {ticket_id}")
     return result
 
+
+# No blocking I/O in these two - the inventory pages are simulated and approvals are only queued -
+# so the async versions run them on the event loop instead of in a worker thread
+async def aaudit_firmware(tool_call_id: str, page_size: int = DEFAULT_PAGE_SIZE) -> Command:
+    return audit_firmware(tool_call_id, page_size)
+
+
+async def arequest_itsm_approval(plan: str) -> str:
+    return request_itsm_approval(plan)
+
 # Tool definitions with clearer descriptions
-firmware_audit_tool = Tool.from_function(
+firmware_audit_tool = StructuredTool.from_function(
     func=audit_firmware,
+    coroutine=aaudit_firmware,
     name="IntersightTool",
-    description="Audit network devices to find those with outdated firmware. Call this first to get the device list. Returns JSON with device information including current and recommended firmware versions."
+    description="Audit network devices to find those with outdated firmware. Call this first. The device inventory is stored in the graph state and a summary of device counts and firmware versions is returned.",
+    args_schema=FirmwareAuditInput
 )
 
-itsm_audit_tool = Tool.from_function(
+itsm_audit_tool = StructuredTool.from_function(
     func=itsm_audit,
+    coroutine=aitsm_audit,
     name="ITSMAudit",
-    description="Generate upgrade plan with ITSM integration data. MUST be called with the exact JSON output from FirmwareAudit as the devices_json parameter. Returns devices along with change management, outage, and knowledge base information.",
+    description="Generate upgrade plan with ITSM integration data. Call this after IntersightTool; it reads the device inventory from the graph state. Returns each device with a verdict (clear, blocked-by-cr or blocked-by-outage), the blocking change request or incident, and the applicable knowledge base articles.",
     args_schema=ITSMAuditInput
 )
 
 itsm_approval_tool = StructuredTool.from_function(
     func=request_itsm_approval,
+    coroutine=arequest_itsm_approval,
     name="ITSMApproval",
     description="Submit the final upgrade plan for ITSM approval. Call this with the complete, structured upgrade plan that includes timing, priorities, and conflict analysis.",
     args_schema=ITSMApprovalInput
 )
 
-tools = [firmware_audit_tool, itsm_audit_tool, itsm_approval_tool]
\ No newline at end of file
+# Tool registry of the graph - the node each tool runs in and the step after it (agent_core/factory.py).
+# The ITSM audit is followed by the deterministic scheduler, not by the model; approvals pass the
+# approval_signoff gate first
+registry = ToolRegistry()
+registry.register("intersight_tool", firmware_audit_tool)
+registry.register("itsm_tool", itsm_audit_tool, then="scheduler")
+registry.register("approval_workflow", itsm_approval_tool, via="approval_signoff")
+
+tools = registry.tools
\ No newline at end of file
@@ -0,0 +1,58 @@
+import re
+from functools import lru_cache
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+NX-OS version parsing.
+Turns firmware strings into tuples that compare correctly, e.g.
+    7.0(3)I7(4) -> (7, 0, 3, 0, 7, 4)
+    9.2(1)      -> (9, 2, 1, 0, 0, 0)
+    9.3(4a)     -> (9, 3, 4, 1, 0, 0)
+    10.3(4a)M   -> (10, 3, 4, 1, 0, 0)
+    10.4.5      -> (10, 4, 5, 0, 0, 0)
+Fields are (major, minor, maintenance, maintenance letter, train, train rebuild). NX-OS 10.x
+releases end in their release type, F (feature) or M (maintenance); it does not affect ordering.
+'''
+
+# 7.0(3)I7(4), 9.2(1), 9.3(4a), 6.1(2)I3(5b), 10.2(3)F, 10.3(4a)M
+_LEGACY_RE = re.compile(r"^(\d+)\.(\d+)\((\d+)([a-z]?)\)(?:[A-Z]+(\d+)\((\d+)[a-z]?\))?[A-Z]?$", re.IGNORECASE)
+# 10.4.5 - the dotted form of the inventory API, with or without the release type
+_DOTTED_RE = re.compile(r"^(\d+)\.(\d+)\.(\d+)[A-Z]?$", re.IGNORECASE)
+# Either form, without groups or anchors, for finding versions in free text (knowledgebase.py)
+NXOS_VERSION_PATTERN = r"\d+\.\d+(?:\(\d+[a-z]?\)(?:[A-Z]+\d+\(\d+[a-z]?\))?|\.\d+)[A-Z]?"
+
+
+def _letter(value):
+    return ord(value.lower()) - ord("a") + 1 if value else 0
+
+
+@lru_cache(maxsize=4096)
+def parse_nxos_version(version):
+    '''Parse an NX-OS version string into a comparable tuple, or None when it is not recognised.'''
+    text = (version or "").strip()
+    match = _LEGACY_RE.match(text)
+    if match:
+        major, minor, maint, letter, train, rebuild = match.groups()
+        return (int(major), int(minor), int(maint), _letter(letter), int(train or 0), int(rebuild or 0))
+    match = _DOTTED_RE.match(text)
+    if match:
+        major, minor, maint = match.groups()
+        return (int(major), int(minor), int(maint), 0, 0, 0)
+    logger.warning(f"Unrecognised NX-OS version string: {version}")
+    return None
+
+
+@lru_cache(maxsize=4096)
+def is_outdated(current, recommended):
+    '''
+    True when current is behind recommended.
+    Versions that cannot be parsed are treated as outdated so they still get reviewed.
+    '''
+    current_tuple = parse_nxos_version(current)
+    recommended_tuple = parse_nxos_version(recommended)
+    if current_tuple is None or recommended_tuple is None:
+        return current != recommended
+    return current_tuple < recommended_tuple
@@ -0,0 +1,38 @@
+from langchain_core.messages import ToolMessage
+
+from agent_core.wire import encode, format_report, measure_tool_messages
+from my_agent.utils.correlation import correlate_devices
+from my_agent.utils.inventory import DeviceInventory, iter_inventory_pages, summarize_devices
+from my_agent.utils.tools import _get_itsm_records
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Bytes and estimated tokens of the simulated demo03 tool results, in the pretty and the compact
+wire format (agent_core/wire.py). For an exported thread, use python -m agent_core.wire.
+    python -m my_agent.utils.wire_report
+'''
+
+
+def simulated_tool_messages(compact):
+    '''The IntersightTool and ITSMAudit results of the simulated inventory, as ToolMessages.'''
+    devices = DeviceInventory.from_pages(iter_inventory_pages()).outdated()
+    verdicts, knowledgebase = correlate_devices(devices, *_get_itsm_records())
+    results = [
+        ("IntersightTool", summarize_devices(devices)),
+        ("ITSMAudit", {"devices": verdicts, "itsm_knowledgebase_items": knowledgebase}),
+    ]
+    messages = []
+    for number, (name, payload) in enumerate(results):
+        content = encode(payload, messages, compact=compact)
+        messages.append(ToolMessage(content=content, name=name, tool_call_id=f"call_{number}"))
+    return messages
+
+
+if __name__ == "__main__":
+    for compact in (False, True):
+        print("compact" if compact else "pretty")
+        print(format_report(measure_tool_messages(simulated_tool_messages(compact))))
+        print()
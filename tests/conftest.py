@@ -0,0 +1,58 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Nothing reaches a provider; the placeholder keys only satisfy client construction
+os.environ.setdefault("OPENAI_API_KEY", "offline-tests")
+os.environ.setdefault("TAVILY_API_KEY", "offline-tests")
+
+
+def _import(demo, name):
+    '''Imports a module the graph itself does not load (e.g. utils.itsm_server) under <demo>_agent.'''
+    from agent_core import host
+
+    prefix = f"{demo}_agent"
+    with host._lock:
+        # The demo's modules go back under my_agent while the new one is imported, as in host.load_demo
+        saved = {module: sys.modules.pop(module) for module in host._my_agent_modules()}
+        sys.modules.update({f"my_agent{module[len(prefix):]}": sys.modules[module]
+                            for module in list(sys.modules) if module.split(".")[0] == prefix})
+        sys.path.insert(0, host.DEMOS[demo])
+        try:
+            importlib.import_module(f"my_agent.{name}")
+        finally:
+            sys.path.remove(host.DEMOS[demo])
+            for module in host._my_agent_modules():
+                sys.modules[f"{prefix}{module[len('my_agent'):]}"] = sys.modules.pop(module)
+            sys.modules.update(saved)
+
+
+def _modules(demo):
+    # Both demos are packages named my_agent; agent_core.host loads each under <demo>_agent
+    from agent_core.host import load_demo
+
+    load_demo(demo)
+
+    def module(name):
+        if f"{demo}_agent.{name}" not in sys.modules:
+            _import(demo, name)
+        return sys.modules[f"{demo}_agent.{name}"]
+
+    return module
+
+
+@pytest.fixture(scope="session")
+def demo02():
+    '''demo02's modules by name, e.g. demo02("utils.tools").'''
+    return _modules("demo02")
+
+
+@pytest.fixture(scope="session")
+def demo03():
+    '''demo03's modules by name, e.g. demo03("utils.versions").'''
+    return _modules("demo03")
@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+class Backend:
+    '''send_batch stand-in: records each batch; fails the first `failures` calls.'''
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    async def __call__(self, batch):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise ConnectionError("ITSM unavailable")
+            self.batches.append([submission["ticket_id"] for submission in batch])
+
+
+@pytest.fixture
+def approvals(demo03):
+    module = demo03("utils.approval_queue")
+    queues = []
+
+    def make(backend, **options):
+        queues.append(module.ApprovalQueue(send_batch=backend, flush_interval=0.05, backoff=0.01, **options))
+        return queues[-1]
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def _burst(queue, plans):
+    barrier = threading.Barrier(len(plans))
+
+    def submit(plan):
+        barrier.wait()
+        return queue.submit(plan)
+
+    with ThreadPoolExecutor(len(plans)) as pool:
+        return list(pool.map(submit, plans))
+
+
+def test_burst_is_sent_in_batches(approvals):
+    backend = Backend()
+    queue = approvals(backend, batch_size=20)
+    submissions = _burst(queue, [f"Upgrade leaf-{i:03d}" for i in range(100)])
+    assert all(is_new for _, is_new in submissions)
+    tickets = [submission["ticket_id"] for submission, _ in submissions]
+    assert len(set(tickets)) == 100
+    assert queue.wait_until_flushed(timeout=5)
+    sent = [ticket for batch in backend.batches for ticket in batch]
+    assert sorted(sent) == sorted(tickets)
+    # Batched, not one request per plan
+    assert len(backend.batches) <= 100 // 20 + 1 and max(map(len, backend.batches)) <= 20
+    assert {queue.status(ticket) for ticket in tickets} == {"sent"}
+
+
+def test_duplicate_submissions_share_one_ticket(approvals):
+    backend = Backend()
+    queue = approvals(backend)
+    plans = ["Upgrade spine-01\nthen leaf-01", "upgrade spine-01 then  LEAF-01"] * 16
+    submissions = _burst(queue, plans)
+    assert len({submission["ticket_id"] for submission, _ in submissions}) == 1
+    assert sum(is_new for _, is_new in submissions) == 1
+    assert queue.wait_until_flushed(timeout=5)
+    assert sum(map(len, backend.batches)) == 1
+
+
+def test_failed_batch_is_retried(approvals):
+    backend = Backend(failures=2)
+    queue = approvals(backend, max_attempts=3)
+    submission, _ = queue.submit("Upgrade spine-01")
+    assert queue.wait_until_flushed(timeout=5)
+    assert backend.calls == 3 and backend.batches == [[submission["ticket_id"]]]
+    assert queue.status(submission["ticket_id"]) == "sent"
+
+
+def test_exhausted_retries_mark_the_ticket_failed(approvals, caplog):
+    backend = Backend(failures=100)
+    queue = approvals(backend, max_attempts=3)
+    submission, _ = queue.submit("Upgrade spine-01")
+    assert queue.wait_until_flushed(timeout=5)
+    assert backend.calls == 3 and backend.batches == []
+    assert submission["status"] == "failed" and queue.status(submission["ticket_id"]) == "failed"
+    assert "approval_dropped" in caplog.text and submission["ticket_id"] in caplog.text
+    # The plan is forgotten: submitting it again gets a new ticket that goes out
+    backend.failures = 0
+    again, is_new = queue.submit("Upgrade spine-01")
+    assert is_new and again["ticket_id"] != submission["ticket_id"]
+    assert queue.wait_until_flushed(timeout=5)
+    assert backend.batches == [[again["ticket_id"]]]
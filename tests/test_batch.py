@@ -0,0 +1,41 @@
+import asyncio
+import io
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from agent_core import batch
+
+
+class EchoGraph:
+    '''Answers each run with its prompt.'''
+
+    async def ainvoke(self, inputs, config):
+        await asyncio.sleep(0.01)
+        return {"messages": inputs["messages"] + [AIMessage(content=inputs["messages"][0].content.upper())]}
+
+
+def _run(items, concurrency=2):
+    output = io.StringIO()
+    summary = asyncio.run(batch.abatch(EchoGraph(), items, output, concurrency))
+    return summary, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_bad_lines_are_failed_results_and_the_rest_still_run():
+    lines = ["first", '{"bad json', "third", '{"config": {}}', '{"prompt": "fifth"}', "", "sixth"]
+    summary, results = _run(item for item in map(batch.parse_item, lines) if item is not None)
+    assert (summary["runs"], summary["ok"], summary["failed"]) == (6, 4, 2)
+    by_index = {result["index"]: result for result in results}
+    assert by_index[1]["error"].startswith("input: invalid JSON") and by_index[1]["prompt"] == '{"bad json'
+    assert "prompt" in by_index[3]["error"]
+    assert [by_index[i]["answer"] for i in (0, 2, 4, 5)] == ["FIRST", "THIRD", "FIFTH", "SIXTH"]
+
+
+def test_items_that_fail_to_read_stop_the_batch_loudly():
+    def items():
+        yield {"prompt": "first", "config": {}}
+        raise OSError("input went away")
+
+    with pytest.raises(RuntimeError, match="input went away"):
+        _run(items())
@@ -0,0 +1,123 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+from langgraph.types import Command
+
+from agent_core.checkpoint import DeltaSqliteSaver
+from agent_core.replay import ScriptedChatModel
+
+PROMPT = ("Please audit my datacenter networking environment for out of date firmware and provide a upgrade and "
+          "change management review.")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "checkpoints.sqlite3")
+
+
+def _echo_graph(saver):
+    def reply(state):
+        last = state["messages"][-1]
+        if last.content == "fix":
+            # Same id as the previous answer: add_messages replaces it
+            return {"messages": [AIMessage(content="fixed", id=state["messages"][-2].id)]}
+        return {"messages": [AIMessage(content=f"echo {last.content}")]}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("reply", reply)
+    workflow.add_edge(START, "reply")
+    workflow.add_edge("reply", END)
+    return workflow.compile(checkpointer=saver)
+
+
+def test_deltas_read_back_after_reopening(path):
+    saver = DeltaSqliteSaver(path, snapshot_every=4)
+    graph = _echo_graph(saver)
+    config = {"configurable": {"thread_id": "t"}}
+    for n in range(10):
+        graph.invoke({"messages": [HumanMessage(content=str(n))]}, config)
+    graph.invoke({"messages": [HumanMessage(content="fix")]}, config)
+    expected = [m.content for m in graph.get_state(config).values["messages"]]
+    assert len(expected) == 21 and expected[-2:] == ["fixed", "fix"]
+    kinds = dict(saver._db.execute("SELECT kind, COUNT(*) FROM blobs WHERE channel = 'messages' GROUP BY kind"))
+    assert kinds["delta"] > kinds["full"] > 1
+    saver.close()
+
+    reopened = DeltaSqliteSaver(path)
+    assert [m.content for m in _echo_graph(reopened).get_state(config).values["messages"]] == expected
+    reopened.delete_thread("t")
+    assert reopened.get_tuple(config) is None
+
+
+def test_failed_writes_leave_no_open_transaction(path):
+    saver = DeltaSqliteSaver(path)
+    graph = _echo_graph(saver)
+    config = {"configurable": {"thread_id": "t"}}
+    graph.invoke({"messages": [HumanMessage(content="hi")]}, config)
+    checkpoint = saver.get_tuple(config).config
+    # A task id sqlite cannot bind fails inside the transaction
+    with pytest.raises(Exception):
+        saver.put_writes(checkpoint, [("messages", "x")], task_id={"not": "bindable"})
+    with pytest.raises(Exception):
+        saver.delete_thread({"not": "bindable"})
+    assert not saver._db.in_transaction
+    saver.put_writes(checkpoint, [("messages", "x")], task_id="task-1")
+    graph.invoke({"messages": [HumanMessage(content="again")]}, config)
+    assert len(graph.get_state(config).values["messages"]) == 4
+
+
+@pytest.fixture
+def signoff_graph(demo03, monkeypatch, path):
+    '''build_graph(saver) for demo03 on a scripted operator; returns (build, config, model calls, tool calls).'''
+    nodes = demo03("utils.nodes")
+    calls, tools = [], []
+
+    def respond(messages):
+        calls.append(len(messages))
+        turn = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        last_tool = next((m for m in reversed(messages[turn:]) if isinstance(m, ToolMessage)), None)
+        steps = {None: ("IntersightTool", {}), "IntersightTool": ("ITSMAudit", {}),
+                 "ITSMAudit": ("ITSMApproval", {"plan": "# Firmware Upgrade Plan"})}
+        name = last_tool.name if last_tool else None
+        if name == "ITSMApproval" and "REJECTED" in last_tool.content:
+            name = "ITSMAudit"
+        if name not in steps:
+            return "The firmware upgrade plan was submitted for ITSM approval."
+        tool, args = steps[name]
+        tools.append(tool)
+        return AIMessage(content="", tool_calls=[{"name": tool, "args": args, "id": f"call_{tool}_{len(calls)}"}])
+
+    model = ScriptedChatModel(respond=respond)
+    monkeypatch.setattr(nodes, "_get_model", lambda provider: model)
+    config = {"configurable": {"thread_id": "signoff", "model_name": "openai", "run_cache": False,
+                               "approval_signoff": True}}
+    return (lambda: demo03("agent").build_graph(checkpointer=DeltaSqliteSaver(path))), config, calls, tools
+
+
+def test_sign_off_resumes_from_a_reopened_file_without_replaying(signoff_graph):
+    build, config, calls, tools = signoff_graph
+    paused = build().invoke({"messages": [HumanMessage(content=PROMPT)]}, config, durability="sync")
+    assert paused["__interrupt__"][0].value["action"] == "ITSMApproval"
+    model_calls, tool_calls = len(calls), len(tools)
+
+    # A new saver and graph on the same file, as after a restart
+    result = build().invoke(Command(resume={"approved": True}), config, durability="sync")
+    assert result["approval_status"] == "signed off"
+    # Only the closing answer: no audit tool and no earlier model call ran again
+    assert len(calls) == model_calls + 1 and len(tools) == tool_calls
+    assert "SUBMITTED" in next(m.content for m in result["messages"] if isinstance(m, ToolMessage)
+                               and m.name == "ITSMApproval")
+
+
+def test_rejected_sign_off_goes_back_to_the_model(signoff_graph):
+    build, config, calls, tools = signoff_graph
+    graph = build()
+    graph.invoke({"messages": [HumanMessage(content=PROMPT)]}, config, durability="sync")
+    model_calls = len(calls)
+    paused = graph.invoke(Command(resume={"approved": False, "comment": "no spines on Friday"}), config,
+                          durability="sync")
+    # The model saw the rejection, revised the plan and was stopped at the gate again
+    assert len(calls) == model_calls + 1 and tools[-1] == "ITSMApproval"
+    assert "__interrupt__" in paused
+    rejection = [m for m in paused["messages"] if isinstance(m, ToolMessage) and m.name == "ITSMApproval"]
+    assert len(rejection) == 1 and "no spines on Friday" in rejection[0].content
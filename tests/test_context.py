@@ -0,0 +1,68 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent_core import context
+
+
+def _turn(question, tool_call_id, rows=40):
+    result = json.dumps([{"url": f"https://example.com/{tool_call_id}/{i}", "text": "lorem ipsum " * 10}
+                         for i in range(rows)])
+    return [
+        HumanMessage(content=question),
+        AIMessage(content="", tool_calls=[{"name": "WeatherSearch", "args": {"query": question}, "id": tool_call_id}]),
+        ToolMessage(content=result, name="WeatherSearch", tool_call_id=tool_call_id),
+        AIMessage(content=f"Answer to {question}"),
+    ]
+
+
+def test_single_turn_within_budget_is_sent_unchanged():
+    messages = _turn("Paris", "call_1")
+    prompt, note, usage = context.build_context(messages, budget=100_000)
+    assert prompt == messages and note == ""
+    assert usage["digested"] == 0 and usage["saved_tokens"] == 0
+
+
+def test_results_of_completed_turns_are_digested_within_budget():
+    messages = _turn("Paris", "call_1") + _turn("Rome", "call_2") + _turn("Oslo", "call_3")
+    prompt, note, usage = context.build_context(messages[:-1], budget=context.TOKEN_BUDGETS["openai"])
+    assert usage["digested"] == 2 and note == ""
+    assert all(prompt[i].content.startswith("[Digest of an earlier WeatherSearch result") for i in (2, 6))
+    # The current turn's result is still sent in full
+    assert prompt[10].content == messages[10].content
+    # Each completed turn adds a digest, not its full results, to every later prompt
+    assert usage["saved_tokens"] > context.message_tokens(messages[2])
+
+
+def test_over_budget_digests_answered_results_of_the_current_turn():
+    messages = _turn("Paris", "call_1") + _turn("Oslo", "call_2")[1:] + [AIMessage(content="", tool_calls=[
+        {"name": "WeatherSearch", "args": {"query": "Bergen"}, "id": "call_3"}])]
+    full = sum(context.message_tokens(m) for m in messages)
+    one_result = context.message_tokens(messages[2])
+    prompt, note, usage = context.build_context(messages, budget=full - one_result // 2)
+    assert usage["digested"] == 1 and usage["trimmed_turns"] == 0 and note == ""
+    assert prompt[2].content.startswith("[Digest of an earlier WeatherSearch result")
+    assert prompt[5].content == messages[5].content
+    assert usage["prompt_tokens"] <= usage["budget"]
+
+
+def test_results_a_later_result_points_at_are_kept():
+    messages = _turn("Paris", "call_1") + [
+        HumanMessage(content="And the flights?"),
+        AIMessage(content="", tool_calls=[{"name": "FlightSearch", "args": {}, "id": "call_2"}]),
+        ToolMessage(content='{"$ref": "WeatherSearch:call_1/0"}', name="FlightSearch", tool_call_id="call_2"),
+    ]
+    prompt, _, usage = context.build_context(messages, budget=100_000)
+    assert prompt[2].content == messages[2].content and usage["digested"] == 0
+
+
+def test_token_budget_per_provider():
+    assert context.token_budget({"model_name": "openai"}) > context.token_budget({"model_name": "anthropic"})
+    assert context.token_budget({"model_name": "openai"}, "local") == context.TOKEN_BUDGETS["local"]
+    assert context.token_budget({"context_token_budget": 5000}, "anthropic") == 5000
+
+
+def test_count_cache_keys_on_a_digest():
+    text = "cache key " * 1000
+    assert context._count(text) == context._count(text)
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in context._counts)
@@ -0,0 +1,13 @@
+def test_kb_articles_without_a_number_are_not_listed(demo03):
+    correlation = demo03("utils.correlation")
+    device = {"hostname": "leaf-01", "role": "leaf", "model": "N9K-C93180YC-EX", "version": "10.3(4a)M"}
+    kb_items = [
+        {"kb_number": "KB0002", "kb_device_type": "Cisco 9300 Series Leaf Switches",
+         "kb_notes": "This issue is solved in version 10.4(3)F and higher"},
+        {"kb_number": None, "kb_device_type": "Cisco 9300 Series Leaf Switches", "kb_notes": "Reboot first."},
+        {"kb_number": "KB0001", "kb_device_type": "Cisco 9300 Series Switches", "kb_notes": "Affects 10.3(4a)M and earlier."},
+    ]
+    verdicts, knowledgebase = correlation.correlate_devices([device], [], [], kb_items)
+    assert verdicts[0]["verdict"] == correlation.VERDICT_CLEAR
+    assert None in verdicts[0]["kb_numbers"]
+    assert list(knowledgebase) == ["KB0001", "KB0002"]
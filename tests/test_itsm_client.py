@@ -0,0 +1,149 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def itsm(demo03):
+    return demo03("utils.itsm_client")
+
+
+@pytest.fixture
+def tables(demo03, itsm):
+    # As itsm_server._tables, which imports from my_agent when it runs
+    records = dict(zip(["itsm_changemanagement_items", "itsm_outage_items", "itsm_knowledgebase_items"],
+                       demo03("utils.tools")._get_itsm_records()))
+    return {itsm.TABLES[name]: list(items.values()) for name, items in records.items()}
+
+
+def _fetch_all(client):
+    async def main():
+        try:
+            return await client.fetch_all()
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_fetch_all_pages_through_every_table(demo03, itsm, tables):
+    with demo03("utils.itsm_server").running_server(tables) as base_url:
+        records = _fetch_all(itsm.ITSMClient(base_url, page_size=2))
+    assert {name: records[name] for name in itsm.TABLES} == {name: tables[table] for name, table in itsm.TABLES.items()}
+
+
+class CountingServer:
+    '''The stand-in server on a background thread, counting connections, GETs and GETs in flight at once.'''
+
+    def __init__(self, server_module, tables, latency):
+        self.connections, self.requests, self.in_flight, self.peak = [], 0, 0, 0
+        lock = threading.Lock()
+        counter = self
+        handler = server_module.make_handler(tables, latency=latency)
+
+        class CountingHandler(handler):
+            def do_GET(self):
+                with lock:
+                    counter.requests += 1
+                    counter.in_flight += 1
+                    counter.peak = max(counter.peak, counter.in_flight)
+                try:
+                    super().do_GET()
+                finally:
+                    with lock:
+                        counter.in_flight -= 1
+
+        class Server(server_module.ITSMServer):
+            def process_request(self, request, client_address):
+                counter.connections.append(client_address)
+                super().process_request(request, client_address)
+
+        self.server = Server(("127.0.0.1", 0), CountingHandler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_tables_are_fetched_concurrently_over_pooled_connections(demo03, itsm, tables):
+    with CountingServer(demo03("utils.itsm_server"), tables, latency=0.05) as server:
+        records = _fetch_all(itsm.ITSMClient(server.base_url, page_size=1, max_connections=3))
+    pages = sum(len(items) + 1 for items in records.values())
+    assert server.requests == pages
+    # The three tables are paged side by side, over at most 3 keep-alive connections
+    assert 2 <= server.peak <= 3
+    assert len(server.connections) <= 3 < pages
+
+
+def _mock_client(itsm, responses, **options):
+    '''ITSMClient whose requests get the scripted responses in order; returns (client, requests seen).'''
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    client = itsm.ITSMClient("http://itsm.test", backoff=0.01, **options)
+    client._client = httpx.AsyncClient(base_url="http://itsm.test", transport=httpx.MockTransport(handler))
+    return client, seen
+
+
+def _request(client):
+    async def main():
+        try:
+            return await client._request("GET", "/api/now/table/incident")
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_transient_failures_are_retried(itsm):
+    client, seen = _mock_client(itsm, [
+        httpx.Response(503),
+        httpx.ReadTimeout("timed out"),
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json={"result": []}),
+    ])
+    assert _request(client) == {"result": []}
+    assert len(seen) == 4
+
+
+def test_retries_give_up_after_max_retries(itsm):
+    client, seen = _mock_client(itsm, [httpx.Response(503)] * 3, max_retries=2)
+    with pytest.raises(itsm.ITSMError, match="503"):
+        _request(client)
+    assert len(seen) == 3
+
+
+def test_client_errors_are_not_retried(itsm):
+    client, seen = _mock_client(itsm, [httpx.Response(404), httpx.Response(200, json={})])
+    with pytest.raises(itsm.ITSMError, match="404"):
+        _request(client)
+    assert len(seen) == 1
+
+
+def test_each_request_has_its_own_timeout(demo03, itsm, tables):
+    with CountingServer(demo03("utils.itsm_server"), tables, latency=0.5) as server:
+        client = itsm.ITSMClient(server.base_url, timeout=0.1, max_retries=1, backoff=0.01)
+        # The server would answer after 0.5s; each attempt gives up after 0.1s instead
+        with pytest.raises(itsm.ITSMError, match="failed"):
+            _request(client)
+    assert server.requests == 2
+
+
+def test_non_json_success_is_an_itsm_error(itsm):
+    client, seen = _mock_client(itsm, [httpx.Response(200, text="<html>Bad gateway</html>")])
+    with pytest.raises(itsm.ITSMError, match="non-JSON 200"):
+        _request(client)
+    assert len(seen) == 1
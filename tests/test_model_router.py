@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent_core.model_router import (CircuitOpenError, ModelCallError, ModelRouter, ProviderHealth,
+                                     is_rate_limited)
+
+
+class FlakyModel(FakeListChatModel):
+    latency: float = 0.0
+    fail: bool = False
+    calls: int = 0
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("provider down")
+        return super()._call(*args, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=self.responses[0]))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("provider down")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.responses[0]))])
+
+
+@pytest.fixture
+def models():
+    return {name: FlakyModel(responses=[name], latency=0.01) for name in ("openai", "anthropic", "local")}
+
+
+def _router(**options):
+    return ModelRouter(order=["openai", "anthropic", "local"], hedge_min_samples=5, reset_timeout=0.3, **options)
+
+
+def _call(router, models, **options):
+    return router.invoke("openai", models.get, lambda provider: "hello", **options).content
+
+
+def _warm_up(router, models, calls=10):
+    assert [_call(router, models) for _ in range(calls)] == ["openai"] * calls
+
+
+def test_failover_and_circuit_breaker(models):
+    router = _router()
+    models["openai"].fail = True
+    assert [_call(router, models) for _ in range(3)] == ["anthropic"] * 3
+    assert router.health("openai").state == ProviderHealth.OPEN
+    # An open breaker is skipped without a call
+    calls = models["openai"].calls
+    assert _call(router, models) == "anthropic" and models["openai"].calls == calls
+    # After reset_timeout one trial call goes through and closes the breaker again
+    models["openai"].fail = False
+    time.sleep(0.35)
+    assert _call(router, models) == "openai"
+    assert router.health("openai").state == ProviderHealth.CLOSED
+
+
+def test_every_provider_failing_keeps_each_error(models):
+    router = _router()
+    for model in models.values():
+        model.fail = True
+    with pytest.raises(ModelCallError) as raised:
+        _call(router, models)
+    assert list(raised.value.errors) == ["openai", "anthropic", "local"]
+    assert not is_rate_limited(raised.value)
+
+
+def test_rate_limit_stays_visible_behind_a_failover():
+    class RateLimited(Exception):
+        status_code = 429
+
+    def factory(provider):
+        if provider == "openai":
+            raise RateLimited("429 Too Many Requests")
+        raise ValueError("LOCAL_LLM_BASE_URL is not set")
+
+    with pytest.raises(ModelCallError) as raised:
+        ModelRouter(order=["openai", "local"]).invoke("openai", factory, lambda provider: "hello")
+    assert is_rate_limited(raised.value) and isinstance(raised.value.__cause__, ValueError)
+
+
+def test_no_provider_available(models):
+    router = _router(failure_threshold=1)
+    for model in models.values():
+        model.fail = True
+    with pytest.raises(ModelCallError):
+        _call(router, models)
+    with pytest.raises(CircuitOpenError):
+        _call(router, models)
+
+
+def test_hedge_waits_for_the_primary_on_the_callers_thread(models, monkeypatch):
+    router = _router()
+    _warm_up(router, models)
+    threads = []
+    models["openai"].latency = 0.2
+    original = FlakyModel._call
+
+    def record_thread(self, *args, **kwargs):
+        threads.append((self.responses[0], threading.current_thread().name))
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(FlakyModel, "_call", record_thread)
+    assert _call(router, models, hedge=True) == "openai"
+    # The primary ran here, only the hedged request on the router's pool
+    assert threads[0] == ("openai", threading.current_thread().name)
+    assert threads[1][0] == "anthropic" and threads[1][1].startswith("model-hedge")
+
+
+def test_hedge_answers_when_the_slow_primary_fails(models):
+    router = _router()
+    _warm_up(router, models)
+    models["openai"].latency, models["openai"].fail = 0.3, True
+    models["anthropic"].latency = 0.2
+    started = time.perf_counter()
+    assert _call(router, models, hedge=True) == "anthropic"
+    # A failover call after the primary failed would take 0.3 + 0.2 s
+    assert time.perf_counter() - started < 0.45
+    assert models["anthropic"].calls == 1
+
+
+def test_no_hedge_before_enough_samples_or_for_streamed_calls(models):
+    router = _router()
+    models["openai"].latency = 0.05
+    assert _call(router, models, hedge=True) == "openai"
+    assert models["anthropic"].calls == 0
+    _warm_up(router, models)
+    models["openai"].latency = 0.2
+    assert _call(router, models, hedge=True, stream=True) == "openai"
+    assert models["anthropic"].calls == 0
+
+
+def test_async_hedge_takes_the_first_answer(models):
+    router = _router()
+
+    async def main():
+        for _ in range(10):
+            await router.ainvoke("openai", models.get, lambda provider: "hello")
+        models["openai"].latency = 0.5
+        started = time.perf_counter()
+        response = await router.ainvoke("openai", models.get, lambda provider: "hello", hedge=True)
+        return response.content, time.perf_counter() - started
+
+    content, seconds = asyncio.run(main())
+    assert content == "anthropic" and seconds < 0.3
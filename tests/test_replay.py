@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+from agent_core import replay
+
+
+def _plan(messages):
+    return AIMessage(content="Three searches first.", tool_calls=[
+        {"name": "WeatherSearch", "args": {"__arg1": "Paris in August, with a long enough query"}, "id": "call_1"},
+        {"name": "FlightSearch", "args": {"__arg1": "SJC to CDG"}, "id": "call_2"},
+    ])
+
+
+def test_streamed_answer_adds_up_to_the_invoked_one():
+    model = replay.ScriptedChatModel(respond=_plan)
+    invoked = model.invoke("plan a trip")
+    chunks = list(model.stream("plan a trip"))
+    streamed = chunks[0]
+    for chunk in chunks[1:]:
+        streamed += chunk
+    assert len(chunks) > 3
+    assert streamed.content == invoked.content
+    assert [(c["name"], c["args"], c["id"]) for c in streamed.tool_calls] == \
+        [(c["name"], c["args"], c["id"]) for c in invoked.tool_calls]
+
+
+def test_latency_applies_to_both_paths():
+    model = replay.ScriptedChatModel(respond=lambda messages: "one two three", latency=0.05, token_latency=0.02)
+    for call in (lambda: model.invoke("hi"), lambda: list(model.stream("hi")),
+                 lambda: asyncio.run(model.ainvoke("hi"))):
+        started = time.perf_counter()
+        call()
+        assert 0.11 <= time.perf_counter() - started < 0.3
+
+
+def test_replay_answers_the_nth_model_call_with_the_nth_recorded_message(tmp_path):
+    recorded = [HumanMessage(content="Plan a trip"), _plan([]), AIMessage(content="Here is your plan")]
+    path = tmp_path / "thread_messages.json"
+    path.write_text(json.dumps([message_to_dict(m)["data"] | {"type": m.type} for m in recorded]))
+    respond = replay.replay(str(path))
+    assert respond([HumanMessage(content="x")]).tool_calls[0]["name"] == "WeatherSearch"
+    assert respond([HumanMessage(content="x"), AIMessage(content="")]).content == "Here is your plan"
+    # Past the recording, the last message is repeated
+    assert respond([AIMessage(content="")] * 5).content == "Here is your plan"
+
+
+@pytest.fixture
+def offline_demo02(demo02, monkeypatch):
+    benchmark = demo02("utils.benchmark")
+    nodes, tools = demo02("utils.nodes"), demo02("utils.tools")
+    model = replay.ScriptedChatModel(respond=benchmark.scripted_planner("sequential"), latency=0.01)
+    search = benchmark.FakeSearch(latency=0.01)
+    monkeypatch.setattr(nodes, "_get_model", lambda provider: model)
+    monkeypatch.setattr(tools, "_tavily_search", search)
+    monkeypatch.setattr(tools, "search_cache", demo02("utils.search_cache").SearchCache(":memory:"))
+    config = {"configurable": {"model_name": "openai", "intent_extraction": False, "run_cache": False}}
+    return demo02("agent").graph, config, search
+
+
+def _inputs(n):
+    return {"messages": [HumanMessage(content=f"Plan a trip to City {n} for 5 days in August")]}
+
+
+def test_benchmark_drives_the_graph_end_to_end(offline_demo02):
+    graph, config, search = offline_demo02
+    results = replay.run_benchmark(graph, _inputs, config, concurrency_levels=(1, 4), runs=4, warmup=0)
+    assert [(r["mode"], r["concurrency"], r["runs"]) for r in results] == [("sync", 1, 4), ("sync", 4, 4)]
+    for result in results:
+        # Three searches, one at a time: four model calls, three tool results and the answer
+        assert result["nodes"]["tool:WeatherSearch"]["calls"] == 1
+        assert result["nodes"]["model"]["calls"] == 4
+        assert result["messages"] == 8 and result["steps"] >= 7
+        assert result["throughput"] > 0 and result["history_tokens"] > 0 and result["prompt_tokens"] > 0
+    assert search.calls == 3 * 4
+    assert "concurrency" in replay.format_report(results)
+
+
+def test_async_benchmark_matches_the_sync_one(offline_demo02):
+    graph, config, _ = offline_demo02
+    sync = replay.run_benchmark(graph, _inputs, config, concurrency_levels=(4,), runs=4, warmup=0)[0]
+    async_ = replay.arun_benchmark(graph, _inputs, config, concurrency_levels=(4,), runs=4, warmup=0)[0]
+    assert async_["mode"] == "async"
+    for key in ("steps", "messages", "history_bytes", "prompt_tokens"):
+        assert async_[key] == sync[key], key
+    assert set(async_["nodes"]) == set(sync["nodes"])
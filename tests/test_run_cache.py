@@ -0,0 +1,76 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent_core.replay import ScriptedChatModel
+from agent_core.run_cache import RunCache
+
+PROMPT = ("Please audit my datacenter networking environment for out of date firmware and provide a upgrade and "
+          "change management review.")
+NEAR_DUPLICATE = PROMPT.replace("Please audit", "Audit")
+
+
+@pytest.fixture
+def demo03_graph(demo03, monkeypatch):
+    '''demo03's graph on a scripted operator and the simulated ITSM records; returns (graph, config, model calls).'''
+    nodes = demo03("utils.nodes")
+    calls = []
+
+    def respond(messages):
+        calls.append(len(messages))
+        turn = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        last_tool = next((m.name for m in reversed(messages[turn:]) if isinstance(m, ToolMessage)), None)
+        steps = {None: ("IntersightTool", {}), "IntersightTool": ("ITSMAudit", {}),
+                 "ITSMAudit": ("ITSMApproval", {"plan": f"# Firmware Upgrade Plan\n{messages[turn].content}"})}
+        if last_tool not in steps:
+            return "The firmware upgrade plan was submitted for ITSM approval."
+        name, args = steps[last_tool]
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{name}_{len(calls)}"}])
+
+    model = ScriptedChatModel(respond=respond)
+    monkeypatch.setattr(nodes, "_get_model", lambda provider: model)
+    monkeypatch.setattr(nodes, "run_cache", RunCache(enabled=True))
+    config = {"configurable": {"model_name": "openai", "run_cache": True}}
+    return demo03("agent").graph, config, calls
+
+
+def _approvals(state):
+    return [m for m in state["messages"] if isinstance(m, ToolMessage) and m.name == "ITSMApproval"]
+
+
+def _approval_calls(state):
+    return [call["id"] for m in state["messages"] if isinstance(m, AIMessage)
+            for call in m.tool_calls if call["name"] == "ITSMApproval"]
+
+
+@pytest.mark.parametrize("prompt", [PROMPT, NEAR_DUPLICATE])
+def test_cache_hit_submits_its_own_approval(demo03_graph, demo03, prompt):
+    graph, config, calls = demo03_graph
+    first = graph.invoke({"messages": [HumanMessage(content=PROMPT)]}, config)
+    assert len(calls) == 4 and len(_approvals(first)) == 1
+
+    second = graph.invoke({"messages": [HumanMessage(content=prompt)]}, config)
+    hits = demo03("utils.nodes").run_cache.stats
+    assert hits["hits"] + hits["near_hits"] == 1
+    # Audit and plan are replayed; only the closing answer needs the model
+    assert len(calls) == 5
+    assert second["schedule"] == first["schedule"] and second.get("devices") == first.get("devices")
+    # The approval went to the approval tool again, under a tool call of this run
+    [approval] = _approvals(second)
+    assert approval.tool_call_id == _approval_calls(second)[0] != _approval_calls(first)[0]
+    assert approval.id != _approvals(first)[0].id
+
+
+def test_plan_rejected_at_sign_off_is_not_cached(demo03):
+    nodes = demo03("utils.nodes")
+    call = {"name": "ITSMApproval", "args": {"plan": "v1"}, "id": "call_1"}
+    messages = [
+        HumanMessage(content=PROMPT),
+        AIMessage(content="", tool_calls=[call]),
+        ToolMessage(content="REJECTED at sign-off", name="ITSMApproval", tool_call_id="call_1"),
+        AIMessage(content="", tool_calls=[{**call, "args": {"plan": "v2"}, "id": "call_2"}]),
+        ToolMessage(content="Ticket CHG0001", name="ITSMApproval", tool_call_id="call_2"),
+        AIMessage(content="Submitted."),
+    ]
+    assert nodes._cacheable_messages(messages) is None
+    # A run without a rejection is cached up to its approval call
+    assert nodes._cacheable_messages(messages[:1] + messages[3:]) == messages[3:4]
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from agent_core.wire import encode
+
+DEVICES = [
+    {"hostname": "spine-01", "role": "spine", "pod": "a", "verdict": "clear", "change_requests": [
+        {"cr_number": "CHG0001", "cr_start": "2026-10-20 00:00", "cr_end": "2026-10-20 03:00"}]},
+    {"hostname": "leaf-01", "role": "leaf", "pod": "a", "verdict": "clear"},
+    {"hostname": "leaf-02", "role": "leaf", "pod": "a", "verdict": "blocked"},
+]
+
+
+def _windows(schedule):
+    return [(slot["hostname"], slot["start"], slot["end"]) for slot in schedule["schedule"]]
+
+
+def test_windows_go_around_busy_change_requests(demo03):
+    schedule = demo03("utils.scheduler").schedule_upgrades(DEVICES, start="2026-10-20 00:00")
+    assert _windows(schedule) == [("spine-01", "2026-10-20 03:00", "2026-10-20 05:00"),
+                                  ("leaf-01", "2026-10-20 05:00", "2026-10-20 06:00")]
+    assert schedule["not_scheduled"] == [{"hostname": "leaf-02", "role": "leaf", "verdict": "blocked"}]
+
+
+def test_an_aware_start_is_compared_in_utc(demo03):
+    scheduler = demo03("utils.scheduler")
+    naive = scheduler.schedule_upgrades(DEVICES, start="2026-10-20 00:00")
+    assert scheduler.schedule_upgrades(DEVICES, start="2026-10-20T02:00+02:00") == naive
+    assert scheduler.schedule_upgrades(DEVICES, start=datetime(2026, 10, 20, tzinfo=timezone.utc)) == naive
+
+
+def _state():
+    call = {"name": "ITSMAudit", "args": {}, "id": "call_1"}
+    return {"messages": [AIMessage(content="", tool_calls=[call]),
+                         ToolMessage(content=encode({"devices": DEVICES}), name="ITSMAudit", tool_call_id="call_1",
+                                     id="audit")]}
+
+
+def test_null_lanes_use_the_default(demo03):
+    nodes = demo03("utils.nodes")
+    result = nodes.schedule_maintenance(_state(), {"configurable": {"maintenance_start": "2026-10-20 00:00",
+                                                                     "maintenance_lanes": None}})
+    assert [slot["hostname"] for slot in result["schedule"]["schedule"]] == ["spine-01", "leaf-01"]
+
+
+def test_a_bad_start_skips_the_schedule(demo03, caplog):
+    nodes = demo03("utils.nodes")
+    assert nodes.schedule_maintenance(_state(), {"configurable": {"maintenance_start": "next tuesday"}}) == {}
+    assert "schedule_skipped" in caplog.text and "invalid maintenance times" in caplog.text
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ShardGraph:
+    '''Stand-in shard subgraph that records how many shards of each run plan at once.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.peak = Counter()
+        self.total_peak = 0
+
+    def _enter(self, run):
+        with self.lock:
+            self.running[run] += 1
+            self.peak[run] = max(self.peak[run], self.running[run])
+            self.total_peak = max(self.total_peak, sum(self.running.values()))
+
+    def _exit(self, run):
+        with self.lock:
+            self.running[run] -= 1
+
+    def invoke(self, shard, config):
+        self._enter(shard["run"])
+        time.sleep(0.05)
+        self._exit(shard["run"])
+        return {"plan": shard["shard_key"]}
+
+    async def ainvoke(self, shard, config):
+        self._enter(shard["run"])
+        await asyncio.sleep(0.05)
+        self._exit(shard["run"])
+        return {"plan": shard["shard_key"]}
+
+
+def _shards(runs, per_run):
+    for run in range(runs):
+        # All Sends of one fan-out share the checkpoint_map of their step
+        config = {"configurable": {"shard_concurrency": 2, "checkpoint_map": {"": f"checkpoint-{run}"}}}
+        for index in range(per_run):
+            yield {"run": run, "shard_key": f"{run}-{index}", "role": "leaf", "pod": str(index)}, config
+
+
+def test_shard_concurrency_is_per_run(demo03):
+    shard_graph = ShardGraph()
+    planner = demo03("utils.nodes").make_shard_planner(shard_graph)
+    with ThreadPoolExecutor(12) as pool:
+        results = list(pool.map(lambda args: planner.invoke(*args), _shards(3, 4)))
+    assert len(results) == 12
+    assert max(shard_graph.peak.values()) == 2
+    # Another run's shards never wait for this run's limit
+    assert shard_graph.total_peak > 2
+
+
+def test_async_shard_concurrency_is_per_run(demo03):
+    shard_graph = ShardGraph()
+    planner = demo03("utils.nodes").make_shard_planner(shard_graph)
+
+    async def plan_all():
+        return await asyncio.gather(*(planner.ainvoke(shard, config) for shard, config in _shards(3, 4)))
+
+    results = asyncio.run(plan_all())
+    assert [result["shard_plans"][0]["plan"] for result in results] == [f"{run}-{i}" for run in range(3) for i in range(4)]
+    assert max(shard_graph.peak.values()) == 2
+    assert shard_graph.total_peak > 2
+
+
+def test_null_shard_concurrency_uses_the_default(demo03):
+    planner = demo03("utils.nodes").make_shard_planner(ShardGraph())
+    shard = {"run": 0, "shard_key": "0-0", "role": "leaf", "pod": "0"}
+    result = planner.invoke(shard, {"configurable": {"shard_concurrency": None}})
+    assert result["shard_plans"][0]["plan"] == "0-0"
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+CALLERS = 32
+
+
+class Backend:
+    '''Counts calls; each call takes long enough for every caller to arrive while it is in flight.'''
+
+    def __init__(self, result=("Paris in August",), error=None):
+        self.calls = 0
+        self.result = list(result)
+        self.error = error
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def invoke(self, query=None):
+        time.sleep(0.2)
+        return self._call()
+
+    async def ainvoke(self, query=None):
+        await asyncio.sleep(0.2)
+        return self._call()
+
+
+def _threads(fn, callers=CALLERS):
+    barrier = threading.Barrier(callers)
+
+    def caller(index):
+        barrier.wait()
+        return fn(index)
+
+    with ThreadPoolExecutor(callers) as pool:
+        return list(pool.map(caller, range(callers)))
+
+
+def test_threads_share_one_call(demo02):
+    flight, backend = demo02("utils.singleflight").SingleFlight(), Backend()
+    results = _threads(lambda _: flight.do("weather:paris", backend.invoke))
+    assert backend.calls == 1
+    assert results == [backend.result] * CALLERS
+    assert flight.stats == {"leaders": 1, "shared": CALLERS - 1}
+
+
+def test_tasks_share_one_call(demo02):
+    flight, backend = demo02("utils.singleflight").SingleFlight(), Backend()
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("weather:paris", backend.ainvoke) for _ in range(CALLERS)))
+
+    assert asyncio.run(main()) == [backend.result] * CALLERS
+    assert backend.calls == 1
+
+
+def test_tasks_join_a_call_led_by_a_thread(demo02):
+    flight, backend = demo02("utils.singleflight").SingleFlight(), Backend()
+    leader_started = threading.Event()
+
+    def lead():
+        leader_started.set()
+        return flight.do("weather:paris", backend.invoke)
+
+    async def follow():
+        return await asyncio.gather(*(flight.ado("weather:paris", backend.ainvoke) for _ in range(CALLERS)))
+
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(lead)
+        leader_started.wait()
+        time.sleep(0.05)
+        followers = asyncio.run(follow())
+    assert leader.result() == backend.result and followers == [backend.result] * CALLERS
+    assert backend.calls == 1
+
+
+def test_error_is_shared_and_not_kept(demo02):
+    flight = demo02("utils.singleflight").SingleFlight()
+    failing = Backend(error=ConnectionError("tavily down"))
+
+    def call(_):
+        try:
+            return flight.do("weather:paris", failing.invoke)
+        except ConnectionError as e:
+            return e
+
+    results = _threads(call)
+    assert failing.calls == 1 and all(isinstance(r, ConnectionError) for r in results)
+    # The failed call is not remembered: the next caller runs again
+    backend = Backend()
+    assert flight.do("weather:paris", backend.invoke) == backend.result and backend.calls == 1
+
+
+@pytest.fixture
+def search_tools(demo02, tmp_path, monkeypatch):
+    tools = demo02("utils.tools")
+    backend = Backend(result=[{"url": "https://example.com/paris", "content": "Sunny"}])
+    monkeypatch.setattr(tools, "search_cache", demo02("utils.search_cache").SearchCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(tools, "single_flight", demo02("utils.singleflight").SingleFlight())
+    monkeypatch.setattr(tools, "_tavily_search", backend)
+    return tools, backend
+
+
+def test_identical_searches_make_one_tavily_request(search_tools):
+    tools, backend = search_tools
+    # Differently written, same normalized query
+    queries = ["Paris, August", "paris august", "PARIS  August!"]
+    results = _threads(lambda index: tools.search_weather(queries[index % 3]))
+    assert backend.calls == 1 and len(set(results)) == 1
+
+    async def main():
+        return await asyncio.gather(*(tools.asearch_weather("paris august") for _ in range(CALLERS)))
+
+    # Cached by now: no further request from the async path either
+    assert set(asyncio.run(main())) == set(results) and backend.calls == 1
+
+
+def test_error_results_are_not_cached(search_tools):
+    tools, backend = search_tools
+    backend.result = "HTTPError('429 Client Error')"
+    assert tools._cached_search("weather", "Paris") == backend.result
+    assert tools._cached_search("weather", "Paris") == backend.result
+    assert backend.calls == 2
+
+
+def test_followers_take_over_from_a_cancelled_leader(demo02):
+    flight, backend = demo02("utils.singleflight").SingleFlight(), Backend()
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("weather:paris", backend.ainvoke))
+        await asyncio.sleep(0.05)
+        followers = [asyncio.create_task(flight.ado("weather:paris", backend.ainvoke)) for _ in range(CALLERS)]
+        await asyncio.sleep(0.05)
+        # The leader's client disconnects while the search is in flight
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader, results
+
+    leader, results = asyncio.run(main())
+    assert leader.cancelled()
+    assert results == [backend.result] * CALLERS
+    # The leader's call never finished; one follower ran the search again for all the others
+    assert backend.calls == 1 and flight.stats["leaders"] == 2
+
+
+def test_a_cancelled_follower_does_not_cancel_the_call(demo02):
+    flight, backend = demo02("utils.singleflight").SingleFlight(), Backend()
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("weather:paris", backend.ainvoke))
+        await asyncio.sleep(0.05)
+        followers = [asyncio.create_task(flight.ado("weather:paris", backend.ainvoke)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        followers[0].cancel()
+        return await leader, await asyncio.gather(*followers[1:]), followers[0]
+
+    result, results, cancelled = asyncio.run(main())
+    assert cancelled.cancelled()
+    assert result == backend.result and results == [backend.result] * 2 and backend.calls == 1
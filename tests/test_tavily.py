@@ -0,0 +1,42 @@
+import asyncio
+import sys
+
+import httpx
+import pytest
+
+RESULT = {"title": "Paris in August", "url": "https://example.com/paris", "content": "Sunny, 25C", "score": 0.9}
+
+
+@pytest.fixture
+def tavily_api(demo02, tmp_path, monkeypatch):
+    '''demo02's search tools as the host loads them, with Tavily answered locally; returns (tools, requests seen).'''
+    tools, tavily = demo02("utils.tools"), demo02("utils.tavily")
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json={"results": [RESULT]})
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(tavily, "_clients", (httpx.Client(transport=transport), httpx.AsyncClient(transport=transport)))
+    monkeypatch.setattr(tools, "_tavily_search", None)
+    monkeypatch.setattr(tools, "search_cache", demo02("utils.search_cache").SearchCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(tools, "single_flight", demo02("utils.singleflight").SingleFlight())
+    return tools, seen
+
+
+def test_search_missing_the_cache_reaches_tavily_under_the_host(demo02, tavily_api):
+    tools, seen = tavily_api
+    # Loaded under demo02_agent: nothing named my_agent is left to import from
+    assert "my_agent" not in sys.modules
+    assert RESULT["url"] in tools.search_weather("Paris in August")
+    assert len(seen) == 1 and seen[0].url.path == "/search"
+    # The second search is answered from the cache
+    tools.search_weather("paris in august!")
+    assert len(seen) == 1
+
+
+def test_async_search_missing_the_cache_reaches_tavily_under_the_host(tavily_api):
+    tools, seen = tavily_api
+    assert RESULT["url"] in asyncio.run(tools.asearch_weather("Paris in August"))
+    assert len(seen) == 1
@@ -0,0 +1,57 @@
+import pytest
+
+
+@pytest.mark.parametrize("version, parsed", [
+    ("7.0(3)I7(4)", (7, 0, 3, 0, 7, 4)),
+    ("6.1(2)I3(5b)", (6, 1, 2, 0, 3, 5)),
+    ("9.2(1)", (9, 2, 1, 0, 0, 0)),
+    ("9.3(4a)", (9, 3, 4, 1, 0, 0)),
+    ("9.3(10)", (9, 3, 10, 0, 0, 0)),
+    # NX-OS 10.x release strings as they ship, with the release type
+    ("10.2(3)F", (10, 2, 3, 0, 0, 0)),
+    ("10.3(4a)M", (10, 3, 4, 1, 0, 0)),
+    ("10.4(3)F", (10, 4, 3, 0, 0, 0)),
+    ("10.5(1)F", (10, 5, 1, 0, 0, 0)),
+    ("10.4.5", (10, 4, 5, 0, 0, 0)),
+])
+def test_parse_nxos_version(demo03, version, parsed):
+    assert demo03("utils.versions").parse_nxos_version(version) == parsed
+
+
+@pytest.mark.parametrize("current, recommended, outdated", [
+    ("10.5(1)F", "10.4.5", False),
+    ("10.3(4a)M", "10.4.5", True),
+    ("10.2(3)F", "10.2(3)F", False),
+    ("10.3(4a)M", "10.3(4)M", False),
+    ("10.3(4)M", "10.3(4a)M", True),
+    ("9.3(10)", "9.3(9)", False),
+    ("7.0(3)I7(4)", "10.2(3)F", True),
+])
+def test_is_outdated(demo03, current, recommended, outdated):
+    assert demo03("utils.versions").is_outdated(current, recommended) is outdated
+
+
+def test_unparsable_version_is_reviewed(demo03):
+    versions = demo03("utils.versions")
+    assert versions.parse_nxos_version("unknown") is None
+    assert versions.is_outdated("unknown", "10.4.5") is True
+
+
+@pytest.mark.parametrize("notes, affected, unaffected", [
+    ("Affects 10.3(4a)M and earlier.", "10.3(4a)M", "10.4(3)F"),
+    ("This issue is solved in version 10.4(3)F and higher", "10.3(4a)M", "10.4(3)F"),
+    ("Seen between 10.2(3)F and 10.3(4a)M", "10.3(4)M", "10.4.5"),
+    ("This issue is solved in version 7.0(3)I7(4) and higher", "7.0(3)I4(7)", "9.3(4a)"),
+    ("Fixed in 10.4.5M", "10.4(3)F", "10.5(1)F"),
+])
+def test_kb_version_range_reads_release_type_suffixes(demo03, notes, affected, unaffected):
+    knowledgebase, versions = demo03("utils.knowledgebase"), demo03("utils.versions")
+    low, low_inclusive, high, high_inclusive = knowledgebase.kb_version_range({"kb_notes": notes})
+    # A recognised statement, not the every-version fallback
+    assert (low, high) != (knowledgebase.LOWEST, knowledgebase.HIGHEST)
+
+    def contains(version):
+        v = versions.parse_nxos_version(version)
+        return (low < v or (low_inclusive and low == v)) and (v < high or (high_inclusive and v == high))
+
+    assert contains(affected) and not contains(unaffected)
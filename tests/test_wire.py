@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from langchain_core.messages import ToolMessage
+
+from agent_core import wire
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RECORDS = [
+    {"hostname": "leaf-01", "version": "10.3(4a)M", "maintenance_window": None},
+    {"hostname": "leaf-02", "version": "10.5(1)F"},
+    {"hostname": "spine-01", "maintenance_window": "Sat 02:00", "tags": {"pod": "a", "rack": None}},
+]
+
+
+@pytest.mark.parametrize("value", [
+    RECORDS,
+    {"devices": RECORDS, "count": 3, "note": None},
+    [{"a": None}, {"a": None}],
+    [{"a": 1}, {"b": 2}],
+    [{"rows": [{"x": None}, {"y": 1}]}, {"rows": []}],
+])
+def test_columnar_round_trip_keeps_explicit_nulls(value):
+    assert wire.from_columnar(wire.to_columnar(value)) == value
+
+
+def test_only_missing_fields_are_listed_as_absent():
+    table = wire.to_columnar(RECORDS)
+    assert table["$columns"] == ["hostname", "version", "maintenance_window", "tags"]
+    assert table["$rows"][0] == ["leaf-01", "10.3(4a)M", None, None]
+    # leaf-01 has an explicit null window but no tags; leaf-02 neither; spine-01 has no version
+    assert table["$absent"] == {"0": [3], "1": [2, 3], "2": [1]}
+    assert "$absent" not in wire.to_columnar([{"a": None}, {"a": 1}])
+
+
+def test_encode_decode_with_references():
+    earlier = ToolMessage(content=wire.encode({"devices": RECORDS}), name="ITSMAudit", tool_call_id="call_1")
+    payload = {"devices": RECORDS, "schedule": [{"hostname": "leaf-01", "window": None}]}
+    content = wire.encode(payload, [earlier])
+    assert "$ref" in content
+    assert wire.resolve_references(wire.decode(content), [earlier]) == payload
+
+
+def test_report_without_a_file_prints_usage():
+    result = subprocess.run([sys.executable, "-m", "agent_core.wire"], capture_output=True, text=True,
+                            cwd=ROOT)
+    assert result.returncode == 2 and "usage: python -m agent_core.wire" in result.stderr
+
+
+def test_report_on_an_exported_thread(tmp_path):
+    thread = tmp_path / "thread_messages.json"
+    thread.write_text(json.dumps([
+        {"type": "human", "content": "Audit my datacenter"},
+        {"type": "tool", "name": "ITSMAudit", "tool_call_id": "call_1", "content": wire.encode(RECORDS)},
+    ]))
+    result = subprocess.run([sys.executable, "-m", "agent_core.wire", str(thread)], capture_output=True, text=True,
+                            cwd=ROOT)
+    assert result.returncode == 0 and "ITSMAudit" in result.stdout